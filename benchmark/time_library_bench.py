@@ -0,0 +1,209 @@
+"""
+time_library 性能基准
+覆盖公开的转换函数、区间与周期函数、批量接口，按真实规模的输入计算每秒操作数(ops/sec)
+和单批运行的内存峰值，可以保存为JSON基准，并与已有基准比较，超过阈值的退化会被标出
+
+用法：
+    python benchmark/time_library_bench.py --save benchmark/baseline.json
+    python benchmark/time_library_bench.py --compare benchmark/baseline.json --threshold 0.2
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import platform
+import tracemalloc
+from timeit import Timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from candy import time_library as tl
+
+# 每个用例单批处理的输入数量
+BATCH = 2000
+DEFAULT_TZ = "Asia/Shanghai"
+DEFAULT_THRESHOLD = 0.2
+
+
+def _inputs(seed=2018):
+    """
+    生成基准输入：集中在近几年的时间戳及其字符串形式
+    """
+    rnd = random.Random(seed)
+    start = tl.str2int("2015-01-01")
+    stamps = [start + rnd.randint(0, 5 * 365 * tl.DAY_STEP) for _ in range(BATCH)]
+    return {
+        "stamps": stamps,
+        "strs": [tl.int2str(v) for v in stamps],
+        "days": [tl.int2day(v) for v in stamps],
+        "isos": [tl.int2iso(v) for v in stamps],
+        "datetimes": [datetime.datetime.fromtimestamp(v) for v in stamps],
+        "pairs": [(v, v + rnd.randint(0, 90) * tl.DAY_STEP) for v in stamps[:200]],
+        "values": [rnd.randint(0, 1000) for _ in stamps],
+    }
+
+
+def _cases(data):
+    """
+    :return: [(用例名, 单批执行的函数, 单批的操作数)]
+    """
+    stamps, strs, days, isos = data["stamps"], data["strs"], data["days"], data["isos"]
+    datetimes, pairs, values = data["datetimes"], data["pairs"], data["values"]
+    n = len(stamps)
+    cases = [
+        ("str2int", lambda: [tl.str2int(s) for s in strs], n),
+        ("str2int:day", lambda: [tl.str2int(s) for s in days], n),
+        ("int2str", lambda: [tl.int2str(v) for v in stamps], n),
+        ("int2day", lambda: [tl.int2day(v) for v in stamps], n),
+        ("int2dayint", lambda: [tl.int2dayint(v) for v in stamps], n),
+        ("int2iso", lambda: [tl.int2iso(v) for v in stamps], n),
+        ("str2iso", lambda: [tl.str2iso(s) for s in strs], n),
+        ("iso2str", lambda: [tl.iso2str(s) for s in isos], n),
+        ("iso2day", lambda: [tl.iso2day(s) for s in isos], n),
+        ("iso2hour", lambda: [tl.iso2hour(s) for s in isos], n),
+        ("iso2timestamp", lambda: [tl.iso2timestamp(s) for s in isos], n),
+        ("parse_iso", lambda: [tl.parse_iso(s) for s in isos], n),
+        ("datetime2timestamp", lambda: [tl.datetime2timestamp(d, convert_to_utc=True) for d in datetimes], n),
+        ("utc_datetime2timestamp", lambda: [tl.utc_datetime2timestamp(s) for s in strs], n),
+        ("time_format_string", lambda: [tl.time_format_string(s) for s in strs], n),
+        ("add_time", lambda: [tl.add_time(s, days=1, hours=2) for s in strs], n),
+        ("add_day", lambda: [tl.add_day(s, 3) for s in days], n),
+        ("calc_date_difference", lambda: [tl.calc_date_difference(a, b) for a, b in pairs], len(pairs)),
+        ("decompose", lambda: [tl.decompose(v) for v in stamps], n),
+        ("get_year_month_day", lambda: [tl.get_year_month_day(v) for v in stamps], n),
+        ("get_week", lambda: [tl.get_week(v) for v in stamps], n),
+        ("get_season_by_int", lambda: [tl.get_season_by_int(v) for v in stamps], n),
+        ("get_start_timestamp", lambda: [tl.get_start_timestamp(v) for v in stamps], n),
+        ("same_period_month", lambda: [tl.same_period_month(v) for v in stamps], n),
+        ("shift_months", lambda: [tl.shift_months(v, 5) for v in stamps], n),
+    ]
+    for name, time_type in (("hour", tl.HOUR), ("day", tl.DAY), ("week", tl.WEEK), ("month", tl.MONTH),
+                            ("season", tl.SEASON), ("year", tl.YEAR)):
+        cases.append(("get_start_end_timestamp:%s" % name,
+                      lambda time_type=time_type: [tl.get_start_end_timestamp(v, time_type) for v in stamps], n))
+    cases += [
+        ("get_month_list", lambda: [tl.get_month_list(a, b + 400 * tl.DAY_STEP) for a, b in pairs], len(pairs)),
+        ("get_week_period", lambda: [tl.get_week_period(a, b) for a, b in pairs], len(pairs)),
+        ("get_month_period", lambda: [tl.get_month_period(a, b) for a, b in pairs], len(pairs)),
+        ("get_week_month_period", lambda: [tl.get_week_month_period(a, b) for a, b in pairs], len(pairs)),
+        ("get_week_list", lambda: [tl.get_week_list(a, b) for a, b in pairs], len(pairs)),
+        ("get_yearlist", lambda: [tl.get_yearlist(a, b + 3 * 365 * tl.DAY_STEP) for a, b in pairs], len(pairs)),
+        ("timestamp_by_step", lambda: [tl.timestamp_by_step(a, b) for a, b in pairs], len(pairs)),
+        ("timestamp_by_step:str", lambda: [tl.timestamp_by_step(a, b, returnType=1) for a, b in pairs], len(pairs)),
+        ("take_time_list", lambda: [tl.take_time_list(a, b, tl.HOUR_STEP) for a, b in pairs], len(pairs)),
+        ("get_time_gen", lambda: [list(tl.get_time_gen(a, b)) for a, b in pairs], len(pairs)),
+        ("TimeRange:len", lambda: [len(tl.TimeRange(a, b, 1, "hour")) for a, b in pairs], len(pairs)),
+        ("druid_time:day", lambda: [tl.druid_time(days[i], days[i + 1]) for i in range(0, 400, 2)
+                                    if days[i] < days[i + 1]], 200),
+        ("druid_time:hour", lambda: [tl.druid_time(days[i], days[i + 1], "hour", "one") for i in range(0, 400, 2)
+                                     if days[i] < days[i + 1]], 200),
+    ]
+    calendar = tl.BusinessCalendar(["2018-01-01", "2019-01-01", "2020-01-01"])
+    cases += [
+        ("BusinessCalendar.business_days_between",
+         lambda: [calendar.business_days_between(a, b) for a, b in pairs], len(pairs)),
+        ("BusinessCalendar.add_business_days", lambda: [calendar.add_business_days(v, 10) for v in stamps], n),
+    ]
+    if tl.np is not None:
+        arr = tl.np.array(stamps, dtype=tl.np.int64)
+        str_arr, iso_arr = tl.np.array(strs), tl.np.array(isos)
+        index = tl.get_week_period(stamps[0] - 30 * tl.DAY_STEP, stamps[0] + 2000 * tl.DAY_STEP, index=True)
+        cases += [
+            ("str2int_many", lambda: tl.str2int_many(str_arr), n),
+            ("int2str_many", lambda: tl.int2str_many(arr), n),
+            ("int2day_many", lambda: tl.int2day_many(arr), n),
+            ("int2dayint_many", lambda: tl.int2dayint_many(arr), n),
+            ("int2iso_many", lambda: tl.int2iso_many(arr), n),
+            ("iso2timestamp_many", lambda: tl.iso2timestamp_many(iso_arr), n),
+            ("bucket_aggregate:day", lambda: tl.bucket_aggregate(arr, tl.DAY, values), n),
+            ("PeriodIndex.locate_many", lambda: index.locate_many(arr), n),
+            ("BusinessCalendar.add_business_days_many", lambda: calendar.add_business_days_many(arr, 10), n),
+        ]
+    return cases
+
+
+def measure(func, ops, min_time=0.2, repeat=3):
+    """
+    测量一个用例
+    :return: {"ops_per_sec": 每秒操作数(取多次中最好的), "peak_bytes": 单批运行的内存峰值}
+    """
+    timer = Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"ops_per_sec": round(ops / best, 1), "peak_bytes": peak}
+
+
+def run(names=None, min_time=0.2):
+    """
+    运行所有(或名字包含names中任一项的)用例
+    :return: {用例名: 结果}
+    """
+    results = {}
+    for name, func, ops in _cases(_inputs()):
+        if names and not any(part in name for part in names):
+            continue
+        func()  # 预热，构建日历表、时区表等缓存
+        results[name] = measure(func, ops, min_time)
+        print("%-45s %14.1f ops/s %12d B" % (name, results[name]["ops_per_sec"], results[name]["peak_bytes"]))
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    与基准比较，每秒操作数下降或内存峰值增加超过threshold(比例)的记为退化
+    :return: [(用例名, 指标, 基准值, 当前值, 变化比例)]
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            continue
+        speed = current["ops_per_sec"] / base["ops_per_sec"] - 1 if base["ops_per_sec"] else 0
+        if speed < -threshold:
+            regressions.append((name, "ops_per_sec", base["ops_per_sec"], current["ops_per_sec"], speed))
+        memory = current["peak_bytes"] / base["peak_bytes"] - 1 if base["peak_bytes"] else 0
+        if memory > threshold:
+            regressions.append((name, "peak_bytes", base["peak_bytes"], current["peak_bytes"], memory))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="time_library 性能基准")
+    parser.add_argument("--save", help="把结果保存为JSON基准")
+    parser.add_argument("--compare", help="与JSON基准比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="退化阈值(比例)，默认0.2")
+    parser.add_argument("--filter", action="append", help="只运行名字包含该字符串的用例，可多次指定")
+    parser.add_argument("--tz", default=DEFAULT_TZ, help="运行时的进程时区，默认Asia/Shanghai")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每次计时的最短秒数")
+    args = parser.parse_args(argv)
+    os.environ["TZ"] = args.tz
+    time.tzset()
+    results = run(args.filter, args.min_time)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "tz": args.tz,
+                       "created": tl.int2str(), "results": results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, base, current, change in regressions:
+            print("REGRESSION %-45s %-12s %14s -> %-14s %+.1f%%" % (name, metric, base, current, change * 100))
+        if regressions:
+            return 1
+        print("no regressions beyond %.0f%%" % (args.threshold * 100))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
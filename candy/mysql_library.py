@@ -3,7 +3,18 @@
 # __author__ = "Miller"
 # Date: 2019/01/5
 
+import re
+import sys
+import time
+import asyncio
+import weakref
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+
 import pymysql
+import pymysql.cursors
+from pymysql.constants import SERVER_STATUS
 from conf import settings
 from lib.error_library import CustomBaseError, ErrorInfo
 from lib.log_library import mysql_log_
@@ -20,6 +31,658 @@ class InputParamsError(CustomBaseError):
             return repr("Input params error.")
 
 
+class PoolTimeoutError(CustomBaseError):
+    """
+    连接池在超时时间内没有可用的连接
+    """
+    def __str__(self):
+        if self.message:
+            return repr(self.message)
+        else:
+            return repr("Connection pool checkout timeout.")
+
+
+class PoolClosedError(CustomBaseError):
+    """
+    连接池已关闭
+    """
+    def __str__(self):
+        if self.message:
+            return repr(self.message)
+        else:
+            return repr("Connection pool is closed.")
+
+
+class BatchQueryError(CustomBaseError):
+    """
+    批量执行时部分语句失败
+    results: 与输入顺序一致的结果list，失败的位置为None
+    errors: {失败语句的下标: 异常}
+    """
+    def __init__(self, msg="", results=None, errors=None):
+        super(BatchQueryError, self).__init__(msg)
+        self.results = results or []
+        self.errors = errors or {}
+
+    def __str__(self):
+        if self.message:
+            return repr(self.message)
+        else:
+            return repr("%s of %s queries failed." % (len(self.errors), len(self.results)))
+
+
+class ConnectionPool(object):
+    """
+    线程安全的pymysql连接池
+    取出连接时检查存活和最大存活时间，空闲过久的连接被回收，保留至少min_size个连接
+    """
+    def __init__(self, min_size=1, max_size=10, idle_timeout=300, max_lifetime=3600, ping_interval=1,
+                 timeout=None, creator=None, **db_config):
+        """
+        :param min_size: 最少保留的连接数
+        :param max_size: 最多的连接数
+        :param idle_timeout: 空闲超过该秒数的连接被关闭，None表示不回收
+        :param max_lifetime: 连接创建超过该秒数后不再使用，关闭重建，None表示不限制
+        :param ping_interval: 取出空闲超过该秒数的连接时先ping检查存活，0表示每次都检查
+        :param timeout: 连接数已满时等待的秒数，None表示一直等待
+        :param creator: 创建连接的函数，默认为pymysql.connect(**db_config)
+        :param db_config: 数据库连接参数
+        """
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise InputParamsError("Pool size error: min_size=%s max_size=%s" % (min_size, max_size))
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self._creator = creator or (lambda: pymysql.connect(**db_config))
+        self._cond = threading.Condition()
+        self._idle = deque()        # (连接, 放回的时间)，右端为最近放回的
+        self._created = {}          # 连接 -> 创建时间，包括使用中的连接
+        self._in_use = set()        # 已取出还未放回的连接
+        self._opening = 0           # 正在创建中的连接数
+        self._closed = False
+
+    @property
+    def size(self):
+        """
+        当前打开的连接数
+        """
+        return len(self._created) + self._opening
+
+    @property
+    def idle(self):
+        """
+        空闲的连接数
+        """
+        return len(self._idle)
+
+    def _expired(self, conn, now):
+        return self.max_lifetime is not None and now - self._created[conn] >= self.max_lifetime
+
+    def _evict(self, now):
+        """
+        关闭空闲过久的连接，需要持有锁
+        :return: 需要关闭的连接
+        """
+        evicted = []
+        while self._idle and self.size > self.min_size:
+            conn, released = self._idle[0]
+            if self.idle_timeout is None or now - released < self.idle_timeout:
+                break
+            self._idle.popleft()
+            del self._created[conn]
+            evicted.append(conn)
+        return evicted
+
+    @staticmethod
+    def _close(conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _alive(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None):
+        """
+        取出一个连接
+        :param timeout: 等待的秒数，默认使用连接池的timeout
+        :return: 数据库连接
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolClosedError()
+                    now = time.monotonic()
+                    evicted = self._evict(now)
+                    if self._idle or self.size < self.max_size:
+                        break
+                    if deadline is not None and now >= deadline:
+                        raise PoolTimeoutError("No connection available in %ss" % timeout)
+                    self._cond.wait(None if deadline is None else deadline - now)
+                if self._idle:
+                    conn, released = self._idle.pop()
+                    self._in_use.add(conn)
+                else:
+                    conn = None
+                    self._opening += 1
+            self._close(evicted)
+            if conn is None:
+                return self._open()
+            if self._expired(conn, now) or now - released >= self.ping_interval and not self._alive(conn):
+                self._discard(conn)
+                continue
+            return conn
+
+    def _open(self):
+        """
+        新建连接，已经占用了_opening计数
+        """
+        try:
+            conn = self._creator()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._opening -= 1
+            self._created[conn] = time.monotonic()
+            self._in_use.add(conn)
+        return conn
+
+    def _discard(self, conn):
+        with self._cond:
+            self._created.pop(conn, None)
+            self._in_use.discard(conn)
+            self._cond.notify()
+        self._close([conn])
+
+    def release(self, conn, discard=False):
+        """
+        放回连接
+        :param conn: acquire得到的连接
+        :param discard: True时关闭该连接，不再复用
+        """
+        with self._cond:
+            # 不是从连接池取出的或已经放回的连接不处理，避免同一连接重复进入空闲队列
+            if conn not in self._in_use:
+                return
+            self._in_use.remove(conn)
+            now = time.monotonic()
+            if not (discard or self._closed or self._expired(conn, now)):
+                self._idle.append((conn, now))
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        with pool.connection() as conn: 使用结束后自动放回，出现异常时回滚
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                self.release(conn, discard=True)
+                raise
+            self.release(conn)
+            raise
+        self.release(conn)
+
+    def close(self):
+        """
+        关闭连接池和所有空闲连接，使用中的连接放回时关闭
+        """
+        with self._cond:
+            self._closed = True
+            conns = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            for conn in conns:
+                del self._created[conn]
+            self._cond.notify_all()
+        self._close(conns)
+
+
+# 批量插入时单条语句比max_allowed_packet预留的字节数
+PACKET_MARGIN = 1024
+
+
+def quote_identifier(name):
+    """
+    表名、列名加反引号，支持 库名.表名
+    """
+    return ".".join("`%s`" % part.replace("`", "``") for part in name.split("."))
+
+
+def insert_many_sql(table, columns, update=None):
+    """
+    生成批量插入语句，值使用%s占位由驱动绑定参数，驱动会把多行合并到一条 VALUES 语句中
+    :param table: 表名
+    :param columns: 列名list
+    :param update: 主键或唯一键冲突时更新的列名list，True表示更新所有列，None为普通插入
+    :return: sql
+    """
+    if not columns:
+        raise InputParamsError("Input params error, columns is empty")
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        quote_identifier(table), ",".join(quote_identifier(c) for c in columns), ",".join(["%s"] * len(columns)))
+    if update:
+        names = columns if update is True else update
+        sql += " ON DUPLICATE KEY UPDATE " + ",".join(
+            "%s=VALUES(%s)" % (quote_identifier(c), quote_identifier(c)) for c in names)
+    return sql
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_config, **pool_config):
+    """
+    获取数据库配置对应的连接池，相同配置共享一个连接池
+    :param db_config: 数据库连接参数
+    :param pool_config: ConnectionPool的参数，只在第一次创建时使用
+    :return: ConnectionPool
+    """
+    key = tuple(sorted((k, repr(v)) for k, v in db_config.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = _pools[key] = ConnectionPool(**dict(pool_config, **db_config))
+        return pool
+
+
+_SQL_TOKEN = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|\s+")
+_SQL_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_SQL_WORD = re.compile(r"(?:`[^`]*`|[\w$]+)(?:\.(?:`[^`]*`|[\w$]+))*|[(),;]")
+# 后面跟表名list的关键字
+_READ_STARTS = {"FROM", "JOIN", "STRAIGHT_JOIN"}
+_WRITE_STARTS = _READ_STARTS | {"UPDATE", "INTO", "TABLE"}
+# 表名前可以出现的修饰词
+_TABLE_MODIFIERS = {"LOW_PRIORITY", "HIGH_PRIORITY", "DELAYED", "IGNORE", "QUICK"}
+# 结束表名list的关键字
+_CLAUSE_ENDS = {"WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "UNION", "EXCEPT", "INTERSECT", "WINDOW", "FOR",
+                "LOCK", "INTO", "PROCEDURE", "SET", "VALUES", "VALUE", "SELECT", "DUPLICATE", "RETURNING"}
+# 不能作为表名的关键字
+_SQL_KEYWORDS = _WRITE_STARTS | _CLAUSE_ENDS | {
+    "INNER", "LEFT", "RIGHT", "CROSS", "NATURAL", "OUTER", "FULL", "ON", "USING", "AS", "USE", "FORCE",
+    "PARTITION", "LATERAL", "IF", "EXISTS", "WITH", "ALL", "DISTINCT"}
+_LOCKING_READ = re.compile(r"\bFOR\s+(?:UPDATE|SHARE)\b|\bLOCK\s+IN\s+SHARE\s+MODE\b", re.I)
+
+
+def normalize_sql(sql):
+    """
+    合并引号外的连续空白，去掉首尾空白和末尾的分号，用作缓存的键
+    """
+    sql = _SQL_TOKEN.sub(lambda m: " " if m.group().isspace() else m.group(), sql)
+    return sql.strip().rstrip(";").rstrip()
+
+
+def is_locking_read(sql):
+    """
+    是否为加锁的查询(FOR UPDATE、FOR SHARE、LOCK IN SHARE MODE)，这类查询必须在数据库上执行
+    """
+    return bool(_LOCKING_READ.search(_SQL_LITERAL.sub("''", sql)))
+
+
+def _table_name(identifier):
+    # 只取表名部分，库名不同的同名表一起失效
+    return identifier.split(".")[-1].strip("`").lower()
+
+
+def _parse_tables(sql, starts):
+    """
+    按词扫描语句，收集starts关键字后面表名list中的表名，包括逗号连接、JOIN ... ON 之后逗号连接的表和子查询中的表
+    :return: 表名set，出现表函数、LATERAL等不能完整识别的写法时返回None
+    """
+    words = _SQL_WORD.findall(_SQL_LITERAL.sub("''", sql))
+    tables = set()
+    # 每层括号的状态：None不在表名list中，"table"等待表名，"clause"在表名list中(别名、ON条件、索引提示等)
+    states = [None]
+    derived = []        # 每层括号是否为FROM中的派生表
+    start = None
+    for i, word in enumerate(words):
+        upper = word.upper()
+        state = states[-1]
+        if word == "(":
+            derived.append(state == "table")
+            # FROM 后的括号是子查询，或者是 (a JOIN b) 形式的表名list
+            nested = state == "table" and i + 1 < len(words) and words[i + 1].upper() not in ("SELECT", "WITH")
+            states.append("table" if nested else None)
+        elif word == ")":
+            if derived:
+                states.pop()
+                if derived.pop():
+                    states[-1] = "clause"
+        elif state == "table":
+            if upper in _TABLE_MODIFIERS:
+                continue
+            if word in (",", ";") or upper in _SQL_KEYWORDS:
+                return None
+            # INTO/TABLE 后面的括号是列名，FROM/JOIN 后面的是表函数
+            if start in _READ_STARTS and i + 1 < len(words) and words[i + 1] == "(":
+                return None
+            tables.add(_table_name(word))
+            states[-1] = "clause"
+        elif upper in starts:
+            states[-1] = "table"
+            start = upper
+        elif state == "clause":
+            if word == ",":
+                states[-1] = "table"
+            elif word == ";" or upper in _CLAUSE_ENDS:
+                states[-1] = None
+    if "table" in states:
+        return None
+    return tables
+
+
+def read_tables(sql):
+    """
+    查询语句 FROM/JOIN 中的表名set，不能完整识别时返回None
+    """
+    return _parse_tables(sql, _READ_STARTS)
+
+
+def write_tables(sql):
+    """
+    写语句涉及的表名set，包括 INSERT INTO/UPDATE/DELETE FROM/JOIN 的表，不能完整识别时返回空set
+    """
+    return _parse_tables(sql, _WRITE_STARTS) or set()
+
+
+def statement_tables(*sqls):
+    """
+    多条写语句涉及的表名set，有不能识别表名的语句时返回None
+    """
+    tables = set()
+    for sql in sqls:
+        written = write_tables(sql)
+        if not written:
+            return None
+        tables |= written
+    return tables
+
+
+def _result_size(result, depth=2):
+    """
+    估算查询结果占用的字节数，只计算到行中的值
+    """
+    size = sys.getsizeof(result)
+    if depth:
+        if isinstance(result, dict):
+            size += sum(_result_size(v, depth - 1) for v in result.values())
+        elif isinstance(result, (list, tuple)):
+            size += sum(_result_size(v, depth - 1) for v in result)
+    return size
+
+
+class QueryCache(object):
+    """
+    查询结果缓存，键为规范化后的sql(参数已拼接)，按LRU、过期时间和总字节数淘汰
+    写语句执行后，读过相关表的缓存失效；识别不出表名的写语句清空全部缓存，识别不出表名的查询和加锁的查询不缓存
+    只有其他进程写入时缓存可能在ttl内读到旧数据；返回的结果是共享的，不要修改
+    """
+    def __init__(self, maxsize=1024, ttl=60, max_bytes=64 * 1024 * 1024):
+        """
+        :param maxsize: 最多缓存的查询数
+        :param ttl: 缓存的秒数，None表示不过期
+        :param max_bytes: 缓存结果的估算总字节数上限，超过上限的单个结果不缓存
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0          # LRU和字节数上限淘汰的次数
+        self.expirations = 0
+        self.invalidations = 0      # 因写入失效的缓存数
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (结果, 过期时间, 字节数, 表名set)
+        self._tables = {}               # 表名 -> 缓存的key set
+        self._version = 0               # 每次失效加1
+
+    @staticmethod
+    def key(sql, **kwargs):
+        return (normalize_sql(sql),) + tuple(sorted(kwargs.items()))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        """
+        删除缓存，需要持有锁
+        """
+        _, _, size, tables = self._entries.pop(key)
+        self.bytes -= size
+        for table in tables:
+            keys = self._tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tables[table]
+
+    def get(self, key):
+        """
+        :return: (是否命中, 结果)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] is None or entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[0]
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    @property
+    def version(self):
+        """
+        查询开始前取得，put时版本不同说明查询期间有写入，结果不缓存
+        """
+        return self._version
+
+    def put(self, key, result, version=None):
+        tables = read_tables(key[0])
+        if not tables or is_locking_read(key[0]):
+            return
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and (len(self._entries) >= self.maxsize or self.bytes + size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = (result, expires, size, tables)
+            self.bytes += size
+            for table in tables:
+                self._tables.setdefault(table, set()).add(key)
+
+    def invalidate(self, tables=None):
+        """
+        删除读过这些表的缓存
+        :param tables: 表名list，None或空表示清空全部
+        """
+        with self._lock:
+            self._version += 1
+            if not tables:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._tables.clear()
+                self.bytes = 0
+                return
+            for table in tables:
+                for key in list(self._tables.get(_table_name(table), ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def invalidate_sql(self, *sqls):
+        """
+        按写语句涉及的表使缓存失效，有不能识别表名的语句时清空全部
+        """
+        self.invalidate(statement_tables(*sqls))
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        """
+        :return: dict
+        """
+        return {
+            "size": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+_caches = {}
+
+
+def get_cache(db_config, **cache_config):
+    """
+    获取数据库配置对应的查询缓存，相同配置共享一个缓存，写入后所有实例的缓存一起失效
+    :param cache_config: QueryCache的参数，只在第一次创建时使用
+    :return: QueryCache
+    """
+    key = tuple(sorted((k, repr(v)) for k, v in db_config.items()))
+    with _pools_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = QueryCache(**cache_config)
+        return cache
+
+
+class ReplicaRouter(object):
+    """
+    读写分离路由：写语句和事务使用主库，查询分到进行中请求最少的从库(数量相同时轮询)；
+    会话写入后sticky秒内，该会话的查询也使用主库，保证读到自己的写入
+    主库和从库可以是任意连接池对象(ConnectionPool、PoolMonitor等)，路由只负责选择
+    """
+    def __init__(self, primary, replicas=(), sticky=0, max_sessions=10000):
+        """
+        :param primary: 主库连接池
+        :param replicas: 从库连接池list，为空时全部使用主库
+        :param sticky: 写入后会话的查询使用主库的秒数，0表示不保证读到自己的写入
+        :param max_sessions: 最多记录的会话数，超过时淘汰最早写入的会话
+        """
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.sticky = sticky
+        self.max_sessions = max_sessions
+        self.outstanding = [0] * len(self.replicas)     # 每个从库进行中的请求数
+        self._next = 0
+        self._lock = threading.Lock()
+        self._writes = OrderedDict()    # 会话 -> 最近写入的时间
+
+    def wrote(self, session):
+        """
+        记录会话的写入
+        :param session: 逻辑会话标识(可哈希)，None表示没有会话
+        """
+        if session is None or not self.sticky or not self.replicas:
+            return
+        with self._lock:
+            self._writes[session] = time.monotonic()
+            self._writes.move_to_end(session)
+            while len(self._writes) > self.max_sessions:
+                self._writes.popitem(last=False)
+
+    def pinned(self, session):
+        """
+        会话是否在写入后的sticky秒内，此时查询应使用主库
+        """
+        if session is None or not self._writes:
+            return False
+        with self._lock:
+            written = self._writes.get(session)
+            if written is None:
+                return False
+            if time.monotonic() - written < self.sticky:
+                return True
+            del self._writes[session]
+            return False
+
+    @contextmanager
+    def reading(self, primary=False):
+        """
+        with router.reading() as pool: 选择执行查询的连接池，期间计入该从库进行中的请求数
+        :param primary: True时使用主库
+        """
+        if primary or not self.replicas:
+            yield self.primary
+            return
+        with self._lock:
+            count = len(self.replicas)
+            index = min(((self._next + i) % count for i in range(count)), key=self.outstanding.__getitem__)
+            self._next = (index + 1) % count
+            self.outstanding[index] += 1
+        try:
+            yield self.replicas[index]
+        finally:
+            with self._lock:
+                self.outstanding[index] -= 1
+
+    def stats(self):
+        """
+        :return: dict
+        """
+        return {"replicas": len(self.replicas), "outstanding": list(self.outstanding), "sessions": len(self._writes)}
+
+
+_routers = {}
+
+
+def get_router(db_config, replicas=(), sticky=0, max_sessions=10000, pool_config=None):
+    """
+    获取数据库配置对应的读写分离路由，相同配置共享一个路由
+    :param db_config: 主库连接参数
+    :param replicas: 从库连接参数list，只需写出与主库不同的项(如host)，从库连接使用autocommit
+    :param pool_config: 从库ConnectionPool的参数
+    :return: ReplicaRouter
+    """
+    key = tuple(sorted((k, repr(v)) for k, v in db_config.items()))
+    with _pools_lock:
+        router = _routers.get(key)
+    if router is None:
+        primary = get_pool(db_config, **(pool_config or {}))
+        pools = [get_pool(dict(dict(db_config, autocommit=True), **replica), **(pool_config or {}))
+                 for replica in replicas]
+        router = ReplicaRouter(primary, pools, sticky, max_sessions)
+        with _pools_lock:
+            router = _routers.setdefault(key, router)
+    return router
+
+
 class MySQLLibrary(object):
     """
     MySql数据库框架
@@ -40,6 +703,13 @@ class MySQLLibrary(object):
 
         self._db_obj = None
         self._cursor = None
+        self._pool = None
+        self._max_packet = None
+        self._cache = None
+        self._router = None
+        self._written = set()       # 当前事务写过的表，"*"表示不能识别
+        # 逻辑会话标识，读写分离时会话写入后一段时间内查询使用主库，可设置为多个实例共享的值(如用户id)
+        self.session = object()
 
     def _params_verify(self, kwargs):
         """
@@ -66,15 +736,64 @@ class MySQLLibrary(object):
             self._cursor = self._db_obj.cursor()
             mysql_log_.info("StatusCode[107] Database initialize complete...")
         except Exception as e:
+            if self._db_obj is not None:
+                self.pool.release(self._db_obj, discard=True)
+                self._db_obj = None
             mysql_log_.error(
                 'StatusCode[201] Function: ["%s"] ERROR: ["%s"] LINE: ["%s"]' % (f_name, e, ErrorInfo.line))
 
+    @property
+    def pool(self):
+        """
+        数据库配置对应的连接池，连接池参数取自settings.DB_POOL_CONFIG
+        """
+        if self._pool is None:
+            self._pool = get_pool(self._db_config, **getattr(settings, "DB_POOL_CONFIG", {}))
+        return self._pool
+
+    @property
+    def cache(self):
+        """
+        数据库配置对应的查询缓存，设置了settings.DB_CACHE_CONFIG(QueryCache的参数)时启用，否则为None
+        """
+        if self._cache is None and getattr(settings, "DB_CACHE_CONFIG", None) is not None:
+            self._cache = get_cache(self._db_config, **settings.DB_CACHE_CONFIG)
+        return self._cache
+
+    @property
+    def router(self):
+        """
+        读写分离路由，设置了settings.DB_ROUTER_CONFIG(get_router的参数，如replicas、sticky)时启用，否则为None
+        只有当前连接不在事务中(DB_CONFIG开启autocommit且没有begin)时查询才会分到从库
+        """
+        if self._router is None and getattr(settings, "DB_ROUTER_CONFIG", None) is not None:
+            self._router = get_router(self._db_config, pool_config=getattr(settings, "DB_POOL_CONFIG", {}),
+                                      **settings.DB_ROUTER_CONFIG)
+        return self._router
+
+    def _wrote(self, tables):
+        """
+        记录当前事务写过的表，事务结束前查询不使用缓存和从库；
+        启用缓存时使缓存失效，提交或回滚时再失效一次，去掉期间其他实例缓存的旧数据
+        """
+        self._written.update(tables or ["*"])
+        if self.cache is not None:
+            self.cache.invalidate(tables)
+
+    def _end_transaction(self):
+        if self._written:
+            if self.cache is not None:
+                self.cache.invalidate(None if "*" in self._written else self._written)
+            if self.router is not None:
+                self.router.wrote(self.session)
+            self._written = set()
+
     def db_connection(self):
         """
-        获取数据库连接对象
+        从连接池取出数据库连接对象
         :return: 数据库连接对象
         """
-        return pymysql.connect(**self._db_config)
+        return self.pool.acquire()
 
     def run(self):
         """
@@ -103,17 +822,86 @@ class MySQLLibrary(object):
         """
         pass
 
-    def select(self, select_sql, *args):
+    def select(self, select_sql, *args, cache=True):
         """
         查询语句，返回数据
+        :param cache: 启用了查询缓存时是否使用缓存，当前事务有写入时不使用
         :return:
         """
         if args:
             select_sql = select_sql % tuple(args)
-        self._cursor.execute(select_sql)
-        result = self._cursor.fetchall()
+        router = self.router
+        # 加锁的查询要在数据库上取得行锁；当前事务有写入或会话刚写入时要读到写入的数据，都不使用缓存
+        locking = is_locking_read(select_sql)
+        pinned = router is not None and router.pinned(self.session)
+        query_cache = self.cache if cache and not (self._written or pinned or locking) else None
+        # 以上情况和事务中的查询都在当前连接(主库)上执行
+        primary = router is None or pinned or locking or self._written or self._in_transaction()
+        if query_cache is not None:
+            key = query_cache.key(select_sql)
+            hit, result = query_cache.get(key)
+            if hit:
+                return result
+            version = query_cache.version
+        if primary:
+            self._cursor.execute(select_sql)
+            result = self._cursor.fetchall()
+        else:
+            result = self._replica_select(router, select_sql)
+        if query_cache is not None:
+            query_cache.put(key, result, version)
         return result
 
+    def _in_transaction(self):
+        """
+        当前连接是否在事务中，没有开启autocommit时连接一直处于事务中
+        """
+        conn = self._db_obj
+        if conn is None:
+            return False
+        return not conn.get_autocommit() or bool(conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS)
+
+    @staticmethod
+    def _replica_select(router, select_sql):
+        """
+        在从库上查询，每次从从库连接池取出连接，用完放回
+        """
+        with router.reading() as pool:
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(select_sql)
+                    return cursor.fetchall()
+                finally:
+                    cursor.close()
+
+    def select_iter(self, select_sql, *args, batch_size=None, fetch_size=1000):
+        """
+        流式查询，使用服务端游标(不缓存结果集)逐行或逐批返回数据，内存占用与结果集大小无关
+        迭代结束或中途停止前，当前连接不能执行其他语句
+        :param batch_size: 指定时每次返回batch_size行的列表，否则逐行返回
+        :param fetch_size: 逐行返回时每次从服务端读取的行数
+        :return: generator
+        """
+        if args:
+            select_sql = select_sql % tuple(args)
+        if issubclass(self._db_obj.cursorclass, pymysql.cursors.DictCursorMixin):
+            cursor = self._db_obj.cursor(pymysql.cursors.SSDictCursor)
+        else:
+            cursor = self._db_obj.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(select_sql)
+            while True:
+                rows = cursor.fetchmany(batch_size or fetch_size)
+                if not rows:
+                    break
+                if batch_size:
+                    yield rows
+                else:
+                    yield from rows
+        finally:
+            cursor.close()
+
     def update(self, update_sql, *args):
         """
         更新语句
@@ -121,7 +909,10 @@ class MySQLLibrary(object):
         """
         if args:
             update_sql = update_sql % tuple(args)
-        return self._cursor.execute(update_sql)
+        try:
+            return self._cursor.execute(update_sql)
+        finally:
+            self._wrote(write_tables(update_sql))
 
     def db_close(self, rollback=False):
         """
@@ -129,15 +920,29 @@ class MySQLLibrary(object):
         :param rollback:
         :return:
         """
-        if rollback:
-            self._db_obj.rollback()
-        else:
-            self._db_obj.commit()
-        self._cursor.close()
-        self._db_obj.close()
+        if self._db_obj is None:
+            return
+        discard = False
+        try:
+            if rollback:
+                self._db_obj.rollback()
+            else:
+                self._db_obj.commit()
+            self._cursor.close()
+        except Exception:
+            discard = True
+            raise
+        finally:
+            # 连接放回连接池，出错的连接不再复用
+            self.pool.release(self._db_obj, discard)
+            self._db_obj, self._cursor = None, None
+            self._end_transaction()
 
     def db_commit(self):
-        self._db_obj.commit()
+        try:
+            self._db_obj.commit()
+        finally:
+            self._end_transaction()
 
     def insert(self, insert_sql, *args):
         """
@@ -148,7 +953,41 @@ class MySQLLibrary(object):
         """
         if args:
             insert_sql = insert_sql % tuple(args)
-        return self._cursor.execute(insert_sql)
+        try:
+            return self._cursor.execute(insert_sql)
+        finally:
+            self._wrote(write_tables(insert_sql))
+
+    def insert_many(self, table, columns, rows, update=None, max_packet=None):
+        """
+        批量插入，参数由驱动绑定，多行合并为不超过max_allowed_packet的 INSERT ... VALUES (...),(...) 语句
+        :param table: 表名
+        :param columns: 列名list
+        :param rows: 每行的值，与columns顺序一致
+        :param update: 冲突时更新的列名list，True表示更新所有列(ON DUPLICATE KEY UPDATE)
+        :param max_packet: 单条语句的最大字节数，默认查询服务端的max_allowed_packet
+        :return: 影响的行数
+        """
+        sql = insert_many_sql(table, columns, update)
+        if max_packet is None:
+            max_packet = self._max_allowed_packet()
+        length = self._cursor.max_stmt_length
+        self._cursor.max_stmt_length = max(max_packet - PACKET_MARGIN, 1)
+        try:
+            return self._cursor.executemany(sql, rows)
+        finally:
+            self._cursor.max_stmt_length = length
+            self._wrote({_table_name(table)})
+
+    def _max_allowed_packet(self):
+        if self._max_packet is None:
+            cursor = self._db_obj.cursor(pymysql.cursors.Cursor)
+            try:
+                cursor.execute("SELECT @@max_allowed_packet")
+                self._max_packet = int(cursor.fetchone()[0])
+            finally:
+                cursor.close()
+        return self._max_packet
 
     def sql_joint(self, sql, *args):
         """
@@ -164,76 +1003,415 @@ record_obj = MySQLLibrary()
 
 from interface import IBehaviorLog
 
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+
+class PoolMonitor(object):
+    """
+    aiomysql连接池的遥测和自适应大小
+    记录取连接的等待时间、使用中/空闲连接数、连接的新建和关闭次数、等待队列长度；
+    指定max_limit时根据最近的平均等待时间在[初始大小, max_limit]之间调整连接池的minsize和maxsize
+    aiomysql没有提供调整大小的接口，调整时修改连接池的_minsize、_free并在_cond上唤醒等待的协程，
+    依赖aiomysql 0.3.x的Pool内部实现，升级aiomysql时需要核对
+    """
+    def __init__(self, pool, max_limit=None, target_wait=0.01, adjust_interval=5, window=1000):
+        """
+        :param pool: aiomysql连接池
+        :param max_limit: maxsize最多增加到的连接数，None表示不自动调整，手动调用adjust时不限制
+        :param target_wait: 平均等待秒数超过该值时扩大连接池，低于其1/4时逐步缩回
+        :param adjust_interval: 两次调整的最短间隔秒数
+        :param window: 统计等待时间分位数时保留的最近取连接次数
+        """
+        self.pool = pool
+        self.max_limit = max_limit
+        self.target_wait = target_wait
+        self.adjust_interval = adjust_interval
+        self.min_floor = pool.minsize
+        self.max_floor = pool.maxsize
+        if max_limit is not None and max_limit < self.max_floor:
+            raise InputParamsError("Pool size error: max_limit=%s maxsize=%s" % (max_limit, self.max_floor))
+        self.waiting = 0            # 正在等待连接的协程数
+        self.max_waiting = 0
+        self.acquires = 0
+        self.failures = 0           # 取连接失败(超时、连接数据库出错)的次数
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.opened = 0             # 见到的不同连接数
+        self.resizes = 0
+        self._wakeup_task = None    # 调整大小后唤醒等待协程的任务
+        self._waits = deque(maxlen=window)
+        self._seen = weakref.WeakSet()
+        self._period_waits = 0.0    # 距上次调整的等待时间之和与次数
+        self._period_count = 0
+        self._adjusted = time.monotonic()
+        self._observe()
+
+    def _observe(self):
+        """
+        记录连接池中新出现的连接
+        """
+        for conn in tuple(self.pool._free) + tuple(self.pool._used):
+            if conn not in self._seen:
+                self._seen.add(conn)
+                self.opened += 1
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        async with monitor.acquire() as conn: 使用结束后放回连接池
+        """
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        start = time.monotonic()
+        try:
+            conn = await self.pool.acquire()
+        except BaseException:
+            self.failures += 1
+            raise
+        finally:
+            self.waiting -= 1
+        self._record(time.monotonic() - start)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    def _record(self, wait):
+        self.acquires += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self._waits.append(wait)
+        self._period_waits += wait
+        self._period_count += 1
+        self._observe()
+        if self.max_limit is not None and time.monotonic() - self._adjusted >= self.adjust_interval:
+            self.adjust()
+
+    def adjust(self):
+        """
+        按距上次调整的平均等待时间调整连接池大小：
+        等待过长时maxsize按1/4增长(至少1个)并多保留一个空闲连接，
+        等待很短时minsize和maxsize各减1，多出的空闲连接被关闭，使用中的连接不受影响
+        :return: (minsize, maxsize)
+        """
+        pool = self.pool
+        wait = self._period_waits / self._period_count if self._period_count else 0.0
+        self._period_waits, self._period_count = 0.0, 0
+        self._adjusted = time.monotonic()
+        minsize, maxsize = pool.minsize, pool.maxsize
+        if wait > self.target_wait and (self.max_limit is None or maxsize < self.max_limit):
+            maxsize += max(1, maxsize // 4)
+            if self.max_limit is not None:
+                maxsize = min(self.max_limit, maxsize)
+            minsize = min(maxsize, minsize + 1)
+        elif wait < self.target_wait / 4:
+            minsize = max(self.min_floor, minsize - 1)
+            # 只关闭空闲连接，连接数不能低于使用中的连接数
+            maxsize = max(self.max_floor, maxsize - 1, pool.size - pool.freesize)
+        if (minsize, maxsize) != (pool.minsize, pool.maxsize):
+            self._resize(minsize, maxsize)
+        return pool.minsize, pool.maxsize
+
+    def _resize(self, minsize, maxsize):
+        pool = self.pool
+        while pool.freesize and pool.size > maxsize:
+            pool._free.popleft().close()
+        pool._minsize = minsize
+        pool._free = deque(pool._free, maxlen=maxsize)
+        self.resizes += 1
+        # 等待连接的协程阻塞在_cond上，扩大后需要唤醒它们按新的maxsize新建连接
+        self._wakeup_task = pool._loop.create_task(self._wakeup())
+
+    async def _wakeup(self):
+        async with self.pool._cond:
+            self.pool._cond.notify_all()
+
+    def stats(self):
+        """
+        连接池的当前状态和累计统计，等待时间单位为秒
+        :return: dict
+        """
+        self._observe()
+        pool = self.pool
+        waits = sorted(self._waits)
+        return {
+            "minsize": pool.minsize,
+            "maxsize": pool.maxsize,
+            "size": pool.size,
+            "in_use": pool.size - pool.freesize,
+            "idle": pool.freesize,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "acquires": self.acquires,
+            "failures": self.failures,
+            "wait_avg": self.wait_total / self.acquires if self.acquires else 0.0,
+            "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            "wait_max": self.wait_max,
+            "opened": self.opened,
+            "closed": self.opened - len(pool._free) - len(pool._used),
+            "resizes": self.resizes,
+        }
+
 
 class MySQLDB(IBehaviorLog):
     def init(self):
         self.pool = self.kwargs.get("pool")
+        # 没有传入连接池时不创建遥测
+        self.monitor = PoolMonitor(self.pool, **self.kwargs.get("pool_monitor", {})) \
+            if self.pool is not None else None
+        # 从库连接池list，查询按进行中请求数最少分到从库，写入后sticky秒内同一会话的查询使用主库
+        self.replicas = [PoolMonitor(pool, **self.kwargs.get("pool_monitor", {}))
+                         for pool in self.kwargs.get("replicas", ())]
+        self.router = ReplicaRouter(self.monitor, self.replicas, self.kwargs.get("sticky", 0))
+        # 查询缓存，QueryCache对象，None表示不缓存
+        self.cache = self.kwargs.get("cache")
+        # 进行中的查询，相同的查询合并为一次执行: key -> Task
+        self._inflight = {}
+        self.coalesced = 0
 
-    async def _select(self, sql, **kwargs):
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(sql)
-                if kwargs.get("fetchone") is True:
-                    r = await cur.fetchone()
-                else:
-                    r = await cur.fetchall()
-            conn.close()
+    def pool_stats(self):
+        """
+        连接池遥测数据，见PoolMonitor.stats，有从库时replicas为各从库的数据
+        """
+        stats = self.monitor.stats() if self.monitor is not None else {}
+        if self.replicas:
+            stats["replicas"] = [monitor.stats() for monitor in self.replicas]
+        return stats
+
+    async def _select(self, sql, cache=True, coalesce=True, session=None, **kwargs):
+        # 加锁的查询和会话刚写入时的查询在主库上执行，不使用缓存，也不合并到从库上的查询；加锁的查询不合并
+        locking = is_locking_read(sql)
+        primary = locking or self.router.pinned(session)
+        query_cache = self.cache if cache and not primary else None
+        key = QueryCache.key(sql, **kwargs)
+        if primary:
+            key += (("primary", True),)
+        if query_cache is not None:
+            hit, r = query_cache.get(key)
+            if hit:
+                return r
+        if not coalesce or locking:
+            return await self._query(sql, query_cache, key, primary, **kwargs)
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(
+                self._query(sql, query_cache, key, primary, **kwargs))
+            task.add_done_callback(lambda t: self._land(key, t))
+        else:
+            self.coalesced += 1
+        # 某个调用方被取消时不影响共享的查询
+        return await asyncio.shield(task)
+
+    def _land(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # 所有调用方都已取消时避免"exception was never retrieved"
+            task.exception()
+
+    def _after_write(self, tables, session=None):
+        """
+        写入后使查询缓存失效，并且后续的相同查询不再合并到写入前开始的查询上
+        :param tables: 写入的表名set，None表示不能识别
+        :param session: 写入的会话，sticky秒内该会话的查询使用主库
+        """
+        self.router.wrote(session)
+        if self.cache is not None:
+            self.cache.invalidate(tables)
+        for key in list(self._inflight):
+            reads = read_tables(key[0])
+            if tables is None or reads is None or reads & tables:
+                del self._inflight[key]
+
+    async def _query(self, sql, query_cache, key, primary=False, **kwargs):
+        version = query_cache.version if query_cache is not None else None
+        with self.router.reading(primary) as monitor:
+            async with monitor.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(sql)
+                    if kwargs.get("fetchone") is True:
+                        r = await cur.fetchone()
+                    else:
+                        r = await cur.fetchall()
+                await self._end_read(conn)
+        if query_cache is not None:
+            query_cache.put(key, r, version)
         return r
 
-    async def _execute(self, sql):
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                res = await cur.execute(sql)
-                await conn.commit()
-            conn.close()
+    @staticmethod
+    async def _end_read(conn):
+        """
+        结束查询在autocommit=False的连接上开启的事务，否则连接池会关闭放回时仍在事务中的连接，也不会保留旧的快照
+        """
+        if conn.get_transaction_status():
+            await conn.rollback()
+
+    async def _execute(self, sql, session=None):
+        try:
+            async with self.monitor.acquire() as conn:
+                async with conn.cursor() as cur:
+                    res = await cur.execute(sql)
+                    await conn.commit()
+        finally:
+            self._after_write(statement_tables(sql), session)
         return res
 
     def select(self, sql, *args, **kwargs):
-
+        """
+        :param kwargs: fetchone=True时只返回一行；cache=False时不使用查询缓存；
+            coalesce=False时不与进行中的相同查询合并，默认合并，并发的相同查询只执行一次并共享结果；
+            session为逻辑会话标识，该会话写入后sticky秒内查询使用主库
+        """
         sql = sql % tuple(args) if args else sql
         return self._select(sql, **kwargs)
 
-    def insert(self, sql, *args):
+    async def select_iter(self, sql, *args, batch_size=None, fetch_size=1000, session=None):
+        """
+        流式查询，使用服务端游标逐行或逐批返回数据，内存占用与结果集大小无关
+        迭代期间一直占用一个连接池中的连接
+        :param batch_size: 指定时每次返回batch_size行的列表，否则逐行返回
+        :param fetch_size: 逐行返回时每次从服务端读取的行数
+        :param session: 逻辑会话标识，同select
+        :return: async generator，async for row in db.select_iter(sql): ...
+        """
         sql = self.join_sql(sql, *args)
-        res = self._execute(sql)
+        with self.router.reading(is_locking_read(sql) or self.router.pinned(session)) as monitor:
+            async with monitor.acquire() as conn:
+                if issubclass(conn.cursorclass, (aiomysql.DictCursor, aiomysql.SSDictCursor)):
+                    cursor = conn.cursor(aiomysql.SSDictCursor)
+                else:
+                    cursor = conn.cursor(aiomysql.SSCursor)
+                try:
+                    async with cursor as cur:
+                        await cur.execute(sql)
+                        while True:
+                            rows = await cur.fetchmany(batch_size or fetch_size)
+                            if not rows:
+                                break
+                            if batch_size:
+                                yield rows
+                            else:
+                                for row in rows:
+                                    yield row
+                except GeneratorExit:
+                    # 中途停止迭代时也结束事务，连接可以继续复用
+                    await self._end_read(conn)
+                    raise
+                await self._end_read(conn)
+
+    def insert(self, sql, *args, session=None):
+        sql = self.join_sql(sql, *args)
+        res = self._execute(sql, session)
+        return res
+
+    async def _run_many(self, func, queries, concurrency, timeout, return_exceptions):
+        """
+        并发执行多条语句，同时执行的数量不超过concurrency(默认为连接池的maxsize)
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.pool.maxsize)
+
+        async def run(query):
+            sql, args = (query, ()) if isinstance(query, str) else query
+            async with semaphore:
+                # 超时时间包括等待连接的时间
+                return await asyncio.wait_for(func(self.join_sql(sql, *args)), timeout)
+
+        results = await asyncio.gather(*[run(query) for query in queries], return_exceptions=True)
+        errors = {i: r for i, r in enumerate(results) if isinstance(r, BaseException)}
+        if errors and not return_exceptions:
+            raise BatchQueryError(
+                results=[None if i in errors else r for i, r in enumerate(results)], errors=errors)
+        return results
+
+    def select_many(self, queries, concurrency=None, timeout=None, return_exceptions=False, **kwargs):
+        """
+        并发执行多条查询，总耗时约为最慢的一条
+        :param queries: [(sql, args), ...]，args为拼接到sql的参数tuple，没有参数时可以直接传sql
+        :param concurrency: 同时执行的最大数量，默认为连接池的maxsize
+        :param timeout: 每条语句的超时秒数，超时记为asyncio.TimeoutError
+        :param return_exceptions: True时失败的位置为异常对象，否则有失败时抛出BatchQueryError
+        :param kwargs: 传给select，如fetchone=True
+        :return: 与queries顺序一致的结果list
+        """
+        return self._run_many(lambda sql: self._select(sql, **kwargs), queries, concurrency, timeout,
+                              return_exceptions)
+
+    def execute_many(self, queries, concurrency=None, timeout=None, return_exceptions=False, session=None):
+        """
+        并发执行多条写语句，每条在各自的连接上单独提交，参数同select_many
+        :return: 与queries顺序一致的影响行数list
+        """
+        return self._run_many(lambda sql: self._execute(sql, session), queries, concurrency, timeout,
+                              return_exceptions)
+
+    async def insert_many(self, table, columns, rows, update=None, max_packet=None, session=None):
+        """
+        批量插入，规则同MySQLLibrary.insert_many，在一个连接上执行并提交
+        :return: 影响的行数
+        """
+        sql = insert_many_sql(table, columns, update)
+        async with self.monitor.acquire() as conn:
+            async with conn.cursor(aiomysql.Cursor) as cur:
+                if max_packet is None:
+                    max_packet = getattr(self, "_max_packet", None)
+                if max_packet is None:
+                    await cur.execute("SELECT @@max_allowed_packet")
+                    max_packet = self._max_packet = int((await cur.fetchone())[0])
+                cur.max_stmt_length = max(max_packet - PACKET_MARGIN, 1)
+                try:
+                    res = await cur.executemany(sql, rows)
+                    await conn.commit()
+                finally:
+                    self._after_write({_table_name(table)}, session)
         return res
 
-    def delete(self, sql, *args):
+    def delete(self, sql, *args, session=None):
         sql = self.join_sql(sql, *args)
-        res = self._execute(sql)
+        res = self._execute(sql, session)
         return res
 
-    def update(self, sql, *args):
+    def update(self, sql, *args, session=None):
         sql = self.join_sql(sql, *args)
-        res = self._execute(sql)
+        res = self._execute(sql, session)
         return res
 
-    async def _transact(self, *args):
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                status = True
-                for sql in args:
-                    res = await cur.execute(sql)
-                    if not res:
-                        status = False
-                if status:
-                    await conn.commit()
-            conn.close()
+    async def _transact(self, *args, session=None):
+        try:
+            async with self.monitor.acquire() as conn:
+                async with conn.cursor() as cur:
+                    status = True
+                    for sql in args:
+                        res = await cur.execute(sql)
+                        if not res:
+                            status = False
+                    if status:
+                        await conn.commit()
+                    else:
+                        # 放回时仍在事务中的连接会被连接池关闭
+                        await conn.rollback()
+        finally:
+            self._after_write(statement_tables(*args), session)
         return status
 
-    def transact(self, *args):
+    def transact(self, *args, session=None):
         if not args:
             return False
 
-        return self._transact(*args)
+        return self._transact(*args, session=session)
 
     @staticmethod
     def join_sql(sql, *args):
         return sql % tuple(args) if args else sql
 
     async def close(self):
-        self.pool.close()
-        await self.pool.wait_closed()
+        for monitor in [self.monitor] + self.replicas:
+            if monitor is None:
+                continue
+            monitor.pool.close()
+            await monitor.pool.wait_closed()
 
     def write(self, data: dict):
         pass
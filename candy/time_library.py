@@ -1,8 +1,28 @@
+import os
 import re
+import sys
+import mmap
 import time
-import iso8601
+import argparse
 import datetime
+import multiprocessing
+from functools import lru_cache
+from array import array
+from bisect import bisect_left, bisect_right
 from calendar import monthrange
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，未安装时批量接口逐个转换
+    np = None
+try:
+    import zoneinfo
+except ImportError:  # python3.9以下没有zoneinfo，不支持按调用指定时区
+    zoneinfo = None
+
+from candy.error_library import CustomBaseError
 
 max_point = 200
 HOUR = 0
@@ -15,6 +35,855 @@ DAY_STEP = 86400
 HOUR_STEP = 3600
 MINUTE_STEP = 60
 
+# 支持解析的字符串时间格式，字段顺序固定为：年 月 日 时 分 秒
+DATE_SHAPES = (
+    ('%Y-%m-%d', r'(\d{4})-(\d{2})-(\d{2})'),
+    ('%Y-%m', r'(\d{4})-(\d{2})'),
+    ('%Y-%m-%d %H:%M', r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2})'),
+    ('%Y-%m-%d %H:%M:%S', r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})'),
+    ('%Y%m%d', r'(\d{4})(\d{2})(\d{2})'),
+    ('%Y%m%d%H', r'(\d{4})(\d{2})(\d{2})(\d{2})'),
+    ('%Y%m%d%H%M', r'(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})'),
+    ('%Y%m%d%H%M%S', r'(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})'),
+)
+UTC_DATE_SHAPES = DATE_SHAPES + (
+    ('%Y-%m-%dT%H:%M:%S', r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})'),
+)
+# iso8601时间，与iso8601.parse_date支持的形式一致：年[-月[-日[ 时[:分[:秒[.小数]]][时区]]]]
+_ISO_PATTERN = r"""
+    (\d{4})
+    (?:
+        (?:-(\d{1,2})|(\d{2})(?!$))
+        (?:
+            (?:-(\d{1,2})|(\d{2}))
+            (?:
+                [ T](\d{2})
+                (?::?(\d{2}))?
+                (?::?(\d{1,2})(?:[.,]\d+)?)?
+                (Z|([-+])(\d{2}):?(\d{2})?)?
+            )?
+        )?
+    )?
+"""
+_ISO_REGEX = re.compile(_ISO_PATTERN, re.VERBOSE)
+_ISO_REGEX_BYTES = re.compile(_ISO_PATTERN.encode(), re.VERBOSE)
+_MONTH_DAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+# TimeRange支持的步长单位：按秒数计算的单位，以及按自然月计算的单位(值为月数)
+RANGE_SECOND_UNITS = {"second": 1, "minute": MINUTE_STEP, "hour": HOUR_STEP, "day": DAY_STEP, "week": 7 * DAY_STEP}
+RANGE_MONTH_UNITS = {"month": 1, "season": 3, "year": 12}
+# 时区切换表预先计算的年份范围，超出范围的时间直接查询zoneinfo
+TIMEZONE_START_YEAR = 1900
+TIMEZONE_END_YEAR = 2100
+# 日历表覆盖的年份范围
+CALENDAR_START_YEAR = 1970
+CALENDAR_END_YEAR = 2100
+_DAY_OFFSETS_MAX = 100000
+_day_offsets = {}
+_day_offsets_tz = [None]
+# 按UTC小时缓存的进程时区偏移量，供格式化器使用
+_hour_offsets = {}
+_hour_offsets_tz = [None]
+# 格式化器按天或小时缓存已渲染的前缀，默认最多缓存的分桶数
+FORMATTER_CACHE_SIZE = 1024
+# 格式化器可以直接填写的字段：指令 -> 取值循环一次的秒数
+_FORMATTER_FILLS = {'H': DAY_STEP, 'M': HOUR_STEP, 'S': MINUTE_STEP}
+# 其他指令的取值在多大的分桶内不变，未列出的指令(如%s %c %X)不缓存
+_FORMATTER_LEVELS = dict([(c, DAY_STEP) for c in 'aAbBCdDeFgGhjmntuUVwWxyYzZ'] +
+                         [(c, HOUR_STEP) for c in 'Ipkl'])
+_TWO_DIGITS = tuple('%02d' % i for i in range(60))
+_FORMATTER_ALIASES = {'T': '%H:%M:%S', 'R': '%H:%M'}
+# 按格式化器输出iso时间的范围，四位数年份内%Y与datetime.isoformat一致
+_ISO_MIN_SECONDS = -30610224000 + 2 * DAY_STEP
+_ISO_MAX_SECONDS = 253402300799 - 2 * DAY_STEP
+
+
+class DruidTimeError(CustomBaseError):
+    """
+    druid查询时间参数错误
+    """
+
+    def __str__(self):
+        if self.message:
+            return repr(self.message)
+        else:
+            return repr("Druid time params error.")
+
+
+class TimeZoneError(CustomBaseError):
+    """
+    时区错误
+    """
+
+    def __str__(self):
+        if self.message:
+            return repr(self.message)
+        else:
+            return repr("Unknown time zone.")
+
+
+class TimeFormatError(CustomBaseError):
+    """
+    无法识别的时间格式
+    """
+
+    def __str__(self):
+        if self.message:
+            return repr(self.message)
+        else:
+            return repr("Does not recognize the format.")
+
+
+def _days_from_civil(year, month, day):
+    """
+    公历日期转换为距离1970-01-01的天数，纯整数运算
+    """
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _civil_from_days(days):
+    """
+    距离1970-01-01的天数转换为公历日期 (年, 月, 日)
+    """
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + 3 if mp < 10 else mp - 9
+    return yoe + era * 400 + (month <= 2), month, day
+
+
+def _month_days(year, month):
+    """
+    某年某月的天数
+    """
+    if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return 29
+    return _MONTH_DAYS[month]
+
+
+def _local_day_offset(days):
+    """
+    获取本地某一天内固定的UTC偏移量(秒)，当天存在时区切换(如夏令时)时返回None
+    按天缓存，进程时区变化(time.tzset)后自动失效
+    :param days: 距离1970-01-01的天数(本地日期)
+    """
+    if _day_offsets_tz[0] is not time.tzname:
+        _day_offsets.clear()
+        _day_offsets_tz[0] = time.tzname
+    try:
+        return _day_offsets[days]
+    except KeyError:
+        pass
+    start = days * DAY_STEP
+    try:
+        # 前后各留14小时，覆盖所有时区下这一天对应的时间段
+        offset = time.localtime(start - 14 * HOUR_STEP).tm_gmtoff
+        if time.localtime(start + DAY_STEP + 14 * HOUR_STEP).tm_gmtoff != offset:
+            offset = None
+    except (OverflowError, OSError, ValueError):
+        offset = None
+    if len(_day_offsets) >= _DAY_OFFSETS_MAX:
+        _day_offsets.clear()
+    _day_offsets[days] = offset
+    return offset
+
+
+def _local_hour_offset(value):
+    """
+    获取时间戳所在UTC小时内固定的本地UTC偏移量(秒)，这一小时内存在时区切换时返回None
+    按小时缓存，进程时区变化(time.tzset)后自动失效
+    """
+    if _hour_offsets_tz[0] is not time.tzname:
+        _hour_offsets.clear()
+        _hour_offsets_tz[0] = time.tzname
+    hour = value // HOUR_STEP
+    try:
+        return _hour_offsets[hour]
+    except KeyError:
+        pass
+    start = hour * HOUR_STEP
+    try:
+        offset = time.localtime(start).tm_gmtoff
+        if time.localtime(start + HOUR_STEP - 1).tm_gmtoff != offset:
+            offset = None
+    except (OverflowError, OSError, ValueError):
+        offset = None
+    if len(_hour_offsets) >= _DAY_OFFSETS_MAX:
+        _hour_offsets.clear()
+    _hour_offsets[hour] = offset
+    return offset
+
+
+def _local2timestamp(year, month, day, hour, minute, second):
+    """
+    本地时间转换为时间戳，当天偏移量固定时直接整数运算，否则交给mktime处理时区切换
+    """
+    days = _days_from_civil(year, month, day)
+    offset = _local_day_offset(days)
+    if offset is None:
+        return int(time.mktime((year, month, day, hour, minute, second, 0, 0, -1)))
+    return days * DAY_STEP + hour * HOUR_STEP + minute * MINUTE_STEP + second - offset
+
+
+class DateParser(object):
+    """
+    字符串时间解析引擎
+    按字符串形状(长度、分隔符位置)缓存命中的格式，每次只做一次预编译正则匹配，
+    之后直接用整数运算得到时间戳，不再经过strptime
+    """
+
+    def __init__(self, shapes=DATE_SHAPES):
+        self._shapes = tuple((fmt, re.compile(pattern)) for fmt, pattern in shapes)
+        self._cache = {}
+
+    def match(self, s):
+        """
+        识别时间字符串
+        :param s: 时间字符串
+        :return: (格式, 字段元组)
+        """
+        key = (len(s), s[4:5], s[10:11])
+        shape = self._cache.get(key)
+        if shape is not None:
+            m = shape[1].fullmatch(s)
+            if m:
+                return shape[0], m.groups()
+        for shape in self._shapes:
+            m = shape[1].fullmatch(s)
+            if m:
+                self._cache[key] = shape
+                return shape[0], m.groups()
+        raise TimeFormatError("Does not recognize the format: %r" % s)
+
+    def time_format(self, s):
+        """
+        获取时间字符串的格式
+        """
+        return self.match(s)[0]
+
+    def fields(self, s):
+        """
+        解析出 (年, 月, 日, 时, 分, 秒)，缺省的日为1，时分秒为0
+        """
+        groups = self.match(s)[1]
+        n = len(groups)
+        year = int(groups[0])
+        month = int(groups[1])
+        day = int(groups[2]) if n > 2 else 1
+        hour = int(groups[3]) if n > 3 else 0
+        minute = int(groups[4]) if n > 4 else 0
+        second = int(groups[5]) if n > 5 else 0
+        if year < 1 or not 1 <= month <= 12 or not 1 <= day <= _month_days(year, month) \
+                or hour > 23 or minute > 59 or second > 61:
+            raise TimeFormatError("Time value out of range: %r" % s)
+        return year, month, day, hour, minute, second
+
+    def timestamp(self, s):
+        """
+        按本地时区将时间字符串转换为时间戳
+        """
+        return _local2timestamp(*self.fields(s))
+
+
+_date_parser = DateParser()
+_utc_date_parser = DateParser(UTC_DATE_SHAPES)
+
+
+class CalendarTable(object):
+    """
+    按天预先计算的本地日历表，下标为距离起始日期的天数
+    每天记录：年、月、日、星期(0为周日)、季度、当天0点的时间戳，
+    取字段只需定位下标再做整数运算，不再经过localtime和strftime
+    """
+
+    def __init__(self, start_year=CALENDAR_START_YEAR, end_year=CALENDAR_END_YEAR):
+        self.tzname = time.tzname
+        self.timezone = time.timezone
+        self.first_day = _days_from_civil(start_year, 1, 1)
+        self.size = _days_from_civil(end_year + 1, 1, 1) - self.first_day
+        self.years, self.months, self.days, self.seasons = [], [], [], []
+        for year in range(start_year, end_year + 1):
+            for month in range(1, 13):
+                n = _month_days(year, month)
+                self.years.extend([year] * n)
+                self.months.extend([month] * n)
+                self.days.extend(range(1, n + 1))
+                self.seasons.extend([(month - 1) // 3 + 1] * n)
+        self.weeks = [(self.first_day + i + 4) % 7 for i in range(self.size)]
+        self.starts, self.fixed = self._day_starts()
+
+    def _day_starts(self):
+        """
+        计算每天0点的时间戳，以及当天UTC偏移量是否固定
+        本地的一天一定落在前一天到后两天的UTC 0点之间，这几个时刻偏移量相同则当天没有时区切换
+        """
+        first = self.first_day
+        probes = [time.localtime((first + k) * DAY_STEP).tm_gmtoff for k in range(-1, self.size + 3)]
+        starts, fixed = [], []
+        for i in range(self.size + 1):
+            offset = probes[i + 1]
+            if probes[i] == offset == probes[i + 2] == probes[i + 3]:
+                starts.append((first + i) * DAY_STEP - offset)
+                fixed.append(True)
+            else:
+                starts.append(self._search_day_start(first + i))
+                fixed.append(False)
+        return starts, fixed
+
+    @staticmethod
+    def _search_day_start(day):
+        """
+        二分查找本地日期为day的第一秒，用于存在时区切换的日期
+        """
+        low, high = day * DAY_STEP - 15 * HOUR_STEP, day * DAY_STEP + 15 * HOUR_STEP
+        while low < high:
+            middle = (low + high) // 2
+            lt = time.localtime(middle)
+            if _days_from_civil(lt.tm_year, lt.tm_mon, lt.tm_mday) >= day:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def index(self, value):
+        """
+        获取时间戳所在本地日期在表中的下标，超出表的范围时返回None
+        """
+        try:
+            i = int((value - self.timezone) // DAY_STEP) - self.first_day
+        except TypeError:
+            return None
+        starts = self.starts
+        size = self.size
+        # 按标准时区估算的下标，偏移量变化过的日期需要前后修正
+        while 0 <= i < size and value < starts[i]:
+            i -= 1
+        while 0 <= i < size and value >= starts[i + 1]:
+            i += 1
+        if 0 <= i < size:
+            return i
+        return None
+
+    def year(self, value):
+        i = self.index(value)
+        return time.localtime(value).tm_year if i is None else self.years[i]
+
+    def month(self, value):
+        i = self.index(value)
+        return time.localtime(value).tm_mon if i is None else self.months[i]
+
+    def day(self, value):
+        i = self.index(value)
+        return time.localtime(value).tm_mday if i is None else self.days[i]
+
+    def date(self, value):
+        """
+        获取 (年, 月, 日)
+        """
+        i = self.index(value)
+        if i is None:
+            lt = time.localtime(value)
+            return lt.tm_year, lt.tm_mon, lt.tm_mday
+        return self.years[i], self.months[i], self.days[i]
+
+    def week(self, value):
+        """
+        星期，0为周日，与strftime('%w')一致
+        """
+        i = self.index(value)
+        return (time.localtime(value).tm_wday + 1) % 7 if i is None else self.weeks[i]
+
+    def season(self, value):
+        i = self.index(value)
+        return (time.localtime(value).tm_mon - 1) // 3 + 1 if i is None else self.seasons[i]
+
+    def day_start(self, value):
+        """
+        时间戳所在本地日期0点的时间戳，超出表的范围时返回None
+        """
+        i = self.index(value)
+        return None if i is None else self.starts[i]
+
+    def parts(self, value):
+        """
+        分解时间戳的所有日历字段
+        :return: TimeParts
+        """
+        i = self.index(value)
+        if i is None or not self.fixed[i]:
+            lt = time.localtime(value)
+            day_start = _local2timestamp(lt.tm_year, lt.tm_mon, lt.tm_mday, 0, 0, 0) if i is None else self.starts[i]
+            return TimeParts(value, lt.tm_year, lt.tm_mon, lt.tm_mday, lt.tm_hour, lt.tm_min, lt.tm_sec,
+                             (lt.tm_wday + 1) % 7, (lt.tm_mon - 1) // 3 + 1, day_start)
+        day_start = self.starts[i]
+        seconds = int((value - day_start) // 1)
+        return TimeParts(value, self.years[i], self.months[i], self.days[i], seconds // HOUR_STEP,
+                         seconds // MINUTE_STEP % 60, seconds % 60, self.weeks[i], self.seasons[i], day_start)
+
+    def clock(self, value):
+        """
+        获取 (时, 分, 秒)
+        """
+        i = self.index(value)
+        if i is None or not self.fixed[i]:
+            lt = time.localtime(value)
+            return lt.tm_hour, lt.tm_min, lt.tm_sec
+        seconds = int((value - self.starts[i]) // 1)
+        return seconds // HOUR_STEP, seconds // MINUTE_STEP % 60, seconds % 60
+
+
+class TimeParts(object):
+    """
+    时间戳一次分解得到的本地日历字段
+    week: 星期，0为周日；season: 季度 1~4；day_start: 所在日期0点的时间戳
+    """
+    __slots__ = ('timestamp', 'year', 'month', 'day', 'hour', 'minute', 'second', 'week', 'season', 'day_start')
+
+    def __init__(self, timestamp, year, month, day, hour, minute, second, week, season, day_start):
+        self.timestamp = timestamp
+        self.year = year
+        self.month = month
+        self.day = day
+        self.hour = hour
+        self.minute = minute
+        self.second = second
+        self.week = week
+        self.season = season
+        self.day_start = day_start
+
+    def __repr__(self):
+        return "TimeParts(%04d-%02d-%02d %02d:%02d:%02d, week=%d, season=%d)" % (
+            self.year, self.month, self.day, self.hour, self.minute, self.second, self.week, self.season)
+
+
+_calendar_table = [None]
+
+
+def calendar_table():
+    """
+    获取当前进程时区的日历表，首次使用时构建，时区变化(time.tzset)后重新构建
+    """
+    table = _calendar_table[0]
+    if table is None or table.tzname is not time.tzname:
+        table = _calendar_table[0] = CalendarTable()
+    return table
+
+
+def _local_day_start(days):
+    """
+    本地日期(距离1970-01-01的天数)0点的时间戳
+    """
+    table = calendar_table()
+    i = days - table.first_day
+    if 0 <= i < table.size:
+        return table.starts[i]
+    year, month, day = _civil_from_days(days)
+    return _local2timestamp(year, month, day, 0, 0, 0)
+
+
+class TimeZoneTable(object):
+    """
+    时区的UTC偏移量切换表
+    预先按天探测zoneinfo在年份范围内的偏移量切换时刻，保存为有序数组，
+    时间戳与本地时间的换算只需二分查找加一次加法，不依赖进程时区，同一进程可以服务多个时区
+    """
+
+    def __init__(self, name, start_year=TIMEZONE_START_YEAR, end_year=TIMEZONE_END_YEAR):
+        """
+        :param name: IANA时区名，例：Asia/Shanghai
+        """
+        if zoneinfo is None:
+            raise TimeZoneError("zoneinfo is required for time zone support")
+        try:
+            self.zone = zoneinfo.ZoneInfo(name)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError) as e:
+            raise TimeZoneError("Unknown time zone: %r" % name, e)
+        self.name = name
+        self.low = _days_from_civil(start_year, 1, 1) * DAY_STEP
+        self.high = _days_from_civil(end_year + 1, 1, 1) * DAY_STEP
+        self.transitions, self.offsets = self._build()
+
+    def _zone_offset(self, value):
+        """
+        直接查询zoneinfo得到的UTC偏移量(秒)
+        """
+        return int(datetime.datetime.fromtimestamp(value, self.zone).utcoffset().total_seconds())
+
+    def _build(self):
+        """
+        按天探测偏移量变化，再二分查找精确的切换时刻
+        :return: (切换时刻列表, 偏移量列表)，offsets[i]为第i个切换时刻之前的偏移量
+        """
+        transitions = []
+        current = self._zone_offset(self.low)
+        offsets = [current]
+        for probe in range(self.low + DAY_STEP, self.high + DAY_STEP, DAY_STEP):
+            offset = self._zone_offset(probe)
+            if offset == current:
+                continue
+            low, high = probe - DAY_STEP, probe
+            while high - low > 1:
+                middle = (low + high) // 2
+                if self._zone_offset(middle) == current:
+                    low = middle
+                else:
+                    high = middle
+            transitions.append(high)
+            offsets.append(offset)
+            current = offset
+        return transitions, offsets
+
+    def utcoffset(self, value):
+        """
+        时间戳所在时刻的UTC偏移量(秒)
+        """
+        if self.low <= value < self.high:
+            return self.offsets[bisect_right(self.transitions, value)]
+        return self._zone_offset(value)
+
+    def local(self, value):
+        """
+        时间戳转换为本地时间(按UTC计算的秒数)
+        """
+        return int((value + self.utcoffset(value)) // 1)
+
+    def timestamp(self, naive):
+        """
+        本地时间(按UTC计算的秒数)转换为时间戳
+        重复的本地时间取较早的时刻，不存在的本地时间按切换前的偏移量计算，与datetime的fold=0一致
+        """
+        before = self.utcoffset(naive - DAY_STEP)
+        after = self.utcoffset(naive + DAY_STEP)
+        if before == after:
+            return naive - before
+        valid = [naive - offset for offset in (before, after) if self.utcoffset(naive - offset) == offset]
+        return min(valid) if valid else naive - before
+
+    def parts(self, value):
+        """
+        分解时间戳的所有日历字段
+        :return: TimeParts
+        """
+        days, seconds = divmod(self.local(value), DAY_STEP)
+        year, month, day = _civil_from_days(days)
+        return TimeParts(value, year, month, day, seconds // HOUR_STEP, seconds // MINUTE_STEP % 60, seconds % 60,
+                         (days + 4) % 7, (month - 1) // 3 + 1, self.timestamp(days * DAY_STEP))
+
+    def strftime(self, fmt, value):
+        """
+        按本时区格式化时间戳
+        """
+        if '%z' in fmt or '%Z' in fmt:
+            return datetime.datetime.fromtimestamp(value, self.zone).strftime(fmt)
+        return time.strftime(fmt, time.gmtime(self.local(value)))
+
+    def utcoffset_many(self, values):
+        """
+        批量获取时间戳的UTC偏移量，需要numpy
+        """
+        values = np.asarray(values)
+        offsets = np.array(self.offsets, dtype=np.int64)[np.searchsorted(self.transitions, values, side='right')]
+        outside = (values < self.low) | (values >= self.high)
+        if outside.any():
+            idx = np.flatnonzero(outside)
+            offsets[idx] = [self._zone_offset(v) for v in values[idx].tolist()]
+        return offsets
+
+    def timestamp_many(self, naive):
+        """
+        批量将本地时间(按UTC计算的秒数)转换为时间戳，规则与timestamp一致，需要numpy
+        """
+        naive = np.asarray(naive, dtype=np.int64)
+        before = self.utcoffset_many(naive - DAY_STEP)
+        after = self.utcoffset_many(naive + DAY_STEP)
+        result = naive - before
+        changed = np.flatnonzero(before != after)
+        if len(changed):
+            result[changed] = [self.timestamp(v) for v in naive[changed].tolist()]
+        return result
+
+
+_timezone_tables = {}
+
+
+def get_timezone(tz):
+    """
+    获取时区的切换表，每个时区只构建一次
+    :param tz: IANA时区名，或TimeZoneTable对象
+    :return: TimeZoneTable
+    """
+    if isinstance(tz, TimeZoneTable):
+        return tz
+    table = _timezone_tables.get(tz)
+    if table is None:
+        table = _timezone_tables[tz] = TimeZoneTable(tz)
+    return table
+
+
+def decompose(value, tz=None):
+    """
+    分解时间戳，一次得到年、月、日、时、分、秒、星期、季度和当天0点的时间戳
+    :param value: 时间戳
+    :param tz: 时区名，默认使用进程时区
+    :return: TimeParts
+    """
+    if tz is not None:
+        return get_timezone(tz).parts(value)
+    return calendar_table().parts(value)
+
+
+class TimeFormatter(object):
+    """
+    带缓存的时间戳格式化器，每个格式串编译一次
+    格式串中的时、分、秒由整数运算直接填写，其余字段按天(含%I %p时按小时)分桶渲染一次后缓存，
+    大量落在相同几天、几小时内的时间戳只需一次字典查找和一次字符串拼接
+    """
+
+    def __init__(self, fmt, tz=None, maxsize=FORMATTER_CACHE_SIZE):
+        """
+        :param fmt: time.strftime格式串
+        :param tz: 时区名，"UTC"按UTC时间格式化，默认使用进程时区
+        :param maxsize: 最多缓存的分桶数，超出后淘汰最久未使用的
+        """
+        self.fmt = fmt
+        self.tz = tz
+        self.maxsize = maxsize
+        self._table = None if tz is None or tz == "UTC" else get_timezone(tz)
+        self._cache = OrderedDict()
+        self._tzname = time.tzname
+        self.size, self.segments = self._compile(fmt)
+        # 需要填写的字段在 (时, 分, 秒) 中的下标
+        self.fields = tuple('HMS'.index(directive) for directive in self.segments[1::2])
+
+    @staticmethod
+    def _compile(fmt):
+        """
+        拆分格式串
+        :return: (分桶秒数, [strftime片段或需要填写的指令])，分桶秒数为None表示格式串不能缓存
+        """
+        segments, literal, size = [], [], DAY_STEP
+        fmt = re.sub('%[%TR]', lambda m: _FORMATTER_ALIASES.get(m.group()[1], m.group()), fmt)
+        i = 0
+        while i < len(fmt):
+            if fmt[i] != '%':
+                literal.append(fmt[i])
+                i += 1
+                continue
+            directive = fmt[i + 1:i + 2]
+            i += 2
+            if directive in _FORMATTER_FILLS:
+                segments.append(''.join(literal))
+                segments.append(directive)
+                literal = []
+            elif directive in _FORMATTER_LEVELS or directive == '%':
+                literal.append('%' + directive)
+                size = min(size, _FORMATTER_LEVELS.get(directive, DAY_STEP))
+            else:
+                return None, [fmt]
+        segments.append(''.join(literal))
+        # 比分桶粗的字段在桶内不变，直接渲染进前缀
+        for k in range(1, len(segments), 2):
+            if _FORMATTER_FILLS[segments[k]] <= size:
+                continue
+            segments[k] = '%' + segments[k]
+        merged = [segments[0]]
+        for k in range(1, len(segments), 2):
+            if segments[k] in _FORMATTER_FILLS:
+                merged.extend(segments[k:k + 2])
+            else:
+                merged[-1] += segments[k] + segments[k + 1]
+        return size, merged
+
+    def _render(self, fmt, value):
+        """
+        直接调用strftime渲染
+        """
+        if self._table is not None:
+            return self._table.strftime(fmt, value)
+        if self.tz is not None:
+            return time.strftime(fmt, time.gmtime(value))
+        return time.strftime(fmt, time.localtime(value))
+
+    def _utcoffset(self, value):
+        if self._table is not None:
+            return self._table.utcoffset(value)
+        if self.tz is not None:
+            return 0
+        return _local_hour_offset(value)
+
+    def __call__(self, value):
+        """
+        格式化时间戳
+        :param value: 时间戳，int或float，小数部分舍去
+        :return: str
+        """
+        if value.__class__ is not int:
+            value = int(value // 1)
+        if self.size is None:
+            return self._render(self.fmt, value)
+        if self._table is None and self._tzname is not time.tzname:
+            self._cache.clear()
+            self._tzname = time.tzname
+        offset = self._utcoffset(value)
+        if offset is None:
+            return self._render(self.fmt, value)
+        bucket, rest = divmod(value + offset, self.size)
+        key = bucket, offset
+        cache = self._cache
+        try:
+            template = cache[key]
+            cache.move_to_end(key)
+        except KeyError:
+            # 没有需要填写的字段时模板就是结果，不做%转义
+            if self.fields:
+                template = '%s'.join(self._render(text, value).replace('%', '%%') if text else ''
+                                     for text in self.segments[::2])
+            else:
+                template = self._render(self.segments[0], value) if self.segments[0] else ''
+            cache[key] = template
+            if len(cache) > self.maxsize:
+                cache.popitem(last=False)
+        if not self.fields:
+            return template
+        minute, second = divmod(rest, MINUTE_STEP)
+        hour, minute = divmod(minute, 60)
+        values = _TWO_DIGITS[hour], _TWO_DIGITS[minute], _TWO_DIGITS[second]
+        if self.fields == (0, 1, 2):
+            return template % values
+        return template % tuple([values[i] for i in self.fields])
+
+    def cache_clear(self):
+        """
+        清空已缓存的前缀
+        """
+        self._cache.clear()
+
+
+@lru_cache(maxsize=256)
+def get_formatter(fmt, tz=None):
+    """
+    获取格式串对应的格式化器，同一格式串和时区共享一个实例
+    :param fmt: time.strftime格式串
+    :param tz: 时区名，"UTC"按UTC时间格式化，默认使用进程时区
+    :return: TimeFormatter
+    """
+    return TimeFormatter(fmt, tz)
+
+
+class CoarseClock(object):
+    """
+    粗粒度的缓存时钟
+    每个刻度(resolution秒)内只读取一次系统时间，当前时间、当天0点、iso时间和格式化后的字符串
+    在同一刻度内只计算一次，适合日志、审计等高频获取"现在"的场景
+    """
+
+    def __init__(self, resolution=0.001):
+        """
+        :param resolution: 刻度，秒，例：0.001为1毫秒，1为1秒
+        """
+        if resolution <= 0:
+            raise ValueError("resolution must be positive")
+        self.resolution = resolution
+        # (当前刻度开始的时间, 刻度结束的时间, 本刻度内已渲染的结果)，整体替换保证多线程读取一致
+        self._state = (0, 0, {})
+        self._day = (0, 0)
+
+    def _tick(self):
+        state = self._state
+        now = time.time()
+        if now >= state[1] or now < state[0]:
+            state = self._state = (now, now + self.resolution, {})
+        return state
+
+    def now(self):
+        """
+        当前时间戳，float
+        """
+        return self._tick()[0]
+
+    def today_start(self):
+        """
+        当天0点的时间戳，跨天后重新计算
+        """
+        now = self._tick()[0]
+        start, end = self._day
+        if not start <= now < end:
+            start, end = self._day = get_start_end_timestamp(now, DAY)
+        return start
+
+    def format(self, fmt, tz=None):
+        """
+        按格式串渲染当前时间，同一刻度内直接返回缓存的字符串
+        """
+        now, _, rendered = self._tick()
+        key = fmt, tz
+        try:
+            return rendered[key]
+        except KeyError:
+            value = rendered[key] = get_formatter(fmt, tz)(now)
+            return value
+
+    def isotime(self):
+        """
+        当前的utc时间，iso8601格式，不带'Z'
+        """
+        now, _, rendered = self._tick()
+        try:
+            return rendered["iso"]
+        except KeyError:
+            value = rendered["iso"] = datetime.datetime.utcfromtimestamp(now).isoformat()
+            return value
+
+    def timestamp_str(self):
+        """
+        当前时间戳去掉小数点的字符串
+        """
+        now, _, rendered = self._tick()
+        try:
+            return rendered["timestamp"]
+        except KeyError:
+            value = rendered["timestamp"] = "".join(str(now).split("."))
+            return value
+
+
+_coarse_clock = [None]
+
+
+def enable_coarse_clock(resolution=0.001):
+    """
+    启用粗粒度时钟，之后getisotime、int2str()、int2day()、time_ago、day_begin_timestamp、
+    get_last_minute_timestamp、get_current_timestamp_str 在同一刻度内返回缓存的结果
+    :param resolution: 刻度，秒
+    :return: CoarseClock
+    """
+    clock = _coarse_clock[0] = CoarseClock(resolution)
+    return clock
+
+
+def disable_coarse_clock():
+    """
+    关闭粗粒度时钟，恢复每次读取系统时间
+    """
+    _coarse_clock[0] = None
+
+
+def _now():
+    """
+    当前时间戳，启用粗粒度时钟时取缓存的时间
+    """
+    clock = _coarse_clock[0]
+    if clock is None:
+        return time.time()
+    return clock.now()
+
 
 def add_time(data_time, days=0, hours=0, minutes=0, seconds=0):
     """
@@ -44,24 +913,7 @@ def time_format_string(date_time):
     :param date_time:
     :return:
     """
-    if re.match(r'^\d{4}-\d{2}-\d{2}$', date_time):
-        return '%Y-%m-%d'
-    elif re.match(r'^\d{4}-\d{2}$', date_time):
-        return '%Y-%m'
-    elif re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$', date_time):
-        return '%Y-%m-%d %H:%M'
-    elif re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$', date_time):
-        return '%Y-%m-%d %H:%M:%S'
-    elif re.match(r'^\d{8}$', date_time):
-        return '%Y%m%d'
-    elif re.match(r'^\d{10}$', date_time):
-        return '%Y%m%d%H'
-    elif re.match(r'^\d{12}$', date_time):
-        return '%Y%m%d%H%M'
-    elif re.match(r'^\d{14}$', date_time):
-        return '%Y%m%d%H%M%S'
-    else:
-        raise "Does not recognize the format"
+    return _date_parser.time_format(date_time)
 
 
 def int2hms(seconds, flag=True):
@@ -103,6 +955,147 @@ def time_interval(st, et=""):
             return int(div / DAY_STEP)
 
 
+@lru_cache(maxsize=8192)
+def druid_iso(value):
+    """
+    时间戳转换为druid使用的UTC iso时间，与int2iso(value)一致，按边界值缓存
+    :param value: 时间戳
+    :return: str，e.g. 2018-07-01T00:00:00.000Z
+    """
+    if not isinstance(value, int):
+        return int2iso(value)
+    days, seconds = divmod(value, DAY_STEP)
+    year, month, day = _civil_from_days(days)
+    return "%04d-%02d-%02dT%02d:%02d:%02d.000Z" % (
+        year, month, day, seconds // HOUR_STEP, seconds // MINUTE_STEP % 60, seconds % 60)
+
+
+def merge_intervals(intervals):
+    """
+    合并区间，重叠或首尾相接的区间合并为一个
+    :param intervals: 可迭代的 (开始时间, 结束时间)
+    :return: generator，按开始时间排序的最少区间
+    """
+    current = None
+    for start, end in sorted(intervals):
+        if current is None:
+            current = [start, end]
+        elif start <= current[1]:
+            current[1] = max(current[1], end)
+        else:
+            yield tuple(current)
+            current = [start, end]
+    if current is not None:
+        yield tuple(current)
+
+
+class DruidIntervalPlanner(object):
+    """
+    druid查询时间区间规划
+    把 [start, end) 按天或小时切分为桶，流式生成区间字符串，可合并相邻的桶，
+    也可把长时间范围均分成N段用于并发查询，区间边界的iso字符串经druid_iso缓存
+    """
+
+    def __init__(self, start, end, tp="day"):
+        """
+        :param start: 起始的时间，时间字符串或时间戳，例：2018-07-01
+        :param end: 结束时间，时间字符串或时间戳，例：2018-07-02
+        :param tp: day,按天，hour，按小时
+        """
+        if isinstance(start, str):
+            start = str2int(start)
+        if isinstance(end, str):
+            end = str2int(end)
+        if start > end:
+            raise DruidTimeError("start time must lt end time")
+        if tp == "day":
+            self.step = DAY_STEP
+        elif tp == "hour":
+            self.step = HOUR_STEP
+        else:
+            self.step = 0
+        self.start = start
+        self.end = end + self.step if start == end else end
+
+    def _check_step(self):
+        if not self.step:
+            raise DruidTimeError("tp must be day or hour")
+
+    def __len__(self):
+        """
+        桶的数量
+        """
+        self._check_step()
+        return -((self.start - self.end) // self.step)
+
+    @staticmethod
+    def render(start, end):
+        return "%s/%s" % (druid_iso(start), druid_iso(end))
+
+    def interval(self):
+        """
+        整个时间范围的单一区间
+        """
+        return self.render(self.start, self.end)
+
+    def buckets(self):
+        """
+        :return: generator，每个桶的 (开始时间, 结束时间)
+        """
+        self._check_step()
+        start, step = self.start, self.step
+        for _ in range(len(self)):
+            yield start, start + step
+            start += step
+
+    def intervals(self):
+        """
+        :return: generator，每个桶的区间字符串，相邻桶共用的边界只转换一次
+        """
+        previous = None
+        for start, end in self.buckets():
+            if previous is None:
+                previous = druid_iso(start)
+            current = druid_iso(end)
+            yield "%s/%s" % (previous, current)
+            previous = current
+
+    def chunks(self, n):
+        """
+        把时间范围按桶均分为最多n段，用于并发查询，各段桶数相差不超过1
+        :param n: 段数
+        :return: generator，区间字符串
+        """
+        self._check_step()
+        if n < 1:
+            raise DruidTimeError("chunk number must be positive")
+        size, more = divmod(len(self), n)
+        start = self.start
+        for i in range(n):
+            count = size + (i < more)
+            if not count:
+                break
+            end = start + count * self.step
+            yield self.render(start, end)
+            start = end
+
+    def merged(self, values):
+        """
+        把一组时间点所在的桶合并成最少的区间，例如只重新查询缺数据的小时
+        :param values: 可迭代的时间戳，超出时间范围的忽略
+        :return: generator，区间字符串
+        """
+        self._check_step()
+        start, step, end = self.start, self.step, self.end
+        buckets = set()
+        for value in values:
+            if start <= value < end:
+                bucket = start + (value - start) // step * step
+                buckets.add((bucket, bucket + step))
+        for interval in merge_intervals(buckets):
+            yield self.render(*interval)
+
+
 def druid_time(start, end, tp="day", res_tp="list"):
     """
     获取druid时间
@@ -114,41 +1107,15 @@ def druid_time(start, end, tp="day", res_tp="list"):
     :return:
     """
     if not isinstance(start, str) and not isinstance(end, str):
-        raise "start and end must str"
-    else:
-        start = str2int(start)
-        end = str2int(end)
-
-    if start > end:
-        raise "start time must gt end time"
-
-    print(start,end,"+=====")
-    if tp == "day":
-        step = DAY_STEP
-    elif tp == "hour":
-        step = HOUR_STEP
-    else:
-        step = 0
-
-    start_value = start
-    if start == end:
-        end_value = end + step
-    else:
-        end_value = end
+        raise DruidTimeError("start and end must str")
 
+    planner = DruidIntervalPlanner(start, end, tp)
     if res_tp == "list":
-        res = []
-        while start_value < end_value:
-            s1 = int2iso(start_value)
-            start_value += step
-            s2 = int2iso(start_value)
-            res.append("%s/%s" % (s1, s2))
+        res = list(planner.intervals())
     elif res_tp == "one":
-        s1 = int2iso(start_value)
-        s2 = int2iso(end_value)
-        res = "%s/%s" % (s1, s2)
+        res = planner.interval()
     else:
-        raise "return type error"
+        raise DruidTimeError("return type error")
     return res
 
 
@@ -166,16 +1133,20 @@ def day_timestamp(t=None, tp="float"):
     return int(str2int(int2day(t)))
 
 
-def int2day(value=0, days=0, hours=0, minutes=0, fmt="-"):
+def int2day(value=0, days=0, hours=0, minutes=0, fmt="-", tz=None):
     """
     将时间戳改为 日期格式
+    :param tz: 时区名，默认使用进程时区
     """
     fmt_str = fmt.join(["%Y", "%m", "%d"])
     if value:
         value = value + days * DAY_STEP + hours * HOUR_STEP + minutes * MINUTE_STEP
     else:
-        value = time.time() + days * DAY_STEP + hours * HOUR_STEP + minutes * MINUTE_STEP
-    return time.strftime(fmt_str, time.localtime(value))
+        clock = _coarse_clock[0]
+        if clock is not None and not (days or hours or minutes):
+            return clock.format(fmt_str, tz)
+        value = _now() + days * DAY_STEP + hours * HOUR_STEP + minutes * MINUTE_STEP
+    return get_formatter(fmt_str, tz)(value)
 
 def int2hour(value=0, days=0, hours=0, minutes=0, fmt="-"):
     pass
@@ -193,7 +1164,7 @@ def time_ago(value=0, days=0, hours=0, minutes=0, seconds=0):
     if value:
         value = value + days * DAY_STEP + hours * HOUR_STEP + minutes * MINUTE_STEP + seconds
     else:
-        value = time.time() + days * DAY_STEP + hours * HOUR_STEP + minutes * MINUTE_STEP
+        value = _now() + days * DAY_STEP + hours * HOUR_STEP + minutes * MINUTE_STEP
     return value
 
 
@@ -209,20 +1180,17 @@ def get_time_gen(start, end, tp="str", unit="day", fmt="-", last=True):
     :return:
     """
     if unit == "day":
-        step = DAY_STEP
+        convert = int2day
     elif unit == "hour":
-        step = HOUR_STEP
+        convert = int2str
     else:
-        step = 0
+        return
 
-    while start <= end:
-        if start + step > end and not last:
-            break
-        if unit == "day":
-            yield int2day(start)
-        elif unit == "hour":
-            yield int2str(start)
-        start += step
+    time_range = TimeRange(start, end, 1, unit)
+    if not last:
+        time_range = time_range[:-1]
+    for value in time_range:
+        yield convert(value)
 
 
 def get_second(date):
@@ -231,19 +1199,25 @@ def get_second(date):
     :param date:
     :return:
     """
-    second = int(time.strftime("%S", time.localtime(date)))
+    second = calendar_table().clock(date)[2]
     return second
 
 
-def calc_date_difference(first_date, second_date):
+def calc_date_difference(first_date, second_date, calendar=None):
     """
     计算日期之差，add Robin 2016-11-01
     :param first_date:  第一个日期
     :param second_date: 第二天日期
+    :param calendar: BusinessCalendar，指定时只统计工作日
     :return:    int，返回两个日期之差
     """
     diff_day = 0
     try:
+        if calendar is not None:
+            diff_day = calendar.business_days_between(first_date, second_date)
+            if diff_day < 0:
+                first_date, second_date, diff_day = second_date, first_date, -diff_day
+            return diff_day + calendar.is_business_day(second_date)
         if isinstance(first_date, int):
             st = first_date
         elif isinstance(first_date, str):
@@ -259,16 +1233,19 @@ def calc_date_difference(first_date, second_date):
     return diff_day
 
 
-def add_day(data_time, num=0):
+def add_day(data_time, num=0, calendar=None):
     """
     日期进行加减n天的处理，add Robin 2016-09-27
     :param data_time:   日期
     :param num: 增减的天数
+    :param calendar: BusinessCalendar，指定时按工作日加减
     :return: 返回原格式的日期
     """
     dt = data_time
     try:
-        if isinstance(data_time, (int, float)):
+        if calendar is not None:
+            dt = calendar.add_business_days(data_time, num)
+        elif isinstance(data_time, (int, float)):
             dt = data_time + DAY_STEP * num
         elif isinstance(data_time, str):
             dt = int2day(str2int(data_time) + DAY_STEP * num)
@@ -280,74 +1257,295 @@ def add_day(data_time, num=0):
 
 
 
+# todo  -------------- 工作日 start --------------
+class BusinessCalendar(object):
+    """
+    工作日日历
+    按天预先计算是否为工作日的位图，以及工作日数量的前缀和，
+    判断工作日、统计两个日期之间的工作日数、加减n个工作日都是O(1)，批量接口使用同一份索引
+    """
+
+    def __init__(self, holidays=(), weekends=(6, 0), workdays=(), tz=None,
+                 start_year=CALENDAR_START_YEAR, end_year=CALENDAR_END_YEAR):
+        """
+        :param holidays: 节假日，日期字符串、时间戳、date或datetime
+        :param weekends: 周末是星期几，0为周日，与get_week一致
+        :param workdays: 需要上班的周末(调休)，格式同holidays
+        :param tz: 时区名，时间戳按该时区的日期计算，默认使用进程时区
+        :param start_year: 日历开始年份
+        :param end_year: 日历结束年份(包含)
+        """
+        self.tz = tz
+        self.weekends = frozenset(weekends)
+        self.first_day = _days_from_civil(start_year, 1, 1)
+        self.size = _days_from_civil(end_year + 1, 1, 1) - self.first_day
+        # 位图：1为工作日
+        bitmap = bytearray(self.size)
+        for i in range(self.size):
+            bitmap[i] = (self.first_day + i + 4) % 7 not in self.weekends
+        for value in holidays:
+            i = self._index(value)[0]
+            if 0 <= i < self.size:
+                bitmap[i] = 0
+        for value in workdays:
+            i = self._index(value)[0]
+            if 0 <= i < self.size:
+                bitmap[i] = 1
+        self.bitmap = bitmap
+        # prefix[i]为第i天之前的工作日数，positions[k]为第k个工作日的下标
+        prefix = array('q', [0]) * (self.size + 1)
+        positions = array('q')
+        total = 0
+        for i in range(self.size):
+            if bitmap[i]:
+                positions.append(i)
+                total += 1
+            prefix[i + 1] = total
+        self.prefix = prefix
+        self.positions = positions
+
+    def _index(self, value):
+        """
+        日期在日历中的下标
+        :return: (下标, 当天的 (时, 分, 秒))
+        """
+        if isinstance(value, datetime.datetime):
+            return (_days_from_civil(value.year, value.month, value.day) - self.first_day,
+                    (value.hour, value.minute, value.second))
+        if isinstance(value, datetime.date):
+            return _days_from_civil(value.year, value.month, value.day) - self.first_day, (0, 0, 0)
+        if isinstance(value, str):
+            year, month, day, hour, minute, second = _date_parser.fields(value)
+            return _days_from_civil(year, month, day) - self.first_day, (hour, minute, second)
+        parts = decompose(value, self.tz)
+        return (_days_from_civil(parts.year, parts.month, parts.day) - self.first_day,
+                (parts.hour, parts.minute, parts.second))
+
+    def _checked_index(self, value):
+        i, clock = self._index(value)
+        if not 0 <= i < self.size:
+            raise ValueError("date out of business calendar range: %r" % (value,))
+        return i, clock
+
+    def _restore(self, value, i, clock):
+        """
+        把日历下标还原为与value相同类型的日期，保留原来的时分秒
+        """
+        year, month, day = _civil_from_days(self.first_day + i)
+        if isinstance(value, datetime.datetime):
+            return value.replace(year=year, month=month, day=day)
+        if isinstance(value, datetime.date):
+            return value.replace(year=year, month=month, day=day)
+        if isinstance(value, str):
+            return datetime.datetime(year, month, day, *clock).strftime(time_format_string(value))
+        naive = (self.first_day + i) * DAY_STEP + clock[0] * HOUR_STEP + clock[1] * MINUTE_STEP + clock[2]
+        if self.tz is not None:
+            return get_timezone(self.tz).timestamp(naive)
+        return _local2timestamp(year, month, day, *clock)
+
+    def is_business_day(self, value):
+        """
+        是否为工作日
+        """
+        return bool(self.bitmap[self._checked_index(value)[0]])
+
+    def business_days_between(self, start, end):
+        """
+        两个日期之间的工作日数，包含start当天，不包含end当天，end早于start时为负数
+        """
+        return self.prefix[self._checked_index(end)[0]] - self.prefix[self._checked_index(start)[0]]
+
+    def add_business_days(self, value, n):
+        """
+        加减n个工作日，value不是工作日时先顺延到下一个工作日
+        :return: 与value相同类型的日期，时间戳和带时间的日期保留原来的时分秒
+        """
+        i, clock = self._checked_index(value)
+        k = self.prefix[i] + n
+        if not 0 <= k < len(self.positions):
+            raise ValueError("business day out of calendar range: %r + %d" % (value, n))
+        return self._restore(value, self.positions[k], clock)
+
+    def _index_many(self, values):
+        """
+        时间戳批量转换为日历下标和当天的秒数
+        """
+        ts, _ = _timestamp_array(values)
+        local = ts + _utc_offsets_tz(ts, self.tz)
+        days, seconds = np.divmod(local, DAY_STEP)
+        index = days - self.first_day
+        if len(index) and (index.min() < 0 or index.max() >= self.size):
+            raise ValueError("date out of business calendar range")
+        return index, seconds
+
+    def is_business_day_many(self, values):
+        """
+        批量判断时间戳是否为工作日
+        :return: bool数组
+        """
+        if np is None:
+            return [self.is_business_day(v) for v in values]
+        return np.frombuffer(self.bitmap, dtype=np.uint8)[self._index_many(values)[0]].astype(bool)
+
+    def business_days_between_many(self, starts, ends):
+        """
+        批量统计时间戳之间的工作日数，规则同business_days_between
+        :return: int64数组
+        """
+        if np is None:
+            return [self.business_days_between(s, e) for s, e in zip(starts, ends)]
+        prefix = np.frombuffer(self.prefix, dtype=np.int64)
+        return prefix[self._index_many(ends)[0]] - prefix[self._index_many(starts)[0]]
+
+    def add_business_days_many(self, values, n):
+        """
+        批量加减工作日，规则同add_business_days
+        :param n: 整数或与values等长的整数数组
+        :return: 时间戳int64数组，保留原来的时分秒
+        """
+        if np is None:
+            return [self.add_business_days(v, n) for v in values]
+        index, seconds = self._index_many(values)
+        k = np.frombuffer(self.prefix, dtype=np.int64)[index] + np.asarray(n, dtype=np.int64)
+        if len(k) and (k.min() < 0 or k.max() >= len(self.positions)):
+            raise ValueError("business day out of calendar range")
+        naive = (np.frombuffer(self.positions, dtype=np.int64)[k] + self.first_day) * DAY_STEP + seconds
+        if self.tz is not None:
+            return get_timezone(self.tz).timestamp_many(naive)
+        return _local2timestamp_many(naive)
+# todo  -------------- 工作日 stop --------------
+
+
 def getisotime(z="Z"):
     """
     获取iso8601格式的时间
     :param z: 时间结尾是否带'Z'
     :return: str
     """
-    iso_time = datetime.datetime.utcnow().isoformat()
+    clock = _coarse_clock[0]
+    iso_time = clock.isotime() if clock is not None else datetime.datetime.utcnow().isoformat()
     return iso_time + "Z" if z == "Z" else iso_time
 
 
-def iso2str(s, h=8, fmt='%Y-%m-%d %H:%M:%S'):
+def parse_iso(s):
+    """
+    解析iso8601时间，直接读取各字段的数字，不经过datetime和字符串往返
+    :param s: iso8601时间，str，或bytes、bytearray、memoryview等缓冲区切片
+    :return: (年, 月, 日, 时, 分, 秒, UTC偏移秒数)，不带时区时偏移为None，秒以下的部分舍去
+    """
+    m = (_ISO_REGEX if isinstance(s, str) else _ISO_REGEX_BYTES).fullmatch(s)
+    if m is None:
+        raise TimeFormatError("Does not recognize the iso8601 format: %r" % (s,))
+    year, month_dash, month, day_dash, day, hour, minute, second, zone, sign, zone_hour, zone_minute = m.groups()
+    year = int(year)
+    month = int(month_dash or month or 1)
+    day = int(day_dash or day or 1)
+    hour = int(hour or 0)
+    minute = int(minute or 0)
+    second = int(second or 0)
+    offset = None
+    if zone is not None:
+        offset = 0
+        if sign is not None:
+            offset = int(zone_hour) * HOUR_STEP + int(zone_minute or 0) * MINUTE_STEP
+            if sign in ('-', b'-'):
+                offset = -offset
+    if year < 1 or not 1 <= month <= 12 or not 1 <= day <= _month_days(year, month) or hour > 23 \
+            or minute > 59 or second > 59 or (offset is not None and abs(offset) >= DAY_STEP):
+        raise TimeFormatError("Time value out of range: %r" % (s,))
+    return year, month, day, hour, minute, second, offset
+
+
+def _iso2local(s, h):
+    """
+    取iso8601时间字符串上的日期时间(忽略其中的时区)，按进程时区转为时间戳后加h小时
+    """
+    return _local2timestamp(*parse_iso(s)[:6]) + 3600 * h
+
+
+def _iso2zone(s, tz):
+    """
+    iso8601时间转换为时间戳，带时区的按其中的时区，不带时区的按tz时区的本地时间处理，舍去秒以下的部分
+    """
+    table = get_timezone(tz)
+    year, month, day, hour, minute, second, offset = parse_iso(s)
+    naive = _days_from_civil(year, month, day) * DAY_STEP + hour * HOUR_STEP + minute * MINUTE_STEP + second
+    if offset is None:
+        return table.timestamp(naive)
+    return naive - offset
+
+
+def iso2str(s, h=8, fmt='%Y-%m-%d %H:%M:%S', tz=None):
     """
     将iso8601格式的时间格式化
     :param s: iso8601时间，e.g. 2016-05-09T20:38:22.450686Z, 2016-05-09T20:38:22+00:00
     :param h: 正负整数，各地区时间差异的小时数，默认为+8得到中国默认时区
     :param fmt: Y-m-d H:M:S
+    :param tz: 时区名，例：Asia/Shanghai，指定时按字符串中的时区换算到该时区(不带时区的视为该时区的时间)，忽略h
     :return:    str
     """
-    t = iso8601.parse_date(s).strftime('%Y-%m-%d %H:%M:%S')
-    ft = int2str(str2int(t) + 3600 * h, fmt)
-    return ft
+    if tz is not None:
+        return get_timezone(tz).strftime(fmt, _iso2zone(s, tz))
+    return int2str(_iso2local(s, h), fmt)
 
 
-def iso2day(s, h=8):
+def iso2day(s, h=8, tz=None):
     """
     将iso8601格式的时间格式化为Y-m-d格式的日期
     :param s: iso8601时间，e.g. 2016-05-09T20:38:22.450686Z, 2016-05-09T20:38:22+00:00
     :param h: 正负整数，各地区时间差异的小时数，默认为+8得到中国默认时区
+    :param tz: 时区名，指定时按字符串中的时区换算到该时区，忽略h
     :return:    str
     """
-    fmt = '%Y-%m-%d %H:%M:%S'
-    t = iso8601.parse_date(s).strftime(fmt)
-
-    ft = int2day(str2int(t) + 3600 * h)
-    return ft
+    if tz is not None:
+        return iso2str(s, fmt='%Y-%m-%d', tz=tz)
+    return int2day(_iso2local(s, h))
 
-def iso2hour(s, h=8):
+def iso2hour(s, h=8, tz=None):
     """
     将iso8601格式的时间格式化为Y-m-d H:00:00格式的日期
     :param s: iso8601时间，e.g. 2016-05-09T20:38:22.450686Z, 2016-05-09T20:38:22+00:00
     :param h: 正负整数，各地区时间差异的小时数，默认为+8得到中国默认时区
+    :param tz: 时区名，指定时按字符串中的时区换算到该时区，忽略h
     :return:    str
     """
-    fmt = '%Y-%m-%d %H:%M:%S'
-    t = iso8601.parse_date(s).strftime(fmt)
-
-    ft = int2str(str2int(t) + 3600 * h)
-    return ft
+    if tz is not None:
+        return iso2str(s, tz=tz)
+    return int2str(_iso2local(s, h))
 
-def iso2timestamp(s, h=8):
+def iso2timestamp(s, h=8, tz=None):
     """
      将iso8601格式的时间转为时间戳
     :param s: iso8601时间，e.g. 2016-05-09T20:38:22.450686Z, 2016-05-09T20:38:22+00:00
     :param h: 正负整数，各地区时间差异的小时数，默认为+8得到中国默认时区
+    :param tz: 时区名，指定时按字符串中的时区得到准确的时间戳，不带时区的按tz时区的本地时间处理，与进程时区和h无关
+        时区名不存在时抛出TimeZoneError
     :return:  int
     """
-    return str2int(iso2str(s, h)) if s else 0
+    if tz is not None:
+        table = get_timezone(tz)
+        return _iso2zone(s, table) if s else 0
+    if not s:
+        return 0
+    return _iso2local(s, h)
 
 
-def int2iso(v, z='Z', convert_to_utc=True):
+def int2iso(v, z='Z', convert_to_utc=True, tz=None):
     """
     时间戳直接转换为iso时间
     :param v: 时间戳，e.g. 1462948788
     :param z: 时间结尾是否带'Z'
     :param convert_to_utc: 是否转化为utc时间
+    :param tz: 时区名，不转化为utc时间时使用该时区，默认使用进程时区
     :return: str
     """
-    t = datetime.datetime.fromtimestamp(v)
+    if v % 1 == 0 and _ISO_MIN_SECONDS <= v <= _ISO_MAX_SECONDS:
+        t = get_formatter('%Y-%m-%dT%H:%M:%S', "UTC" if convert_to_utc else tz)(v)
+        return t + ".000Z" if z == "Z" else t + ".000"
+    if tz is not None and not convert_to_utc:
+        t = datetime.datetime.fromtimestamp(v, get_timezone(tz).zone).replace(tzinfo=None)
+    else:
+        t = datetime.datetime.fromtimestamp(v)
     if convert_to_utc:
         t = datetime.datetime.utcfromtimestamp(v)
     return t.isoformat() + ".000Z" if z == "Z" else t.isoformat() + ".000"
@@ -364,41 +1562,39 @@ def str2iso(s, z='Z', convert_to_utc=True):
     return int2iso(str2int(s), z, convert_to_utc)
 
 
-def datetime2timestamp(dt, h=-8, convert_to_utc=False):
+def datetime2timestamp(dt, h=-8, convert_to_utc=False, tz=None):
     """
     将datetime转换为iso时间
     :param dt: datetime
     :param h: 正负整数，各地区时间差异的小时数，默认为-8得到中国默认时区
     :param convert_to_utc: 是否转化为utc时间
+    :param tz: 时区名，不带时区的dt视为该时区的时间换算为utc，忽略h
     :return:
     """
     if isinstance(dt, datetime.datetime):
-        if convert_to_utc:
+        if convert_to_utc and tz is not None:
+            table = get_timezone(tz)
+            if dt.tzinfo is None:
+                naive = _days_from_civil(dt.year, dt.month, dt.day) * DAY_STEP + \
+                        dt.hour * HOUR_STEP + dt.minute * MINUTE_STEP + dt.second
+                offset = naive - table.timestamp(naive)
+            else:
+                offset = int(dt.utcoffset().total_seconds())
+            dt = dt.replace(tzinfo=None) - datetime.timedelta(seconds=offset)
+        elif convert_to_utc:
             dt = dt + datetime.timedelta(hours=h)  # 中国默认时区
     return dt.isoformat()
 
 
-def str2int(s):
+def str2int(s, tz=None):
     """将常用时间格式字符串转为时间戳，支持时间格式有限
+    :param tz: 时区名，默认使用进程时区
     """
-    if re.match(r'^\d{4}-\d{2}-\d{2}$', s):
-        return int(time.mktime(time.strptime(s, '%Y-%m-%d')))
-    elif re.match(r'^\d{4}-\d{2}$', s):
-        return int(time.mktime(time.strptime(s, '%Y-%m')))
-    elif re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$', s):
-        return int(time.mktime(time.strptime(s, '%Y-%m-%d %H:%M')))
-    elif re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$', s):
-        return int(time.mktime(time.strptime(s, '%Y-%m-%d %H:%M:%S')))
-    elif re.match(r'^\d{8}$', s):
-        return int(time.mktime(time.strptime(s, '%Y%m%d')))
-    elif re.match(r'^\d{10}$', s):
-        return int(time.mktime(time.strptime(s, '%Y%m%d%H')))
-    elif re.match(r'^\d{12}$', s):
-        return int(time.mktime(time.strptime(s, '%Y%m%d%H%M')))
-    elif re.match(r'^\d{14}$', s):
-        return int(time.mktime(time.strptime(s, '%Y%m%d%H%M%S')))
-    else:
-        raise "Does not recognize the format"
+    if tz is not None:
+        year, month, day, hour, minute, second = _date_parser.fields(s)
+        naive = _days_from_civil(year, month, day) * DAY_STEP + hour * HOUR_STEP + minute * MINUTE_STEP + second
+        return get_timezone(tz).timestamp(naive)
+    return _date_parser.timestamp(s)
 
 
 def utc_datetime2timestamp(utc_s):
@@ -407,39 +1603,23 @@ def utc_datetime2timestamp(utc_s):
     :param utc_s: string utc时间字符串
     :return: int
     """
-    s = utc_s[:19]
-    if re.match(r'^\d{4}-\d{2}-\d{2}$', s):
-        ret = int(time.mktime(time.strptime(s, '%Y-%m-%d')))
-    elif re.match(r'^\d{4}-\d{2}$', s):
-        ret = int(time.mktime(time.strptime(s, '%Y-%m')))
-    elif re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$', s):
-        ret = int(time.mktime(time.strptime(s, '%Y-%m-%d %H:%M')))
-    elif re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$', s):
-        ret = int(time.mktime(time.strptime(s, '%Y-%m-%d %H:%M:%S')))
-    elif re.match(r'^\d{8}$', s):
-        ret = int(time.mktime(time.strptime(s, '%Y%m%d')))
-    elif re.match(r'^\d{10}$', s):
-        ret = int(time.mktime(time.strptime(s, '%Y%m%d%H')))
-    elif re.match(r'^\d{12}$', s):
-        ret = int(time.mktime(time.strptime(s, '%Y%m%d%H%M')))
-    elif re.match(r'^\d{14}$', s):
-        ret = int(time.mktime(time.strptime(s, '%Y%m%d%H%M%S')))
-    elif re.match(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$', s):
-        ret = int(time.mktime(time.strptime(s, '%Y-%m-%dT%H:%M:%S')))
-    else:
-        raise "Does not recognize the format"
+    ret = _utc_date_parser.timestamp(utc_s[:19])
     if ret > 0:
         ret -= time.timezone
     return ret
 
 
-def int2str(t=None, fmt='%Y-%m-%d %H:%M:%S'):
+def int2str(t=None, fmt='%Y-%m-%d %H:%M:%S', tz=None):
     """
     将时间戳改为指定格式的字符串
+    :param tz: 时区名，默认使用进程时区
     """
     if not t:
+        clock = _coarse_clock[0]
+        if clock is not None:
+            return clock.format(fmt, tz)
         t = time.time()
-    return time.strftime(fmt, time.localtime(t))
+    return get_formatter(fmt, tz)(t)
 
 # def int2str(t=None, fmt=' '):
 #     """
@@ -451,15 +1631,167 @@ def int2str(t=None, fmt='%Y-%m-%d %H:%M:%S'):
 #     return time.strftime(fmt_str, time.localtime(t))
 
 
-def int2dayint(value):
+def int2dayint(value, tz=None):
     """
     将时间戳改为 日期格式
-    """
-    format = '%Y%m%d'
-    return int(time.strftime(format, time.localtime(value)))
-
-
-def timestamp_by_step(start_time, end_time, step=86400, check=True, point=max_point, returnType=0,
+    :param tz: 时区名，默认使用进程时区
+    """
+    return int(get_formatter('%Y%m%d', tz)(value))
+
+
+class TimeRange(Sequence):
+    """
+    惰性的时间序列：从start开始按步长取点，直到end(包含end)
+    不生成列表，len、下标、切片、in 都是O(1)，只在迭代或导出时才计算具体的时间点
+    按月、季、年取点时保持start的日期和时分秒，日期超出当月天数时取当月最后一天
+    """
+    __slots__ = ('start', 'unit', '_offsets', '_anchor', '_scale')
+
+    def __init__(self, start, end, step=1, unit="second"):
+        """
+        :param start: 开始时间，时间戳或时间字符串
+        :param end: 结束时间，时间戳或时间字符串
+        :param step: 步长，正数，按月、季、年取点时为正整数
+        :param unit: 步长单位，second、minute、hour、day、week、month、season、year
+        """
+        if not step > 0:
+            raise ValueError("TimeRange step must be positive")
+        if isinstance(start, str):
+            start = str2int(start)
+        if isinstance(end, str):
+            end = str2int(end)
+        scale = 1
+        if unit in RANGE_SECOND_UNITS:
+            size = step * RANGE_SECOND_UNITS[unit]
+            anchor = None
+            if size % 1:
+                # 非整数步长：偏移量为点的序号，时间点为 start + 序号 * 步长
+                scale, size = size, 1
+                count = int((end - start) / scale) + 1 if start <= end else 0
+                while start + count * scale <= end:
+                    count += 1
+                while count and start + (count - 1) * scale > end:
+                    count -= 1
+            else:
+                size = int(size)
+                count = int((end - start) // size) + 1 if start <= end else 0
+        elif unit in RANGE_MONTH_UNITS:
+            if step % 1:
+                raise ValueError("TimeRange step must be an integer for unit %r" % unit)
+            size = int(step) * RANGE_MONTH_UNITS[unit]
+            parts = decompose(start)
+            anchor = (parts.year * 12 + parts.month - 1, parts.day, parts.hour, parts.minute, parts.second)
+            count = 0
+            if start <= end:
+                end_parts = decompose(end)
+                count = (end_parts.year * 12 + end_parts.month - 1 - anchor[0]) // size + 1
+        else:
+            raise ValueError("TimeRange unit error: %r" % unit)
+        self.start = start
+        self.unit = unit
+        self._anchor = anchor
+        self._scale = scale
+        self._offsets = range(0, count * size, size)
+        if anchor is not None and count and self._point(self._offsets[-1]) > end:
+            self._offsets = self._offsets[:-1]
+
+    @classmethod
+    def _derive(cls, time_range, offsets):
+        obj = cls.__new__(cls)
+        obj.start = time_range.start
+        obj.unit = time_range.unit
+        obj._anchor = time_range._anchor
+        obj._scale = time_range._scale
+        obj._offsets = offsets
+        return obj
+
+    def _point(self, offset):
+        """
+        偏移量(秒数或月数)对应的时间戳
+        """
+        if self._anchor is None:
+            return self.start + offset * self._scale if self._scale != 1 and offset else self.start + offset
+        month_index, day, hour, minute, second = self._anchor
+        year, month = divmod(month_index + offset, 12)
+        month += 1
+        return _local2timestamp(year, month, min(day, _month_days(year, month)), hour, minute, second)
+
+    def _offset(self, value):
+        """
+        时间戳对应的偏移量，不在序列中时返回None
+        """
+        if self._anchor is None:
+            offset = (value - self.start) / self._scale if self._scale != 1 else value - self.start
+            if offset != offset // 1:
+                return None
+            offset = int(offset)
+        else:
+            parts = decompose(value)
+            offset = parts.year * 12 + parts.month - 1 - self._anchor[0]
+        if offset in self._offsets and (self._anchor is None and self._scale == 1 or self._point(offset) == value):
+            return offset
+        return None
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self._derive(self, self._offsets[item])
+        return self._point(self._offsets[item])
+
+    def __contains__(self, value):
+        try:
+            return self._offset(value) is not None
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        point = self._point
+        for offset in self._offsets:
+            yield point(offset)
+
+    def __reversed__(self):
+        point = self._point
+        for offset in reversed(self._offsets):
+            yield point(offset)
+
+    def __repr__(self):
+        return "TimeRange(%s, len=%d, unit=%r)" % (self[0] if self else self.start, len(self), self.unit)
+
+    def index(self, value, *args):
+        offset = self._offset(value)
+        if offset is None:
+            raise ValueError("%r is not in TimeRange" % value)
+        return self._offsets.index(offset)
+
+    def count(self, value):
+        return int(value in self)
+
+    def to_array(self):
+        """
+        导出为紧凑的 array('q')，时间戳按整数秒处理
+        """
+        if self._anchor is None and self._scale == 1 and isinstance(self.start, int):
+            return array('q', range(self.start + self._offsets.start, self.start + self._offsets.stop,
+                                    self._offsets.step))
+        return array('q', (int(v) for v in self))
+
+    def to_numpy(self):
+        """
+        导出为int64的numpy数组，按月取点时批量计算
+        """
+        offsets = np.arange(self._offsets.start, self._offsets.stop, self._offsets.step, dtype=np.int64)
+        if self._anchor is None:
+            if self._scale != 1:
+                return (offsets * self._scale + self.start).astype(np.int64)
+            return offsets + np.int64(self.start // 1)
+        month_index, day, hour, minute, second = self._anchor
+        days = _month_index_days(offsets + month_index, day)
+        return _local2timestamp_many(days * DAY_STEP + hour * HOUR_STEP + minute * MINUTE_STEP + second)
+
+
+def timestamp_by_step(start_time, end_time, step=86400, check=True, point=None, returnType=0,
                       formatStyle="%Y-%m-%d"):
     """
     获取时间列表，增加返回日期字符串形式的时间列表，edit Robin 2017-07-24
@@ -467,14 +1799,13 @@ def timestamp_by_step(start_time, end_time, step=86400, check=True, point=max_po
     @end_time : 结束时间，时间戳
     @step : 时间间隔  单位为秒，整型
     @check : 校验开始时间和结束时间，是否恰好是step的倍数，如果不是，则必须向前或者向后推到step的整数倍时间
-    @point : 事件列表的最大元素数量
+    @point : 事件列表的最大元素数量，默认不限制；不需要列表时直接使用TimeRange
     return list 时间列表  时间戳
     """
     if isinstance(start_time, str):
         start_time = str2int(start_time)
     if isinstance(end_time, str):
         end_time = str2int(end_time)
-    point = point > max_point and max_point or point
     mo = start_time % DAY_STEP
     mo_2 = end_time % DAY_STEP
     if check:
@@ -487,18 +1818,12 @@ def timestamp_by_step(start_time, end_time, step=86400, check=True, point=max_po
             end_time = end_time + (step - end_more)
         start_time = start_time + mo
         end_time = end_time + mo_2
-    time_list = []
-    for i in range(point):
-        if start_time > end_time:
-            break
-        time_list.append(start_time)
-        start_time = start_time + step
+    time_range = TimeRange(start_time, end_time, step)
+    if point is not None:
+        time_range = time_range[:max(point, 0)]
     if returnType:
-        new_time_list = []
-        for i in time_list:
-            new_time_list.append(int2str(i, format=formatStyle))
-        time_list = new_time_list
-    return time_list
+        return [int2str(i, fmt=formatStyle) for i in time_range]
+    return list(time_range)
 
 
 def take_time_list(int_start, int_end, setp, flag=True):
@@ -508,16 +1833,12 @@ def take_time_list(int_start, int_end, setp, flag=True):
     @end_time 结束时间的时间戳
     return  返回年份的时间列表,list中是整型
     """
-    list_time = []
-    if int_start < int_end:
-        int_time = int_start
-
-        while int_time <= int_end:
-            list_time.append(int_time)
-            int_time += setp
-            if not flag and int_time == int_end:
-                break
-    return list_time
+    if int_start >= int_end:
+        return []
+    time_range = TimeRange(int_start, int_end, setp)
+    if not flag and time_range[-1] == int_end:
+        time_range = time_range[:-1]
+    return list(time_range)
 
 
 def get_year(value):
@@ -525,7 +1846,7 @@ def get_year(value):
     获取年份
     @value:时间戳
     """
-    return int(time.strftime('%Y', time.localtime(value)))
+    return calendar_table().year(value)
 
 
 def get_month(value):
@@ -533,7 +1854,7 @@ def get_month(value):
     获取月份
     @value:时间戳
     """
-    return int(time.strftime('%m', time.localtime(value)))
+    return calendar_table().month(value)
 
 
 def get_day(value):
@@ -541,7 +1862,7 @@ def get_day(value):
     获取日期
     @value:时间戳
     """
-    return int(time.strftime('%d', time.localtime(value)))
+    return calendar_table().day(value)
 
 
 def get_hour(value):
@@ -549,7 +1870,7 @@ def get_hour(value):
     获取小时
     @value:时间戳
     """
-    return int(time.strftime('%H', time.localtime(value)))
+    return calendar_table().clock(value)[0]
 
 
 def get_hour_minute(value):
@@ -557,7 +1878,8 @@ def get_hour_minute(value):
     获取时分
     @value:时间戳
     """
-    return time.strftime('%H:%M', time.localtime(value))
+    hour, minute, _ = calendar_table().clock(value)
+    return "%02d:%02d" % (hour, minute)
 
 
 def get_year_month(value):
@@ -565,7 +1887,8 @@ def get_year_month(value):
     获取年月
     @value:时间戳
     """
-    return time.strftime('%Y-%m', time.localtime(value))
+    year, month, _ = calendar_table().date(value)
+    return "%04d-%02d" % (year, month)
 
 
 def get_year_month_day(value):
@@ -573,7 +1896,7 @@ def get_year_month_day(value):
     获取年月
     @value:时间戳
     """
-    return time.strftime('%Y-%m-%d', time.localtime(value))
+    return "%04d-%02d-%02d" % calendar_table().date(value)
 
 
 def get_week(value):
@@ -581,7 +1904,7 @@ def get_week(value):
     获取value 是周几
     @value:时间戳
     """
-    return int(time.strftime('%w', time.localtime(value)))
+    return calendar_table().week(value)
 
 
 def get_days(year, month):
@@ -599,22 +1922,99 @@ def get_start_timestamp_season(year, season):
     获取某年某个季度的开始时间戳
     @season 1~4
     """
-    if season == 1:
-        return str2int(str(datetime.date(year, 1, 1)))
-    elif season == 2:
-        return str2int(str(datetime.date(year, 4, 1)))
-    elif season == 3:
-        return str2int(str(datetime.date(year, 7, 1)))
-    elif season == 4:
-        return str2int(str(datetime.date(year, 10, 1)))
+    if season in (1, 2, 3, 4):
+        return _local2timestamp(year, season * 3 - 2, 1, 0, 0, 0)
 
 
 def get_start_timestamp(value):
     """
     获取value所在天的0点0分0秒的时间戳
     """
-    day = int2day(value)
-    return str2int(day)
+    return decompose(value).day_start
+
+
+def _month_index_days(index, day):
+    """
+    月份下标(年*12+月-1)和日期转换为距离1970-01-01的天数，日期超出当月天数时取当月最后一天
+    index、day可以是整数或numpy数组
+    """
+    if np is not None and isinstance(index, np.ndarray):
+        year, month = np.divmod(index, 12)
+        month += 1
+        leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+        month_days = np.array(_MONTH_DAYS, dtype=np.int64)[month] + (leap & (month == 2))
+        return _days_from_civil_many(year, month, np.minimum(day, month_days))
+    year, month = divmod(index, 12)
+    month += 1
+    return _days_from_civil(year, month, min(day, _month_days(year, month)))
+
+
+def month_start(index, tz=None):
+    """
+    月份下标(年*12+月-1)对应月份1日0点的时间戳
+    :param index: 整数或numpy数组
+    :param tz: 时区名，默认使用进程时区
+    :return: 时间戳，数组输入时为int64数组
+    """
+    if np is not None and isinstance(index, np.ndarray):
+        naive = _month_index_days(index.astype(np.int64), 1) * DAY_STEP
+        if tz is not None:
+            return get_timezone(tz).timestamp_many(naive)
+        return _local2timestamp_many(naive)
+    if tz is not None:
+        return get_timezone(tz).timestamp(_month_index_days(index, 1) * DAY_STEP)
+    year, month = divmod(index, 12)
+    return _local2timestamp(year, month + 1, 1, 0, 0, 0)
+
+
+def shift_months(value, months=1, keep_time=True, tz=None):
+    """
+    时间戳按月加减，按 年*12+月 的下标整数运算，日期超出目标月天数时取当月最后一天
+    :param value: 时间戳，或时间戳list、numpy数组
+    :param months: 增减的月数，整数或与value等长的数组
+    :param keep_time: 是否保留时分秒，False时返回目标日期0点
+    :param tz: 时区名，默认使用进程时区
+    :return: 时间戳，数组输入时为int64数组
+    """
+    if isinstance(value, (list, tuple)) or np is not None and isinstance(value, np.ndarray):
+        if np is None:
+            if not isinstance(months, (list, tuple)):
+                months = [months] * len(value)
+            return [shift_months(v, m, keep_time, tz) for v, m in zip(value, months)]
+        ts, _ = _timestamp_array(value)
+        days, seconds = np.divmod(ts + _utc_offsets_tz(ts, tz), DAY_STEP)
+        year, month, day = _civil_from_days_many(days)
+        naive = _month_index_days(year * 12 + month - 1 + np.asarray(months, dtype=np.int64), day) * DAY_STEP
+        if keep_time:
+            naive += seconds
+        if tz is not None:
+            return get_timezone(tz).timestamp_many(naive)
+        return _local2timestamp_many(naive)
+    parts = decompose(value, tz)
+    clock = (parts.hour, parts.minute, parts.second) if keep_time else (0, 0, 0)
+    days = _month_index_days(parts.year * 12 + parts.month - 1 + months, parts.day)
+    if tz is not None:
+        return get_timezone(tz).timestamp(days * DAY_STEP + clock[0] * HOUR_STEP + clock[1] * MINUTE_STEP + clock[2])
+    year, month, day = _civil_from_days(days)
+    return _local2timestamp(year, month, day, *clock)
+
+
+def shift_seasons(value, seasons=1, keep_time=True, tz=None):
+    """
+    时间戳按季度加减，规则同shift_months
+    """
+    if isinstance(seasons, (list, tuple)):
+        return shift_months(value, [s * 3 for s in seasons], keep_time, tz)
+    return shift_months(value, seasons * 3, keep_time, tz)
+
+
+def shift_years(value, years=1, keep_time=True, tz=None):
+    """
+    时间戳按年加减，规则同shift_months，2月29日在非闰年取2月28日
+    """
+    if isinstance(years, (list, tuple)):
+        return shift_months(value, [y * 12 for y in years], keep_time, tz)
+    return shift_months(value, years * 12, keep_time, tz)
 
 
 def same_period_month(value, months=-1):
@@ -623,21 +2023,7 @@ def same_period_month(value, months=-1):
     @value 时间戳类型
     return 时间戳
     """
-    year = get_year(value)
-    month = get_month(value)
-    day = get_day(value)
-
-    new_month = year * 12 + month + months
-    new_year = new_month // 12
-    month = new_month % 12
-    if month == 0:
-        month = 12
-        new_year -= 1
-    max_day = get_days(new_year, month)
-    day = min(day, max_day)
-    date = str(datetime.date(new_year, month, day))
-    new_value = int(time.mktime(time.strptime(date, '%Y-%m-%d')))
-    return new_value
+    return shift_months(value, months, keep_time=False)
 
 
 def get_season_by_int(value):
@@ -645,9 +2031,7 @@ def get_season_by_int(value):
     获取季度信息
     @value 时间戳
     """
-    month = get_month(value)
-    season = get_season(month)
-    return season
+    return decompose(value).season
 
 
 def get_season(month):
@@ -668,50 +2052,44 @@ def get_season(month):
 
 
 def get_week_list(int_start, int_end):
+    """
+    获取int_start到int_end之间按天取点(保留int_start的时分秒)落在周一的时间戳列表
+    每7天只检查对齐的点及其前后一天，兼容夏令时切换导致的星期偏移
+    """
     list_time = []
-    while int_start <= int_end:
-        if int(time.strftime('%w', time.localtime(int_start))) == 1:
-            # if int_start%7 == 1:
-            # str_time = time.strftime('%Y-%m-%d',time.localtime(int_start))
-            # list_time.append(str_time)
-            list_time.append(int_start)
-        int_start += 86400
-    return sorted(list_time)
+    if int_start > int_end:
+        return list_time
+    first = int_start + (1 - get_week(int_start)) % 7 * DAY_STEP
+    for aligned in TimeRange(first, int_end + DAY_STEP, 7, "day"):
+        for value in (aligned - DAY_STEP, aligned, aligned + DAY_STEP):
+            if int_start <= value <= int_end and get_week(value) == 1:
+                list_time.append(value)
+    return list_time
 
 
-def get_month_list(start_time, end_time=int(time.time()), fmt=''):
+def get_month_list(start_time, end_time=None, fmt=''):
     """
     返回start_time 到 end_time之间的月份列表
     @start_time 开始时间，int型
-    @end_time 结束时间，int型
+    @end_time 结束时间，int型，默认为调用时的当前时间
     return 月份列表，datetime类型，非时间戳
     """
-    month_list = []
+    if end_time is None:
+        end_time = int(_now())
     if isinstance(start_time, str):
         start_time = str2int(start_time)
     if isinstance(end_time, str):
         end_time = str2int(end_time)
-    start_year = get_year(start_time)
-    start_month = get_month(start_time)
-    end_year = get_year(end_time)
-    end_month = get_month(end_time)
-    while True:
-        if start_month > 12:
-            start_month = 1
-            start_year += 1
-        if start_year > end_year:
-            break
-        if start_year == end_year:
-            if start_month > end_month:
-                break
-        date = str(datetime.date(start_year, start_month, 1))
-        month_list.append(str2int(date))
-        start_month += 1
+    start_parts = decompose(start_time)
+    end_parts = decompose(end_time)
+    first = start_parts.year * 12 + start_parts.month - 1
+    last = end_parts.year * 12 + end_parts.month - 1
+    if np is not None and last >= first:
+        month_list = month_start(np.arange(first, last + 1, dtype=np.int64)).tolist()
+    else:
+        month_list = [month_start(index) for index in range(first, last + 1)]
     if fmt:
-        new_month_list = []
-        for month in month_list:
-            new_month_list.append(time.strftime(fmt, time.localtime(month)))
-        month_list = new_month_list
+        month_list = [int2str(month, fmt) for month in month_list]
     return month_list
 
 
@@ -737,23 +2115,16 @@ def get_yearlist(start_time, end_time):
     @end_time 结束时间的时间戳
     return  返回年份的时间列表,list中是整型,如[2013,2014]
     """
-    s_year = int(time.strftime('%Y', time.localtime(start_time)))
-    e_year = int(time.strftime('%Y', time.localtime(end_time)))
-    year_list = [s_year]
-    try:
-        while s_year < e_year:
-            year_list.append(s_year + 1)
-            s_year += 1
-    except Exception as e:
-        raise e
-    return year_list
+    s_year = get_year(start_time)
+    e_year = get_year(end_time)
+    return list(range(s_year, max(s_year, e_year) + 1))
 
 
 def get_last_minute_timestamp():
     """
     获取上一分钟的时间戳,
     """
-    now = int(time.time())  # 此时的时间戳
+    now = int(_now())  # 此时的时间戳
     start_time = now - (now % 60 + 60)
     return start_time
 
@@ -766,33 +2137,31 @@ def get_start_end_timestamp(data_time, time_type):
     return data_time所在季度的开始时间以及下一季度的开始时间
     """
     start_time, end_time = "", ""
-    year = get_year(data_time)
-    month = get_month(data_time)
+    parts = decompose(data_time)
+    year, month = parts.year, parts.month
     if time_type == HOUR:  # 获取小时开始和结束
-        start_time = str2int(int2str(data_time, '%Y-%m-%d %H:00:00'))
+        start_time = _local2timestamp(year, month, parts.day, parts.hour, 0, 0)
         end_time = start_time + HOUR_STEP
     elif time_type == DAY:  # 获取昨天日数据
-        start_time = get_start_timestamp(data_time)  # date_time所在日的0点0分0秒
+        start_time = parts.day_start  # date_time所在日的0点0分0秒
         end_time = start_time + DAY_STEP
     elif time_type == WEEK:  # 获取周数据
-        week = get_week(data_time)
-        week = week if week > 0 else 7
-        start_day = get_start_timestamp(data_time)
-        diff_day = week - 1 if week > 0 else 7
-        start_time = start_day - diff_day * DAY_STEP
-        end_time = start_time + 7 * DAY_STEP
+        # 按本地日期取周一0点，跨越夏令时切换的周不受影响
+        monday = _days_from_civil(year, month, parts.day) - (parts.week + 6) % 7
+        start_time = _local_day_start(monday)
+        end_time = _local_day_start(monday + 7)
     elif time_type == MONTH:
-        start_time = str2int(str(datetime.date(year, month, 1)))  # 本月1日0点
-        end_time = same_period_month(start_time, 1)  # 下月同期
+        start_time = _local2timestamp(year, month, 1, 0, 0, 0)  # 本月1日0点
+        end_time = _local2timestamp(year + month // 12, month % 12 + 1, 1, 0, 0, 0)  # 下月1日0点
 
     elif time_type == SEASON:
-        season = get_season(month)
-        start_time = get_start_timestamp_season(year, season)  # 季度开始时间
-        end_time = same_period_month(start_time, 3)  # 下季度开始时间，本季度结束时间
+        start_time = get_start_timestamp_season(year, parts.season)  # 季度开始时间
+        # 下季度开始时间，本季度结束时间
+        end_time = get_start_timestamp_season(year + parts.season // 4, parts.season % 4 + 1)
 
     elif time_type == YEAR:
-        start_time = str2int(str(datetime.date(year, 1, 1)))  # 年开始时间
-        end_time = same_period_month(start_time, 12)  # 下年开始时间，本年结束时间
+        start_time = _local2timestamp(year, 1, 1, 0, 0, 0)  # 年开始时间
+        end_time = _local2timestamp(year + 1, 1, 1, 0, 0, 0)  # 下年开始时间，本年结束时间
     return start_time, end_time
 
 
@@ -802,58 +2171,227 @@ def day_begin_timestamp(offset=0):
     :param offset: int 指定偏移量，0表示当日的开始时间戳，负数表示向前正数表示向后，比如：-1是昨日，-2昨日的昨日， 1是明日，2明日的明日，依次类推
     :return: int 时间戳
     """
-    now_timestamp = time.time() + DAY_STEP * offset
+    clock = _coarse_clock[0]
+    if clock is not None and not offset:
+        return clock.today_start()
+    now_timestamp = _now() + DAY_STEP * offset
     return str2int(time.strftime("%Y-%m-%d", time.localtime(now_timestamp)))
 
 
-def get_week_period(start_time, end_time, flag=False):
+def _last_day_point(start_time, end_time, flag=True):
+    """
+    与take_time_list(start_time, end_time, DAY_STEP, flag)按天取点一致的最后一个时间点，没有取到点时返回None
+    """
+    if start_time >= end_time:
+        return None
+    n = (end_time - start_time) // DAY_STEP
+    if not flag and start_time + n * DAY_STEP == end_time:
+        n -= 1
+    return start_time + n * DAY_STEP
+
+
+def get_period_gen(start_time, end_time, time_type, flag=True):
+    """
+    按时间顺序生成给定时间范围内的所包括的自然周期区间，按周期数直接计算边界，不再逐天遍历
+    取点规则与take_time_list按天取点一致，结果与逐天调用get_start_end_timestamp去重后相同，
+    但按天的周期直接按日历生成，不会因为夏令时切换时按86400秒取点而漏掉某一天
+    :param start_time: 开始日期
+    :param end_time: 结束日期
+    :param time_type: 0：小时，1：日 2：周，3：月，4：季，5：年
+    :param flag: False表示结束时间恰好落在取点上时不包含该点
+    :return: generator，(开始时间, 下一周期开始时间)
+    """
+    if isinstance(start_time, str):
+        start_time = str2int(start_time)
+    if isinstance(end_time, str):
+        end_time = str2int(end_time)
+    last_time = _last_day_point(start_time, end_time, flag)
+    if last_time is None:
+        return
+    first, last = decompose(start_time), decompose(last_time)
+    if time_type == HOUR:
+        start, stop = get_start_end_timestamp(start_time, HOUR)[0], get_start_end_timestamp(last_time, HOUR)[0]
+        while start <= stop:
+            yield start, start + HOUR_STEP
+            start += HOUR_STEP
+    elif time_type in (DAY, WEEK):
+        step = 1 if time_type == DAY else 7
+        day = _days_from_civil(first.year, first.month, first.day)
+        stop = _days_from_civil(last.year, last.month, last.day)
+        if time_type == WEEK:
+            # 自然周从周一开始
+            day -= (first.week or 7) - 1
+            stop -= (last.week or 7) - 1
+        while day <= stop:
+            start = _local_day_start(day)
+            if time_type == WEEK:
+                # 与get_start_end_timestamp一致，周的结束时间为下周一0点
+                yield start, _local_day_start(day + step)
+            else:
+                yield start, start + DAY_STEP
+            day += step
+    elif time_type in (MONTH, SEASON, YEAR):
+        step = {MONTH: 1, SEASON: 3, YEAR: 12}[time_type]
+        # 以 年*12+月-1 作为月份下标，季度和年从所在周期的第一个月开始
+        month = first.year * 12 + first.month - 1
+        stop = last.year * 12 + last.month - 1
+        month -= month % step
+        stop -= stop % step
+        start = _local2timestamp(month // 12, month % 12 + 1, 1, 0, 0, 0)
+        while month <= stop:
+            month += step
+            end = _local2timestamp(month // 12, month % 12 + 1, 1, 0, 0, 0)
+            yield start, end
+            start = end
+
+
+class PeriodIndex(Sequence):
+    """
+    有序的周期区间索引，开始时间和结束时间分别存放在 array('q') 中，区间前闭后开
+    按时间戳查找所在周期、查询与时间段重叠的周期都是二分查找，批量查找使用numpy
+    查找和重叠查询要求区间互不重叠(自然周、自然月等周期满足)，重叠的区间可以先merge
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, periods=()):
+        """
+        :param periods: 可迭代的 (开始时间, 结束时间)，重复的区间只保留一个
+        """
+        periods = sorted(set((int(start), int(end)) for start, end in periods))
+        self.starts = array('q', [start for start, _ in periods])
+        self.ends = array('q', [end for _, end in periods])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            obj = PeriodIndex()
+            obj.starts, obj.ends = self.starts[item], self.ends[item]
+            return obj
+        return self.starts[item], self.ends[item]
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def __contains__(self, period):
+        try:
+            start, end = period
+        except (TypeError, ValueError):
+            return False
+        i = bisect_right(self.starts, start) - 1
+        while i >= 0 and self.starts[i] == start:
+            if self.ends[i] == end:
+                return True
+            i -= 1
+        return False
+
+    def __eq__(self, other):
+        if isinstance(other, PeriodIndex):
+            return self.starts == other.starts and self.ends == other.ends
+        return NotImplemented
+
+    def __repr__(self):
+        return "PeriodIndex(%r)" % list(self)
+
+    def locate(self, value):
+        """
+        时间戳所在周期的下标，不在任何周期内时返回-1
+        """
+        i = bisect_right(self.starts, value) - 1
+        if i >= 0 and value < self.ends[i]:
+            return i
+        return -1
+
+    def find(self, value):
+        """
+        时间戳所在的周期
+        :return: (开始时间, 结束时间)，不在任何周期内时返回None
+        """
+        i = self.locate(value)
+        if i < 0:
+            return None
+        return self.starts[i], self.ends[i]
+
+    def locate_many(self, values):
+        """
+        批量查找时间戳所在周期的下标，不在任何周期内的为-1
+        :return: int64数组，未安装numpy时返回list
+        """
+        if np is None:
+            return [self.locate(v) for v in values]
+        values = np.asarray(values)
+        starts = np.frombuffer(self.starts, dtype=np.int64) if len(self) else np.array([], dtype=np.int64)
+        ends = np.frombuffer(self.ends, dtype=np.int64) if len(self) else np.array([], dtype=np.int64)
+        idx = np.searchsorted(starts, values, side='right') - 1
+        inside = idx >= 0
+        inside[inside] = values[inside] < ends[idx[inside]]
+        return np.where(inside, idx, -1).astype(np.int64)
+
+    def overlap(self, start, end):
+        """
+        与时间段[start, end)有重叠的周期
+        :return: PeriodIndex
+        """
+        return self[bisect_right(self.ends, start):bisect_left(self.starts, end)]
+
+    def merge(self):
+        """
+        合并重叠或首尾相接的周期
+        :return: PeriodIndex
+        """
+        return PeriodIndex(merge_intervals(self))
+
+    def union(self, *others):
+        """
+        与其他周期集合合并为一个索引，不合并相接的区间
+        :return: PeriodIndex
+        """
+        periods = list(self)
+        for other in others:
+            periods.extend(other)
+        return PeriodIndex(periods)
+
+    def to_set(self):
+        return set(self)
+
+
+def get_week_period(start_time, end_time, flag=False, index=False):
     """
     计算给定时间范围内的所包括的自然周起始时间区间，add Robin 2016-11-16
     :param start_time: 开始日期
     :param end_time: 结束日期
     :param flag: True表示前开后闭
+    :param index: True时返回PeriodIndex
     :return: set，自然周集合
     """
     week_set = set()
     try:
-        if isinstance(start_time, str):
-            start_time = str2int(start_time)
-        if isinstance(end_time, str):
-            end_time = str2int(end_time)
-        for dt in take_time_list(start_time, end_time, DAY_STEP, flag=flag):
-            ret = get_start_end_timestamp(dt, WEEK)
-            week_set.add(ret)
+        week_set.update(get_period_gen(start_time, end_time, WEEK, flag))
     except Exception as e:
         print("get_week_period error : %s" % e)
-    return week_set
+    return PeriodIndex(week_set) if index else week_set
 
 
-def get_month_period(start_time, end_time, flag=False):
+def get_month_period(start_time, end_time, flag=False, index=False):
     """
     计算给定时间范围内的所包括的自然月起始时间区间，add Robin 2016-11-16
     :param start_time: 开始日期
     :param end_time: 结束日期
+    :param index: True时返回PeriodIndex
     :return: set，自然月集合
     """
-    month_set = set()
-    # try:
-    if isinstance(start_time, str):
-        start_time = str2int(start_time)
-    if isinstance(end_time, str):
-        end_time = str2int(end_time)
-    for dt in take_time_list(start_time, end_time, DAY_STEP, flag=flag):
-        ret_month = get_start_end_timestamp(dt, MONTH)
-        month_set.add(ret_month)
-    # except Exception as e:
-    #     print("get_month_period error : %s" % e)
-    return month_set
+    if index:
+        return PeriodIndex(get_period_gen(start_time, end_time, MONTH, flag))
+    return set(get_period_gen(start_time, end_time, MONTH, flag))
 
 
-def get_week_month_period(start_time, end_time):
+def get_week_month_period(start_time, end_time, index=False):
     """
     计算给定时间范围内的所包括的自然周起始时间区间和自然月起始时间区间，add Robin 2016-11-16
     :param start_time: 开始日期
     :param end_time: 结束日期
+    :param index: True时返回两个PeriodIndex
     :return: tuple，自然周集合、自然月集合
     """
     week_set = set()
@@ -863,13 +2401,12 @@ def get_week_month_period(start_time, end_time):
             start_time = str2int(start_time)
         if isinstance(end_time, str):
             end_time = str2int(end_time)
-        for dt in take_time_list(start_time, end_time, DAY_STEP):
-            ret = get_start_end_timestamp(dt, WEEK)
-            ret_month = get_start_end_timestamp(dt, MONTH)
-            week_set.add(ret)
-            month_set.add(ret_month)
+        week_set.update(get_period_gen(start_time, end_time, WEEK))
+        month_set.update(get_period_gen(start_time, end_time, MONTH))
     except Exception as e:
         print("get_week_month_period error : %s" % e)
+    if index:
+        return PeriodIndex(week_set), PeriodIndex(month_set)
     return week_set, month_set
 
 
@@ -878,10 +2415,757 @@ def get_current_timestamp_str():
     返回当前时间戳字符串，并去掉小数点
     :return:
     """
+    clock = _coarse_clock[0]
+    if clock is not None:
+        return clock.timestamp_str()
     return "".join(str(time.time()).split("."))
 
 
+# todo  -------------- 批量转换 start --------------
+# 批量接口接收list或numpy数组，输出与对应的单值函数逐个转换的结果一致；
+# 未安装numpy时退化为逐个调用单值函数并返回list
+_BATCH_FIELDS = {'Y': (0, 4), 'm': (5, 7), 'd': (8, 10), 'H': (11, 13), 'M': (14, 16), 'S': (17, 19)}
+# 能按 YYYY-MM-DDTHH:MM:SS 批量格式化的本地时间范围：0001-01-01 ~ 9999-12-31
+_BATCH_MIN_SECONDS = -62135596800
+_BATCH_MAX_SECONDS = 253402300799
+_ISO_SUFFIX = re.compile(r'(\.\d+)?(Z|[+-]([01]\d|2[0-3])(:?[0-5]\d)?)?')
+_batch_formats = {}
+_batch_shapes = {}
+
+
+def _civil_from_days_many(days):
+    """
+    距离1970-01-01的天数批量转换为 (年, 月, 日)
+    """
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+
+def _days_from_civil_many(year, month, day):
+    """
+    (年, 月, 日) 批量转换为距离1970-01-01的天数
+    """
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _timestamp_array(values, now_if_zero=False):
+    """
+    时间戳批量输入统一转为int64数组
+    :param values: list、整数/浮点数组或datetime64数组(按UTC时间点处理)
+    :param now_if_zero: 与单值函数一致，值为0时取当前时间
+    :return: (int64数组, 是否存在小数部分)
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind == 'M':
+        return arr.astype('datetime64[s]').astype(np.int64), False
+    fraction = False
+    if arr.dtype.kind == 'f':
+        floor = np.floor(arr)
+        fraction = bool((floor != arr).any())
+        if now_if_zero:
+            floor = np.where(arr == 0, np.floor(time.time()), floor)
+        return floor.astype(np.int64), fraction
+    arr = arr.astype(np.int64)
+    if now_if_zero:
+        arr = np.where(arr == 0, int(time.time()), arr)
+    return arr, fraction
+
+
+def _utc_offsets(ts):
+    """
+    批量获取时间戳所在时刻的本地UTC偏移量(秒)
+    按UTC天去重后查询，当天存在时区切换的时间戳再逐个查询
+    :return: (偏移量数组, 所在天是否存在时区切换)
+    """
+    days = ts // DAY_STEP
+    uniq, inverse = np.unique(days, return_inverse=True)
+    offsets = np.empty(len(uniq), dtype=np.int64)
+    mixed = np.zeros(len(uniq), dtype=bool)
+    for i, day in enumerate(uniq.tolist()):
+        start = day * DAY_STEP
+        offsets[i] = time.localtime(start).tm_gmtoff
+        mixed[i] = time.localtime(start + DAY_STEP - 1).tm_gmtoff != offsets[i]
+    result = offsets[inverse]
+    row_mixed = mixed[inverse]
+    if row_mixed.any():
+        idx = np.flatnonzero(row_mixed)
+        result[idx] = [time.localtime(v).tm_gmtoff for v in ts[idx].tolist()]
+    return result, row_mixed
+
+
+def _local2timestamp_many(naive):
+    """
+    本地时间(按UTC计算的秒数)批量转换为时间戳，当天存在时区切换的交给mktime
+    """
+    uniq, inverse = np.unique(naive // DAY_STEP, return_inverse=True)
+    day_offsets = [_local_day_offset(day) for day in uniq.tolist()]
+    fixed = np.array([offset is not None for offset in day_offsets], dtype=bool)
+    offsets = np.array([offset or 0 for offset in day_offsets], dtype=np.int64)
+    result = naive - offsets[inverse]
+    if not fixed.all():
+        idx = np.flatnonzero(~fixed[inverse])
+        result[idx] = [int(time.mktime(time.gmtime(v)[:6] + (0, 0, -1))) for v in naive[idx].tolist()]
+    return result
+
+
+def _compile_batch_format(fmt):
+    """
+    将格式串编译为 YYYY-MM-DDTHH:MM:SS 字符矩阵的列下标，仅支持 %Y %m %d %H %M %S %% 指令
+    :return: (列下标数组, {输出位置: 固定字符}) ，不支持的格式返回None
+    """
+    try:
+        return _batch_formats[fmt]
+    except KeyError:
+        pass
+    columns, literals = [], {}
+    i = 0
+    compiled = None
+    while i < len(fmt):
+        if fmt[i] == '%':
+            directive = fmt[i + 1:i + 2]
+            i += 2
+            if directive in _BATCH_FIELDS:
+                columns.extend(range(*_BATCH_FIELDS[directive]))
+                continue
+            if directive != '%':
+                break
+            char = '%'
+        else:
+            char = fmt[i]
+            i += 1
+        if ord(char) > 127:
+            break
+        literals[len(columns)] = ord(char)
+        columns.append(0)
+    else:
+        compiled = np.array(columns, dtype=np.intp), literals
+    _batch_formats[fmt] = compiled
+    return compiled
+
+
+def _format_many(local, fmt):
+    """
+    本地时间(按UTC计算的秒数)批量格式化
+    :return: 字符串数组，格式或时间范围不支持时返回None
+    """
+    compiled = _compile_batch_format(fmt)
+    if compiled is None:
+        return None
+    if not len(local):
+        return np.array([], dtype=str)
+    if local.min() < _BATCH_MIN_SECONDS or local.max() > _BATCH_MAX_SECONDS:
+        return None
+    columns, literals = compiled
+    if not len(columns):
+        return np.full(len(local), '', dtype=str)
+    days, seconds = np.divmod(local, DAY_STEP)
+    year, month, day = _civil_from_days_many(days)
+    hour, seconds = np.divmod(seconds, HOUR_STEP)
+    minute, second = np.divmod(seconds, MINUTE_STEP)
+    iso = np.empty((len(local), 19), dtype=np.uint8)
+    for start, width, value in ((0, 4, year), (5, 2, month), (8, 2, day),
+                                (11, 2, hour), (14, 2, minute), (17, 2, second)):
+        for k in range(width):
+            iso[:, start + width - 1 - k] = value // 10 ** k % 10 + 48
+    matrix = iso[:, columns]
+    for pos, char in literals.items():
+        matrix[:, pos] = char
+    return np.ascontiguousarray(matrix).view('S%d' % len(columns)).ravel().astype(str)
+
+
+def _batch_shape(fmt):
+    """
+    将解析格式编译为固定位置的字符模板
+    :return: (长度, 各字段的数字位置列表, {位置: 分隔符})
+    """
+    try:
+        return _batch_shapes[fmt]
+    except KeyError:
+        pass
+    fields, literals = [], {}
+    pos = i = 0
+    while i < len(fmt):
+        if fmt[i] == '%':
+            width = 4 if fmt[i + 1] == 'Y' else 2
+            fields.append(list(range(pos, pos + width)))
+            pos += width
+            i += 2
+        else:
+            literals[pos] = ord(fmt[i])
+            pos += 1
+            i += 1
+    shape = _batch_shapes[fmt] = (pos, fields, literals)
+    return shape
+
+
+def _parse_many(strings, parser):
+    """
+    按解析引擎支持的格式批量解析字符串时间
+    :param strings: 字符串数组(str或bytes)
+    :param parser: DateParser对象
+    :return: 本地时间(按UTC计算的秒数)数组，含非ASCII字符时返回None
+    """
+    n = len(strings)
+    if not n:
+        return np.zeros(0, dtype=np.int64)
+    try:
+        data = np.asarray(strings).astype('S')
+    except UnicodeEncodeError:
+        return None
+    width = data.dtype.itemsize
+    matrix = data.view(np.uint8).reshape(n, width)
+    lengths = np.char.str_len(data)
+    digits = (matrix >= 48) & (matrix <= 57)
+    fields = np.zeros((6, n), dtype=np.int64)
+    fields[1:3] = 1
+    todo = np.ones(n, dtype=bool)
+    for fmt, _ in parser._shapes:
+        length, positions, literals = _batch_shape(fmt)
+        if length > width:
+            continue
+        rows = todo & (lengths == length)
+        for pos in range(length):
+            if pos in literals:
+                rows &= matrix[:, pos] == literals[pos]
+            else:
+                rows &= digits[:, pos]
+        if not rows.any():
+            continue
+        idx = np.flatnonzero(rows)
+        sub = matrix[idx].astype(np.int64) - 48
+        for k, field in enumerate(positions):
+            value = sub[:, field[0]]
+            for pos in field[1:]:
+                value = value * 10 + sub[:, pos]
+            fields[k, idx] = value
+        todo[idx] = False
+    year, month, day, hour, minute, second = fields
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = np.array(_MONTH_DAYS, dtype=np.int64)[np.clip(month, 0, 12)] + (leap & (month == 2))
+    todo |= (year < 1) | (month < 1) | (month > 12) | (day < 1) | (day > month_days) | \
+        (hour > 23) | (minute > 59) | (second > 61)
+    if todo.any():
+        # 交给单值解析抛出对应的异常
+        value = data[np.flatnonzero(todo)[0]].item()
+        parser.fields(value.decode(errors='replace'))
+    return _days_from_civil_many(year, month, day) * DAY_STEP + hour * HOUR_STEP + minute * MINUTE_STEP + second
+
+
+def str2int_many(values, tz=None):
+    """
+    批量将时间字符串转为时间戳，支持的格式与str2int一致
+    :param values: 字符串list、定长字符串(str/bytes)数组，或datetime64数组(视为本地时间)
+    :param tz: 时区名，默认使用进程时区
+    :return: int64数组
+    """
+    if np is None:
+        return [str2int(s, tz) for s in values]
+    arr = np.asarray(values)
+    if arr.dtype.kind == 'M':
+        naive = arr.astype('datetime64[s]').astype(np.int64)
+    else:
+        naive = _parse_many(arr, _date_parser)
+        if naive is None:
+            return np.array([str2int(s, tz) for s in arr.tolist()], dtype=np.int64)
+    if tz is not None:
+        return get_timezone(tz).timestamp_many(naive)
+    return _local2timestamp_many(naive)
+
+
+def _utc_offsets_tz(ts, tz):
+    """
+    批量获取时间戳的本地UTC偏移量，指定时区时查切换表，否则使用进程时区
+    """
+    if tz is not None:
+        return get_timezone(tz).utcoffset_many(ts)
+    return _utc_offsets(ts)[0]
+
+
+def int2str_many(values, fmt='%Y-%m-%d %H:%M:%S', tz=None):
+    """
+    批量将时间戳改为指定格式的字符串，与int2str一致，值为0时取当前时间
+    :param values: 时间戳list、数组或datetime64数组
+    :param fmt: 格式
+    :param tz: 时区名，默认使用进程时区
+    :return: 字符串数组
+    """
+    if np is None:
+        return [int2str(v, fmt, tz) for v in values]
+    ts, _ = _timestamp_array(values, now_if_zero=True)
+    result = _format_many(ts + _utc_offsets_tz(ts, tz), fmt)
+    if result is None:
+        result = np.array([int2str(v, fmt, tz) for v in ts.tolist()], dtype=str)
+    return result
+
+
+def int2day_many(values, days=0, hours=0, minutes=0, fmt="-", tz=None):
+    """
+    批量将时间戳改为日期格式，与int2day一致，值为0时取当前时间
+    """
+    if np is None:
+        return [int2day(v, days, hours, minutes, fmt, tz) for v in values]
+    ts, _ = _timestamp_array(values, now_if_zero=True)
+    return int2str_many(ts + (days * DAY_STEP + hours * HOUR_STEP + minutes * MINUTE_STEP),
+                        fmt.join(["%Y", "%m", "%d"]), tz)
+
+
+def int2dayint_many(values, tz=None):
+    """
+    批量将时间戳改为 YYYYMMDD 格式的整数，与int2dayint一致
+    :return: int64数组
+    """
+    if np is None:
+        return [int2dayint(v, tz) for v in values]
+    ts, _ = _timestamp_array(values)
+    offsets = _utc_offsets_tz(ts, tz)
+    year, month, day = _civil_from_days_many((ts + offsets) // DAY_STEP)
+    return year * 10000 + month * 100 + day
+
+
+def int2iso_many(values, z='Z', convert_to_utc=True):
+    """
+    批量将时间戳转换为iso时间，与int2iso一致
+    :return: 字符串数组
+    """
+    if np is None:
+        return [int2iso(v, z, convert_to_utc) for v in values]
+    ts, fraction = _timestamp_array(values)
+    if not fraction:
+        local = ts if convert_to_utc else ts + _utc_offsets(ts)[0]
+        result = _format_many(local, '%Y-%m-%dT%H:%M:%S.000Z' if z == "Z" else '%Y-%m-%dT%H:%M:%S.000')
+        if result is not None:
+            return result
+    source = np.asarray(values).tolist() if fraction else ts.tolist()
+    return np.array([int2iso(v, z, convert_to_utc) for v in source], dtype=str)
+
+
+def _iso_suffix_offset(match):
+    """
+    _ISO_SUFFIX匹配结果中的UTC偏移秒数，没有时区或为Z时为0
+    """
+    zone = match.group(2)
+    if not zone or zone == "Z":
+        return 0
+    digits = zone[1:].replace(":", "")
+    seconds = int(digits[:2]) * HOUR_STEP + int(digits[2:] or 0) * MINUTE_STEP
+    return -seconds if zone[0] == "-" else seconds
+
+
+def iso2timestamp_many(values, h=8, tz=None):
+    """
+    批量将iso8601格式的时间转为时间戳，与iso2timestamp一致
+    YYYY-MM-DDTHH:MM:SS[.ffffff][时区] 形式的时间批量解析，其余形式逐个交给iso2timestamp
+    :param values: iso8601时间字符串list或数组，e.g. 2016-05-09T20:38:22.450686Z
+    :param h: 正负整数，各地区时间差异的小时数，默认为+8得到中国默认时区
+    :param tz: 时区名，规则同iso2timestamp
+    :return: int64数组
+    """
+    table = get_timezone(tz) if tz is not None else None
+    if np is None:
+        return [iso2timestamp(s, h, table) for s in values]
+    arr = np.asarray(values)
+    n = len(arr)
+    result = np.zeros(n, dtype=np.int64)
+    fast = np.zeros(n, dtype=bool)
+    offsets = np.zeros(n, dtype=np.int64)    # 字符串中的UTC偏移量
+    zoned = np.zeros(n, dtype=bool)         # 字符串是否带时区
+    try:
+        data = arr.astype('S')
+    except (UnicodeEncodeError, ValueError, TypeError):
+        data = None
+    if n and data is not None and data.dtype.itemsize >= 19:
+        width = data.dtype.itemsize
+        matrix = data.view(np.uint8).reshape(n, width)
+        fast = np.char.str_len(data) >= 19
+        fast &= (matrix[:, 10] == ord('T')) | (matrix[:, 10] == ord(' '))
+        fast &= matrix[:, 17] <= ord('5')
+        if width > 19:
+            suffixes = np.ascontiguousarray(matrix[:, 19:]).view('S%d' % (width - 19)).ravel()
+            uniq, inverse = np.unique(suffixes, return_inverse=True)
+            matches = [_ISO_SUFFIX.fullmatch(s.decode(errors='replace')) for s in uniq.tolist()]
+            fast &= np.array([m is not None for m in matches], dtype=bool)[inverse]
+            if table is not None:
+                offsets = np.array([_iso_suffix_offset(m) if m else 0 for m in matches], dtype=np.int64)[inverse]
+                zoned = np.array([bool(m and m.group(2)) for m in matches], dtype=bool)[inverse]
+        idx = np.flatnonzero(fast)
+        if len(idx):
+            heads = matrix[idx, :19].copy()
+            heads[:, 10] = ord(' ')
+            try:
+                naive = _parse_many(heads.view('S19').ravel(), _date_parser)
+            except TimeFormatError:
+                fast[:] = False
+            else:
+                if table is not None:
+                    result[idx] = np.where(zoned[idx], naive - offsets[idx], table.timestamp_many(naive))
+                else:
+                    result[idx] = _local2timestamp_many(naive) + 3600 * h
+    slow = np.flatnonzero(~fast)
+    if len(slow):
+        result[slow] = [iso2timestamp(s, h, table) for s in arr[slow].tolist()]
+    return result
+
+
+def _bucket_start(value, time_type, tz=None):
+    """
+    时间戳所在周期的开始时间，未指定时区时与get_start_end_timestamp一致
+    """
+    if tz is None:
+        return get_start_end_timestamp(value, time_type)[0]
+    table = get_timezone(tz)
+    parts = table.parts(value)
+    if time_type == HOUR:
+        naive = table.local(value) // HOUR_STEP * HOUR_STEP
+    elif time_type == DAY:
+        return parts.day_start
+    elif time_type == WEEK:
+        naive = (_days_from_civil(parts.year, parts.month, parts.day) - (parts.week + 6) % 7) * DAY_STEP
+    else:
+        month = {MONTH: parts.month, SEASON: parts.season * 3 - 2, YEAR: 1}[time_type]
+        naive = _days_from_civil(parts.year, month, 1) * DAY_STEP
+    return table.timestamp(naive)
+
+
+def _bucket_keys(ts, time_type, tz=None):
+    """
+    批量计算时间戳所在周期的编号，同一周期内的时间戳编号相同，编号随时间递增
+    """
+    if time_type not in (HOUR, DAY, WEEK, MONTH, SEASON, YEAR):
+        raise ValueError("time_type error: %r" % time_type)
+    local = ts + _utc_offsets_tz(ts, tz)
+    if time_type == HOUR:
+        return local // HOUR_STEP
+    days = local // DAY_STEP
+    if time_type == DAY:
+        return days
+    if time_type == WEEK:
+        # 1970-01-01是星期四，按周一开始编号
+        return (days + 3) // 7
+    year, month, _ = _civil_from_days_many(days)
+    if time_type == MONTH:
+        return year * 12 + month - 1
+    if time_type == SEASON:
+        return year * 4 + (month - 1) // 3
+    return year
+
+
+def _bucket_sums(inverse, size, columns):
+    """
+    按周期编号分组求和，整数列保持int64，浮点列为float64
+    """
+    sums = []
+    for column in columns:
+        column = np.asarray(column)
+        if column.dtype.kind == 'f':
+            sums.append(np.bincount(inverse, weights=column, minlength=size))
+        else:
+            total = np.zeros(size, dtype=np.int64)
+            np.add.at(total, inverse, column.astype(np.int64))
+            sums.append(total)
+    return sums
+
+
+def bucket_starts_many(values, time_type, tz=None):
+    """
+    批量计算时间戳所在 时/日/周/月/季/年 的开始时间，与get_start_end_timestamp(v, time_type)[0]一致
+    :param values: 时间戳list或数组
+    :param time_type: HOUR/DAY/WEEK/MONTH/SEASON/YEAR
+    :param tz: 时区名，默认使用进程时区
+    :return: int64数组
+    """
+    if np is None:
+        return [_bucket_start(v, time_type, tz) for v in values]
+    ts, _ = _timestamp_array(values)
+    uniq, first, inverse = np.unique(_bucket_keys(ts, time_type, tz), return_index=True, return_inverse=True)
+    starts = np.array([_bucket_start(v, time_type, tz) for v in ts[first].tolist()], dtype=np.int64)
+    result = starts[inverse]
+    # 前后一天内有时区切换的时间戳(如夏令时结束时重复的那个小时)逐个计算，与单个计算的结果保持一致
+    changed = np.flatnonzero(_utc_offsets_tz(ts - DAY_STEP, tz) != _utc_offsets_tz(ts + DAY_STEP, tz))
+    if len(changed):
+        result[changed] = [_bucket_start(v, time_type, tz) for v in ts[changed].tolist()]
+    return result
+
+
+def bucket_aggregate(values, time_type, *columns, tz=None):
+    """
+    按 时/日/周/月/季/年 对时间戳分组，一次得到每个周期的开始时间、数量和各数值列的和
+    :param values: 时间戳list或数组
+    :param time_type: HOUR/DAY/WEEK/MONTH/SEASON/YEAR
+    :param columns: 与values等长的数值列，可选
+    :param tz: 时区名，默认使用进程时区
+    :return: (周期开始时间数组, 数量数组, [各列求和数组])，按周期开始时间升序
+    """
+    aggregator = TimeBucketAggregator(time_type, len(columns), tz)
+    aggregator.add(values, *columns)
+    return aggregator.result()
+
+
+class TimeBucketAggregator(object):
+    """
+    增量的时间分组汇总，适合流式数据：每批数据向量化分组后合并到已有的周期中，
+    flush取出已经结束的周期，未结束的周期继续累加
+    未安装numpy时逐个计算，结果为list
+    """
+
+    def __init__(self, time_type, columns=0, tz=None):
+        """
+        :param time_type: HOUR/DAY/WEEK/MONTH/SEASON/YEAR
+        :param columns: 每批数据附带的数值列数
+        :param tz: 时区名，默认使用进程时区
+        """
+        if time_type not in (HOUR, DAY, WEEK, MONTH, SEASON, YEAR):
+            raise ValueError("time_type error: %r" % time_type)
+        self.time_type = time_type
+        self.columns = columns
+        self.tz = tz
+        self.clear()
+
+    def clear(self):
+        """
+        清空所有周期
+        """
+        if np is None:
+            self._buckets = {}
+            return
+        self.keys = np.array([], dtype=np.int64)
+        self.starts = np.array([], dtype=np.int64)
+        self.counts = np.array([], dtype=np.int64)
+        self.sums = [np.array([], dtype=np.int64) for _ in range(self.columns)]
+
+    def __len__(self):
+        if np is None:
+            return len(self._buckets)
+        return len(self.keys)
+
+    def add(self, values, *columns):
+        """
+        追加一批时间戳及对应的数值列
+        """
+        if len(columns) != self.columns:
+            raise ValueError("expected %d value columns, got %d" % (self.columns, len(columns)))
+        if np is None:
+            for i, value in enumerate(values):
+                start = _bucket_start(value, self.time_type, self.tz)
+                bucket = self._buckets.setdefault(start, [0] + [0] * self.columns)
+                bucket[0] += 1
+                for k, column in enumerate(columns):
+                    bucket[k + 1] += column[i]
+            return
+        ts, _ = _timestamp_array(values)
+        if not len(ts):
+            return
+        keys, first, inverse = np.unique(_bucket_keys(ts, self.time_type, self.tz),
+                                         return_index=True, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(keys))
+        sums = _bucket_sums(inverse, len(keys), columns)
+        known = np.isin(keys, self.keys)
+        starts = np.zeros(len(keys), dtype=np.int64)
+        starts[~known] = [_bucket_start(v, self.time_type, self.tz) for v in ts[first[~known]].tolist()]
+        merged = np.union1d(self.keys, keys)
+        old, new = np.searchsorted(merged, self.keys), np.searchsorted(merged, keys)
+        self.starts = self._scatter(merged, old, self.starts, new[~known], starts[~known])
+        self.counts = self._scatter(merged, old, self.counts, new, counts, add=True)
+        self.sums = [self._scatter(merged, old, total, new, part, add=True) for total, part in zip(self.sums, sums)]
+        self.keys = merged
+
+    @staticmethod
+    def _scatter(merged, old, current, new, values, add=False):
+        """
+        把已有的值和新一批的值放到合并后的周期位置上
+        """
+        result = np.zeros(len(merged), dtype=np.result_type(current.dtype, values.dtype))
+        result[old] = current
+        if add:
+            np.add.at(result, new, values)
+        else:
+            result[new] = values
+        return result
+
+    def result(self):
+        """
+        :return: (周期开始时间数组, 数量数组, [各列求和数组])，按周期开始时间升序
+        """
+        if np is None:
+            starts = sorted(self._buckets)
+            return (starts, [self._buckets[v][0] for v in starts],
+                    [[self._buckets[v][k + 1] for v in starts] for k in range(self.columns)])
+        return self.starts, self.counts, list(self.sums)
+
+    def flush(self, before):
+        """
+        取出并移除before所在周期之前的所有周期(这些周期已经结束，不会再有新数据)
+        :param before: 时间戳，一般为当前批次数据的最小时间或水位线
+        :return: 同result
+        """
+        start = _bucket_start(before, self.time_type, self.tz)
+        if np is None:
+            closed = TimeBucketAggregator(self.time_type, self.columns, self.tz)
+            closed._buckets = dict((k, v) for k, v in self._buckets.items() if k < start)
+            self._buckets = dict((k, v) for k, v in self._buckets.items() if k >= start)
+            return closed.result()
+        n = int(np.searchsorted(self.starts, start))
+        closed = self.starts[:n], self.counts[:n], [total[:n] for total in self.sums]
+        self.keys, self.starts, self.counts = self.keys[n:], self.starts[n:], self.counts[n:]
+        self.sums = [total[n:] for total in self.sums]
+        return closed
+
+
+# todo  -------------- 批量转换 stop --------------
+
+
+
+# todo  -------------- 文件转换 start --------------
+# 命令行：python -m candy.time_library SRC DST -c 列号 -m 转换方式
+# 文件按行边界切分为块，每块由进程池中的进程自己mmap读取并批量转换，结果按块的顺序写出，
+# 同时在处理中的块数有上限，内存占用与文件大小无关
+CONVERT_CHUNK_SIZE = 16 * 1024 * 1024
+CONVERT_MODES = ("str2int", "int2str", "int2iso", "iso2int")
+
+
+def _chunk_bounds(path, chunk_size):
+    """
+    按行边界切分文件
+    :return: generator，(开始位置, 结束位置)
+    """
+    size = os.path.getsize(path)
+    if not size:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b"\n", min(start + chunk_size, size) - 1)
+            end = size if end < 0 else end + 1
+            yield start, end
+            start = end
+
+
+def _convert_values(values, mode, fmt, tz):
+    """
+    批量转换一列的值
+    :return: 转换后的字符串list
+    """
+    if mode == "str2int":
+        return [str(v) for v in str2int_many(values, tz)]
+    if mode == "iso2int":
+        # 按iso时间表示的时刻转换，不带时区的按UTC处理
+        return [str(v) for v in iso2timestamp_many(values, tz="UTC")]
+    if np is not None:
+        try:
+            numbers = np.array(values).astype(np.int64)
+        except ValueError:
+            numbers = np.array(values).astype(np.float64)
+    else:
+        numbers = [float(v) if "." in v else int(v) for v in values]
+    if mode == "int2str":
+        return list(int2str_many(numbers, fmt, tz))
+    return list(int2iso_many(numbers))
+
+
+def _convert_chunk(path, start, end, columns, mode, delimiter, fmt, tz, skip_header):
+    """
+    转换文件中的一块，在进程池的进程中执行
+    :return: bytes，转换后的内容
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode("utf-8")
+    lines = text.split("\n")
+    tail = lines.pop()
+    head = lines.pop(0) + "\n" if skip_header and lines else ""
+    rows = []
+    endings = []
+    for line in lines:
+        if line.endswith("\r"):
+            line, ending = line[:-1], "\r\n"
+        else:
+            ending = "\n"
+        rows.append(line.split(delimiter))
+        endings.append(ending)
+    if tail:
+        rows.append(tail.split(delimiter))
+        endings.append("")
+    for column in columns:
+        idx = [i for i, row in enumerate(rows) if len(row) > column and row[column]]
+        if not idx:
+            continue
+        converted = _convert_values([rows[i][column] for i in idx], mode, fmt, tz)
+        for i, value in zip(idx, converted):
+            rows[i][column] = value
+    out = [head]
+    for row, ending in zip(rows, endings):
+        out.append(delimiter.join(row))
+        out.append(ending)
+    return "".join(out).encode("utf-8")
+
+
+def convert_file(src, dst, columns, mode, delimiter=",", fmt='%Y-%m-%d %H:%M:%S', tz=None, header=False,
+                 processes=None, chunk_size=CONVERT_CHUNK_SIZE):
+    """
+    转换文本文件(csv/tsv)中的时间列
+    :param src: 源文件
+    :param dst: 目标文件
+    :param columns: 需要转换的列号，从0开始
+    :param mode: str2int、int2str、int2iso(utc)、iso2int
+    :param delimiter: 分隔符，字段内不能包含分隔符
+    :param fmt: int2str的格式串，str2int时支持str2int识别的格式
+    :param tz: 时区名，默认使用进程时区
+    :param header: 第一行是否为表头，表头不转换
+    :param processes: 进程数，默认为CPU数
+    :param chunk_size: 每块的字节数，块按行边界对齐
+    :return: 转换的块数
+    """
+    if mode not in CONVERT_MODES:
+        raise ValueError("mode must be one of %s" % ", ".join(CONVERT_MODES))
+    columns = tuple(columns)
+    processes = processes or os.cpu_count() or 1
+    pending = deque()
+    count = 0
+    with multiprocessing.Pool(processes) as pool, open(dst, "wb") as out:
+        for start, end in _chunk_bounds(src, chunk_size):
+            pending.append(pool.apply_async(_convert_chunk, (src, start, end, columns, mode, delimiter, fmt, tz,
+                                                              header and start == 0)))
+            count += 1
+            # 限制同时在处理中的块数，按提交顺序写出
+            while len(pending) >= processes * 2:
+                out.write(pending.popleft().get())
+        while pending:
+            out.write(pending.popleft().get())
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m candy.time_library",
+                                     description="转换csv/tsv文件中的时间列")
+    parser.add_argument("src", help="源文件")
+    parser.add_argument("dst", help="目标文件")
+    parser.add_argument("-c", "--columns", required=True, help="需要转换的列号，从0开始，多列用逗号分隔")
+    parser.add_argument("-m", "--mode", required=True, choices=CONVERT_MODES, help="转换方式")
+    parser.add_argument("-d", "--delimiter", default=",", help="分隔符，默认为逗号，\\t表示tab")
+    parser.add_argument("-f", "--fmt", default='%Y-%m-%d %H:%M:%S', help="int2str的格式串")
+    parser.add_argument("--tz", default=None, help="时区名，默认使用进程时区")
+    parser.add_argument("--header", action="store_true", help="第一行为表头")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="进程数，默认为CPU数")
+    parser.add_argument("--chunk-size", type=int, default=CONVERT_CHUNK_SIZE, help="每块的字节数")
+    args = parser.parse_args(argv)
+    delimiter = "\t" if args.delimiter in ("\\t", "tab") else args.delimiter
+    columns = [int(column) for column in args.columns.split(",")]
+    convert_file(args.src, args.dst, columns, args.mode, delimiter, args.fmt, args.tz, args.header,
+                 args.processes, args.chunk_size)
+    return 0
+# todo  -------------- 文件转换 stop --------------
+
+
 if __name__ == '__main__':
-    # a, b = get_start_end_timestamp(str2int("2018-06-22"),2)
-    # print(int2day(a),int2day(b))
-    print(int2hms(time.time()))
\ No newline at end of file
+    sys.exit(main())
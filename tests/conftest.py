@@ -0,0 +1,34 @@
+"""
+测试环境
+candy.mysql_library 按部署后的目录结构导入 lib.error_library、lib.log_library 和 interface，
+并在导入时用 settings.DB_CONFIG 创建 record_obj，这里把这些模块指向仓库中的实现，
+补上测试用的数据库配置，已经存在的模块和配置不覆盖
+"""
+import logging
+import sys
+import types
+
+from candy import error_library, interface
+from conf import settings
+
+
+def _register(name, module):
+    sys.modules.setdefault(name, module)
+
+
+_log_library = types.ModuleType("lib.log_library")
+_log_library.mysql_log_ = logging.getLogger("mysql")
+
+_lib = types.ModuleType("lib")
+_lib.__path__ = []
+_lib.error_library = error_library
+_lib.log_library = _log_library
+
+_register("lib", _lib)
+_register("lib.error_library", error_library)
+_register("lib.log_library", _log_library)
+_register("interface", interface)
+
+if not hasattr(settings, "DB_CONFIG"):
+    settings.DB_CONFIG = {"host": "127.0.0.1", "port": 3306, "user": "test", "passwd": "test",
+                          "db": "test", "charset": "utf8"}
@@ -0,0 +1,453 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+import aiomysql
+import aiomysql.pool
+import pymysql.converters
+import pymysql.cursors
+
+from candy import mysql_library
+
+
+class FakeCursor(object):
+    """
+    aiomysql游标的替身，执行查询后连接处于事务中(autocommit=False)
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = [(1,), (2,)]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, sql):
+        self.conn.executed.append(sql)
+        self.conn.in_transaction = True
+        return 1
+
+    async def fetchall(self):
+        return tuple(self._rows)
+
+    async def fetchone(self):
+        return self._rows[0]
+
+    async def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+
+class FakeConnection(object):
+    cursorclass = aiomysql.Cursor
+
+    def __init__(self):
+        self.closed = False
+        self.in_transaction = False
+        self.last_usage = 0
+        self.executed = []
+        self._reader = mock.Mock(eof_received=False, **{"at_eof.return_value": False,
+                                                        "exception.return_value": None})
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.in_transaction
+
+    async def commit(self):
+        self.in_transaction = False
+
+    async def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+class SyncConnection(object):
+    """
+    pymysql连接的替身
+    """
+    def __init__(self):
+        self.closed = False
+        self.dead = False
+
+    def ping(self, reconnect=False):
+        if self.dead:
+            raise mysql_library.pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.opened = []
+
+        def creator():
+            conn = SyncConnection()
+            self.opened.append(conn)
+            return conn
+
+        self.pool = mysql_library.ConnectionPool(min_size=1, max_size=2, ping_interval=0, timeout=0.05,
+                                                 creator=creator)
+        self.addCleanup(self.pool.close)
+
+    def test_reuse(self):
+        for _ in range(5):
+            with self.pool.connection() as conn:
+                self.assertFalse(conn.closed)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(self.pool.size, 1)
+        self.assertEqual(self.pool.idle, 1)
+
+    def test_double_release(self):
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        self.pool.release(conn)
+        self.pool.release(SyncConnection())
+        self.assertEqual(self.pool.idle, 1)
+        first, second = self.pool.acquire(), self.pool.acquire()
+        self.assertIsNot(first, second)
+        self.assertRaises(mysql_library.PoolTimeoutError, self.pool.acquire)
+
+    def test_dead_connection_replaced(self):
+        conn = self.pool.acquire()
+        conn.dead = True
+        self.pool.release(conn)
+        other = self.pool.acquire()
+        self.assertIsNot(other, conn)
+        self.assertTrue(conn.closed)
+        self.pool.release(other, discard=True)
+        self.assertTrue(other.closed)
+        self.assertEqual(self.pool.size, 0)
+
+    def test_concurrent_checkout(self):
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(100):
+                    with self.pool.connection(timeout=5):
+                        self.assertLessEqual(self.pool.size, 2)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(self.opened), 2)
+
+    def test_closed(self):
+        self.pool.close()
+        self.assertRaises(mysql_library.PoolClosedError, self.pool.acquire)
+
+
+class StreamCursor(object):
+    """
+    pymysql服务端游标的替身，按fetchmany的大小逐批返回count行
+    """
+    def __init__(self, count):
+        self.count = count
+        self.fetched = 0
+        self.closed = False
+        self.sql = None
+
+    def execute(self, sql):
+        self.sql = sql
+
+    def fetchmany(self, size):
+        rows = [(i,) for i in range(self.fetched, min(self.fetched + size, self.count))]
+        self.fetched += len(rows)
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class StreamConnection(object):
+    def __init__(self, cursorclass=pymysql.cursors.Cursor, count=2500):
+        self.cursorclass = cursorclass
+        self.count = count
+        self.cursors = []
+
+    def cursor(self, cursorclass=None):
+        cursor = StreamCursor(self.count)
+        cursor.cursorclass = cursorclass
+        self.cursors.append(cursor)
+        return cursor
+
+
+class SelectIterTest(unittest.TestCase):
+    def setUp(self):
+        self.library = mysql_library.MySQLLibrary()
+        self.library._db_obj = StreamConnection()
+
+    def test_rows(self):
+        rows = list(self.library.select_iter("SELECT * FROM t WHERE id>%s", 0))
+        cursor, = self.library._db_obj.cursors
+        self.assertEqual(rows, [(i,) for i in range(2500)])
+        self.assertEqual(cursor.sql, "SELECT * FROM t WHERE id>0")
+        self.assertIs(cursor.cursorclass, pymysql.cursors.SSCursor)
+        self.assertTrue(cursor.closed)
+
+    def test_batches(self):
+        batches = list(self.library.select_iter("SELECT * FROM t", batch_size=1000))
+        self.assertEqual([len(batch) for batch in batches], [1000, 1000, 500])
+
+    def test_dict_cursor(self):
+        self.library._db_obj = StreamConnection(pymysql.cursors.DictCursor)
+        list(self.library.select_iter("SELECT * FROM t"))
+        self.assertIs(self.library._db_obj.cursors[0].cursorclass, pymysql.cursors.SSDictCursor)
+
+    def test_early_close(self):
+        rows = self.library.select_iter("SELECT * FROM t", fetch_size=10)
+        self.assertEqual(next(rows), (0,))
+        rows.close()
+        cursor, = self.library._db_obj.cursors
+        self.assertTrue(cursor.closed)
+        self.assertEqual(cursor.fetched, 10)
+
+
+class RecordingCursor(pymysql.cursors.Cursor):
+    """
+    只记录语句不发送的pymysql游标
+    """
+    def _query(self, q):
+        sql = bytes(q).decode() if isinstance(q, (bytes, bytearray)) else q
+        self.connection.queries.append(sql)
+        self.rowcount = sql.count("),(") + 1
+        return self.rowcount
+
+
+class RecordingConnection(object):
+    encoding = "utf8"
+    charset = "utf8"
+
+    def __init__(self):
+        self.queries = []
+
+    def escape(self, obj, mapping=None):
+        if isinstance(obj, str):
+            return "'%s'" % pymysql.converters.escape_string(obj)
+        return pymysql.converters.escape_item(obj, self.charset, mapping=mapping)
+
+    def literal(self, obj):
+        return self.escape(obj)
+
+
+class InsertManyTest(unittest.TestCase):
+    def test_quote_identifier(self):
+        self.assertEqual(mysql_library.quote_identifier("db.t"), "`db`.`t`")
+        self.assertEqual(mysql_library.quote_identifier("a`b"), "`a``b`")
+
+    def test_insert_many_sql(self):
+        self.assertEqual(mysql_library.insert_many_sql("t", ["a", "b"]), "INSERT INTO `t` (`a`,`b`) VALUES (%s,%s)")
+        self.assertEqual(mysql_library.insert_many_sql("t", ["a", "b"], ["b"]),
+                         "INSERT INTO `t` (`a`,`b`) VALUES (%s,%s) ON DUPLICATE KEY UPDATE `b`=VALUES(`b`)")
+        self.assertTrue(mysql_library.insert_many_sql("t", ["a", "b"], True).endswith(
+            "`a`=VALUES(`a`),`b`=VALUES(`b`)"))
+        self.assertRaises(mysql_library.InputParamsError, mysql_library.insert_many_sql, "t", [])
+
+    def test_batches_within_packet(self):
+        library = mysql_library.MySQLLibrary()
+        conn = RecordingConnection()
+        library._db_obj = conn
+        library._cursor = RecordingCursor(conn)
+        rows = [(i, "name'%d" % i) for i in range(5000)]
+        count = library.insert_many("db.t", ["id", "name"], rows, update=["name"], max_packet=16384)
+        self.assertEqual(count, len(rows))
+        self.assertGreater(len(conn.queries), 1)
+        for query in conn.queries:
+            self.assertLessEqual(len(query.encode()), 16384 - mysql_library.PACKET_MARGIN)
+            self.assertTrue(query.startswith("INSERT INTO `db`.`t` (`id`,`name`) VALUES ("))
+            self.assertTrue(query.endswith("ON DUPLICATE KEY UPDATE `name`=VALUES(`name`)"))
+        self.assertIn("(1,'name\\'1')", conn.queries[0])
+        self.assertEqual(sum(query.count("),(") + 1 for query in conn.queries), len(rows))
+        self.assertEqual(library._cursor.max_stmt_length, pymysql.cursors.Cursor.max_stmt_length)
+
+
+class TableParseTest(unittest.TestCase):
+    def test_join_tables(self):
+        self.assertEqual(mysql_library.read_tables("SELECT * FROM a JOIN b ON a.id=b.id"), {"a", "b"})
+        self.assertEqual(mysql_library.read_tables("SELECT * FROM t1 JOIN t2 ON t1.x=t2.x, t3 WHERE 1"),
+                         {"t1", "t2", "t3"})
+        self.assertEqual(mysql_library.read_tables("SELECT * FROM `db`.`A` x LEFT JOIN b USING (id)"), {"a", "b"})
+
+    def test_unparsed_tables(self):
+        self.assertIsNone(mysql_library.read_tables("SELECT * FROM JSON_TABLE(x) j"))
+        self.assertIsNone(mysql_library.read_tables("SELECT * FROM t1, LATERAL (SELECT 1) x"))
+        cache = mysql_library.QueryCache()
+        key = cache.key("SELECT * FROM JSON_TABLE(x) j")
+        cache.put(key, ((1,),))
+        self.assertEqual(cache.get(key), (False, None))
+
+    def test_write_tables(self):
+        self.assertEqual(mysql_library.write_tables("INSERT INTO t (a, b) VALUES (1, 2)"), {"t"})
+        self.assertEqual(mysql_library.write_tables("UPDATE a, b SET a.x=b.x"), {"a", "b"})
+        self.assertEqual(mysql_library.write_tables("CALL p()"), set())
+
+    def test_locking_read_not_cached(self):
+        cache = mysql_library.QueryCache()
+        for sql in ("SELECT * FROM t WHERE id=1 FOR UPDATE", "SELECT * FROM t FOR SHARE",
+                    "SELECT * FROM t LOCK IN SHARE MODE"):
+            self.assertTrue(mysql_library.is_locking_read(sql))
+            key = cache.key(sql)
+            cache.put(key, ((1,),))
+            self.assertEqual(cache.get(key), (False, None))
+        self.assertFalse(mysql_library.is_locking_read("SELECT * FROM t WHERE name='for update'"))
+
+
+class MySQLDBTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.connections = []
+
+        async def connect(**kwargs):
+            conn = FakeConnection()
+            self.connections.append(conn)
+            return conn
+
+        patcher = mock.patch.object(aiomysql.pool, "connect", connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = await aiomysql.create_pool(minsize=1, maxsize=2)
+        mysql_library.MySQLDB.clear()
+        self.db = mysql_library.MySQLDB(pool=self.pool)
+
+    async def asyncTearDown(self):
+        await self.db.close()
+
+    async def test_select_reuses_connection(self):
+        await self.db.select("SELECT * FROM t WHERE id=%s", 1)
+        await self.db.select("SELECT * FROM t WHERE id=%s", 2)
+        self.assertEqual(len(self.connections), 1)
+        self.assertFalse(self.connections[0].closed)
+        self.assertEqual(len(self.connections[0].executed), 2)
+        self.assertEqual(self.db.pool_stats()["opened"], 1)
+
+    async def test_select_iter_reuses_connection(self):
+        rows = [row async for row in self.db.select_iter("SELECT * FROM t")]
+        await self.db.select("SELECT * FROM t WHERE id=1")
+        self.assertEqual(rows, [(1,), (2,)])
+        self.assertEqual(len(self.connections), 1)
+        self.assertFalse(self.connections[0].closed)
+
+    async def test_select_iter_batches(self):
+        batches = [batch async for batch in self.db.select_iter("SELECT * FROM t", batch_size=1)]
+        self.assertEqual(batches, [[(1,)], [(2,)]])
+
+    async def test_select_iter_early_stop(self):
+        rows = self.db.select_iter("SELECT * FROM t")
+        async for _ in rows:
+            break
+        await rows.aclose()
+        conn, = self.connections
+        self.assertFalse(conn.in_transaction)
+        await self.db.select("SELECT * FROM t WHERE id=1")
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.db.pool_stats()["in_use"], 0)
+
+    async def test_identical_selects_coalesced(self):
+        execute = FakeCursor.execute
+
+        async def slow_execute(cursor, sql):
+            await asyncio.sleep(0.01)
+            return await execute(cursor, sql)
+
+        with mock.patch.object(FakeCursor, "execute", slow_execute):
+            results = await asyncio.gather(*[self.db.select("SELECT * FROM t WHERE id=%s", 1) for _ in range(10)])
+            self.assertEqual(results, [((1,), (2,))] * 10)
+            self.assertEqual(sum(len(conn.executed) for conn in self.connections), 1)
+            self.assertEqual(self.db.coalesced, 9)
+            self.assertEqual(self.db._inflight, {})
+            await asyncio.gather(*[self.db.select("SELECT * FROM t WHERE id=1", coalesce=False) for _ in range(3)])
+            self.assertEqual(sum(len(conn.executed) for conn in self.connections), 4)
+
+    async def test_coalesced_caller_cancelled(self):
+        execute = FakeCursor.execute
+
+        async def slow_execute(cursor, sql):
+            await asyncio.sleep(0.02)
+            return await execute(cursor, sql)
+
+        with mock.patch.object(FakeCursor, "execute", slow_execute):
+            first = asyncio.ensure_future(self.db.select("SELECT * FROM t"))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(self.db.select("SELECT * FROM t"))
+            await asyncio.sleep(0.005)
+            first.cancel()
+            self.assertEqual(await second, ((1,), (2,)))
+            self.assertTrue(first.cancelled())
+
+    def test_without_pool(self):
+        db = mysql_library.MySQLDB()
+        self.assertIsNone(db.monitor)
+        self.assertEqual(db.pool_stats(), {})
+
+    async def test_adjust_without_max_limit(self):
+        monitor = mysql_library.PoolMonitor(self.pool)
+        monitor._period_waits, monitor._period_count = 1.0, 1
+        self.assertEqual(monitor.adjust(), (2, 3))
+
+    async def test_resize_wakes_waiters(self):
+        pool = await aiomysql.create_pool(minsize=1, maxsize=1)
+        self.addAsyncCleanup(pool.wait_closed)
+        self.addCleanup(pool.close)
+        monitor = mysql_library.PoolMonitor(pool, max_limit=2)
+        held = await pool.acquire()
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiter.done())
+        monitor._period_waits, monitor._period_count = 1.0, 1
+        self.assertEqual(monitor.adjust(), (2, 2))
+        try:
+            conn = await asyncio.wait_for(waiter, 1)
+        finally:
+            pool.release(held)
+        self.assertIsNot(conn, held)
+        pool.release(conn)
+
+    async def test_locking_select_bypasses_cache(self):
+        self.db.cache = mysql_library.QueryCache()
+        for _ in range(2):
+            await self.db.select("SELECT * FROM t WHERE id=1")
+            await self.db.select("SELECT * FROM t WHERE id=1 FOR UPDATE")
+        self.assertEqual(self.connections[0].executed, ["SELECT * FROM t WHERE id=1",
+                                                        "SELECT * FROM t WHERE id=1 FOR UPDATE",
+                                                        "SELECT * FROM t WHERE id=1 FOR UPDATE"])
+
+    async def test_locking_select_uses_primary(self):
+        replica = await aiomysql.create_pool(minsize=1, maxsize=2)
+        primary_conn, replica_conn = self.connections
+        mysql_library.MySQLDB.clear()
+        self.db = mysql_library.MySQLDB(pool=self.pool, replicas=[replica])
+        await self.db.select("SELECT * FROM t WHERE id=1")
+        await self.db.select("SELECT * FROM t WHERE id=1 FOR UPDATE")
+        self.assertEqual(replica_conn.executed, ["SELECT * FROM t WHERE id=1"])
+        self.assertEqual(primary_conn.executed, ["SELECT * FROM t WHERE id=1 FOR UPDATE"])
+
+    async def test_select_many_reports_cancelled_query(self):
+        select = self.db._select
+
+        async def cancel_second(sql, **kwargs):
+            if sql.endswith("2"):
+                raise asyncio.CancelledError()
+            return await select(sql, **kwargs)
+
+        with mock.patch.object(self.db, "_select", cancel_second):
+            with self.assertRaises(mysql_library.BatchQueryError) as cm:
+                await self.db.select_many([("SELECT * FROM t WHERE id=%s", (i,)) for i in range(3)])
+        self.assertEqual(list(cm.exception.errors), [2])
+        self.assertIsInstance(cm.exception.errors[2], asyncio.CancelledError)
+        self.assertIsNone(cm.exception.results[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
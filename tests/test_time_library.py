@@ -0,0 +1,512 @@
+import collections
+import datetime
+import os
+import time
+import unittest
+from unittest import mock
+
+from candy import time_library as tl
+
+# 进程时区为这些时区时与原来基于time模块的实现比较
+ZONES = ("Asia/Shanghai", "America/New_York", "Europe/London", "Australia/Sydney", "UTC")
+# 包含各时区夏令时切换的日期，以及闰日、年末等普通日期
+DAYS = ("2021-03-14", "2021-03-28", "2021-04-04", "2021-10-03", "2021-10-31", "2021-11-07",
+        "2020-02-29", "2016-05-09", "1999-12-31", "2037-12-31")
+STR_FORMATS = ('%Y-%m-%d', '%Y-%m', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S',
+               '%Y%m%d', '%Y%m%d%H', '%Y%m%d%H%M', '%Y%m%d%H%M%S')
+
+
+def set_process_tz(name):
+    if name is None:
+        os.environ.pop("TZ", None)
+    else:
+        os.environ["TZ"] = name
+    time.tzset()
+
+
+def legacy_str2int(s, fmt):
+    return int(time.mktime(time.strptime(s, fmt)))
+
+
+def legacy_day_start(value):
+    return legacy_str2int(time.strftime('%Y-%m-%d', time.localtime(value)), '%Y-%m-%d')
+
+
+def legacy_date_start(year, month, day):
+    return legacy_str2int(str(datetime.date(year, month, day)), '%Y-%m-%d')
+
+
+def legacy_start_end(value, time_type):
+    """
+    get_start_end_timestamp原来的计算方式，周的开始为本地周一0点
+    """
+    lt = time.localtime(value)
+    year, month = lt.tm_year, lt.tm_mon
+    if time_type == tl.HOUR:
+        start = legacy_str2int(time.strftime('%Y-%m-%d %H:00:00', lt), '%Y-%m-%d %H:%M:%S')
+        return start, start + tl.HOUR_STEP
+    if time_type == tl.DAY:
+        start = legacy_day_start(value)
+        return start, start + tl.DAY_STEP
+    if time_type == tl.WEEK:
+        monday = datetime.date(year, month, lt.tm_mday) - datetime.timedelta(days=lt.tm_wday)
+        sunday = monday + datetime.timedelta(days=7)
+        return (legacy_date_start(monday.year, monday.month, monday.day),
+                legacy_date_start(sunday.year, sunday.month, sunday.day))
+    size = {tl.MONTH: 1, tl.SEASON: 3, tl.YEAR: 12}[time_type]
+    first = {tl.MONTH: month, tl.SEASON: (month - 1) // 3 * 3 + 1, tl.YEAR: 1}[time_type]
+    index = year * 12 + first - 1 + size
+    return legacy_date_start(year, first, 1), legacy_date_start(index // 12, index % 12 + 1, 1)
+
+
+def legacy_same_period_month(value, months):
+    lt = time.localtime(value)
+    index = lt.tm_year * 12 + lt.tm_mon - 1 + months
+    year, month = index // 12, index % 12 + 1
+    day = min(lt.tm_mday, (datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)).day)
+    return legacy_date_start(year, month, day)
+
+
+def legacy_take_time_list(int_start, int_end, step, flag=True):
+    list_time = []
+    if int_start < int_end:
+        int_time = int_start
+        while int_time <= int_end:
+            list_time.append(int_time)
+            int_time += step
+            if not flag and int_time == int_end:
+                break
+    return list_time
+
+
+def legacy_timestamp_by_step(start_time, end_time, step=86400, check=True, point=200):
+    mo = start_time % tl.DAY_STEP
+    mo_2 = end_time % tl.DAY_STEP
+    if check:
+        start_time = start_time - mo
+        end_time = end_time - mo_2
+        start_time = start_time - start_time % step
+        end_more = end_time % step
+        if end_more > 0:
+            end_time = end_time + (step - end_more)
+        start_time = start_time + mo
+        end_time = end_time + mo_2
+    time_list = []
+    for _ in range(point):
+        if start_time > end_time:
+            break
+        time_list.append(start_time)
+        start_time = start_time + step
+    return time_list
+
+
+def legacy_int2iso(value):
+    t = datetime.datetime.fromtimestamp(value, datetime.timezone.utc).replace(tzinfo=None)
+    return t.isoformat() + ".000Z"
+
+
+def is_ambiguous(value):
+    """
+    本地时间的这个小时是否出现两次(夏令时结束)，此时mktime的结果与调用历史有关，不参与比较
+    """
+    hour = time.localtime(value)[:4]
+    return time.localtime(value - tl.HOUR_STEP)[:4] == hour or time.localtime(value + tl.HOUR_STEP)[:4] == hour
+
+
+def sample_timestamps():
+    """
+    当前进程时区下DAYS中每天前后各一天，约每46分钟一个点，去掉重复的小时
+    """
+    values = []
+    for day in DAYS:
+        start = legacy_str2int(day, '%Y-%m-%d')
+        values.extend(range(start - tl.DAY_STEP, start + 2 * tl.DAY_STEP, 2777))
+    return [v for v in values if not is_ambiguous(v)]
+
+
+class TimeRangeTest(unittest.TestCase):
+    def test_fractional_step(self):
+        self.assertEqual(tl.take_time_list(0, 3, 0.5), [0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0])
+        self.assertEqual(tl.take_time_list(0, 3, 0.5, flag=False), [0, 0.5, 1.0, 1.5, 2.0, 2.5])
+        self.assertEqual(tl.timestamp_by_step(0, 3, 0.5, check=False), [0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0])
+        time_range = tl.TimeRange(0, 3, 0.5)
+        self.assertEqual(len(time_range), 7)
+        self.assertIn(1.5, time_range)
+        self.assertNotIn(1.2, time_range)
+        self.assertEqual(time_range.index(2.5), 5)
+        self.assertEqual(list(time_range[1::2]), [0.5, 1.5, 2.5])
+
+    def test_invalid_step(self):
+        for step in (0, -1, -0.5):
+            self.assertRaises(ValueError, tl.take_time_list, 0, 3, step)
+            self.assertRaises(ValueError, tl.timestamp_by_step, 0, 3, step, False)
+            self.assertRaises(ValueError, tl.TimeRange, 0, 3, step)
+        self.assertRaises(ValueError, tl.TimeRange, 0, 10 ** 8, 1.5, "month")
+
+
+class TimeFormatterTest(unittest.TestCase):
+    def test_escaped_percent(self):
+        value = 3700000000
+        for fmt in ("%%Y%Y", "%%", "a%%d%d", "%%H%H", "%Y-%m-%d %H:%M:%S", "%Y%m%d"):
+            expected = time.strftime(fmt, time.localtime(value))
+            self.assertEqual(tl.int2str(value, fmt), expected)
+            self.assertEqual(tl.int2str(value, fmt), expected)
+
+
+class IsoTimeZoneTest(unittest.TestCase):
+    values = [
+        "2021-06-01T12:00:00",
+        "2021-11-07T01:30:00",
+        "2021-03-14T02:30:00.250",
+        "2021-06-01T12:00:00Z",
+        "2021-06-01T12:00:00+02:00",
+        "2021-06-01",
+    ]
+    expected = [1622563200, 1636263000, 1615707000, 1622548800, 1622541600, 1622520000]
+
+    def test_naive_in_zone(self):
+        self.assertEqual([tl.iso2timestamp(s, tz="America/New_York") for s in self.values], self.expected)
+        self.assertEqual(tl.iso2str("2021-06-01T12:00:00", tz="America/New_York"), "2021-06-01 12:00:00")
+        self.assertEqual(tl.iso2str("2021-06-01T12:00:00Z", tz="America/New_York"), "2021-06-01 08:00:00")
+        self.assertEqual(tl.iso2timestamp("2021-06-01T12:00:00", tz="UTC"), 1622548800)
+
+    @unittest.skipIf(tl.np is None, "numpy is not installed")
+    def test_many_in_zone(self):
+        self.assertEqual(list(tl.iso2timestamp_many(self.values, tz="America/New_York")), self.expected)
+        self.assertEqual(list(tl.iso2timestamp_many(self.values[:2], tz="America/New_York")), self.expected[:2])
+
+    def test_unknown_zone(self):
+        self.assertRaises(tl.TimeZoneError, tl.iso2timestamp, "2021-06-01T12:00:00", tz="Nope/Zone")
+        self.assertRaises(tl.TimeZoneError, tl.iso2timestamp_many, ["2021-06-01T12:00:00"], tz="Nope/Zone")
+
+
+class ProcessTimeZoneMixin(object):
+    """
+    测试期间切换进程时区，结束后恢复
+    """
+    process_tz = "America/New_York"
+
+    def setUp(self):
+        self._saved_tz = os.environ.get("TZ")
+        set_process_tz(self.process_tz)
+
+    def tearDown(self):
+        set_process_tz(self._saved_tz)
+
+
+class BucketStartsTest(ProcessTimeZoneMixin, unittest.TestCase):
+    # 2021-11-07 00:00 EDT，当天01:00-02:00重复一次
+    fall_back = 1636257600
+
+    @unittest.skipIf(tl.np is None, "numpy is not installed")
+    def test_fall_back_day_matches_scalar(self):
+        ts = list(range(self.fall_back - 86400, self.fall_back + 2 * 86400, 600))
+        ts = ts[::-1] + ts
+        for tz in (None, "America/New_York"):
+            for time_type in (tl.HOUR, tl.DAY, tl.WEEK, tl.MONTH, tl.SEASON, tl.YEAR):
+                many = tl.bucket_starts_many(ts, time_type, tz)
+                scalar = [tl._bucket_start(v, time_type, tz) for v in ts]
+                self.assertEqual(list(many), scalar, (tz, time_type))
+
+
+class LegacySemanticsTest(ProcessTimeZoneMixin, unittest.TestCase):
+    """
+    与原来基于time.strptime/mktime/strftime的实现逐个比较
+    """
+
+    def test_str2int(self):
+        for zone in ZONES:
+            set_process_tz(zone)
+            for value in sample_timestamps():
+                for fmt in STR_FORMATS:
+                    s = time.strftime(fmt, time.localtime(value))
+                    self.assertEqual(tl.str2int(s), legacy_str2int(s, fmt), s)
+                    self.assertEqual(tl.time_format_string(s), fmt)
+                s = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(value))
+                self.assertEqual(tl.utc_datetime2timestamp(s + ".000Z"),
+                                 legacy_str2int(s, '%Y-%m-%dT%H:%M:%S') - time.timezone)
+
+    def test_int2(self):
+        for zone in ZONES:
+            set_process_tz(zone)
+            for value in sample_timestamps():
+                lt = time.localtime(value)
+                self.assertEqual(tl.int2str(value), time.strftime('%Y-%m-%d %H:%M:%S', lt))
+                self.assertEqual(tl.int2str(value + 0.5, '%Y%m%d %H %p %j'), time.strftime('%Y%m%d %H %p %j', lt))
+                self.assertEqual(tl.int2day(value), time.strftime('%Y-%m-%d', lt))
+                self.assertEqual(tl.int2day(value, days=1, fmt='/'),
+                                 time.strftime('%Y/%m/%d', time.localtime(value + tl.DAY_STEP)))
+                self.assertEqual(tl.int2dayint(value), int(time.strftime('%Y%m%d', lt)))
+                self.assertEqual(tl.int2iso(value), legacy_int2iso(value))
+                self.assertEqual(tl.int2iso(value, '', False),
+                                 datetime.datetime.fromtimestamp(value).isoformat() + ".000")
+                self.assertEqual((tl.get_year(value), tl.get_month(value), tl.get_day(value), tl.get_hour(value)),
+                                 (lt.tm_year, lt.tm_mon, lt.tm_mday, lt.tm_hour))
+                self.assertEqual(tl.get_week(value), int(time.strftime('%w', lt)))
+                self.assertEqual(tl.get_year_month_day(value), time.strftime('%Y-%m-%d', lt))
+
+    def test_decompose(self):
+        for zone in ZONES:
+            set_process_tz(zone)
+            for value in sample_timestamps():
+                lt = time.localtime(value)
+                parts = tl.decompose(value)
+                self.assertEqual((parts.year, parts.month, parts.day, parts.hour, parts.minute, parts.second),
+                                 tuple(lt[:6]))
+                self.assertEqual(parts.week, int(time.strftime('%w', lt)))
+                self.assertEqual(parts.season, (lt.tm_mon - 1) // 3 + 1)
+                self.assertEqual(parts.day_start, legacy_day_start(value))
+                self.assertEqual(tl.get_start_timestamp(value), legacy_day_start(value))
+
+    @unittest.skipIf(tl.zoneinfo is None, "zoneinfo is not available")
+    def test_decompose_tz(self):
+        set_process_tz("Asia/Shanghai")
+        for zone in ZONES:
+            info = tl.zoneinfo.ZoneInfo(zone)
+            for value in range(1615600000, 1615900000, 1800):
+                dt = datetime.datetime.fromtimestamp(value, info)
+                parts = tl.decompose(value, zone)
+                self.assertEqual((parts.year, parts.month, parts.day, parts.hour, parts.minute, parts.second),
+                                 dt.timetuple()[:6])
+                self.assertEqual(parts.week, dt.isoweekday() % 7)
+                self.assertEqual(parts.day_start, int(dt.replace(hour=0, minute=0, second=0).timestamp()))
+                self.assertEqual(tl.int2str(value, tz=zone), dt.strftime('%Y-%m-%d %H:%M:%S'))
+
+    def test_period_helpers(self):
+        for zone in ZONES:
+            set_process_tz(zone)
+            values = sample_timestamps()
+            for value in values:
+                for time_type in (tl.HOUR, tl.DAY, tl.WEEK, tl.MONTH, tl.SEASON, tl.YEAR):
+                    self.assertEqual(tl.get_start_end_timestamp(value, time_type),
+                                     legacy_start_end(value, time_type), (value, time_type))
+            for day in DAYS:
+                # 从当地0点开始按天取点，跨过夏令时切换时不会漏掉某一天
+                midnight = legacy_str2int(day, '%Y-%m-%d')
+                points = legacy_take_time_list(midnight - 3 * tl.DAY_STEP, midnight + 3 * tl.DAY_STEP, tl.DAY_STEP)
+                self.assertEqual(set(tl.get_period_gen(points[0], points[-1], tl.DAY)),
+                                 set(legacy_start_end(v, tl.DAY) for v in points))
+                start = midnight - 40 * tl.DAY_STEP
+                end = start + 100 * tl.DAY_STEP + 7200
+                points = legacy_take_time_list(start, end, tl.DAY_STEP)
+                weeks = set(legacy_start_end(v, tl.WEEK) for v in points)
+                months = set(legacy_start_end(v, tl.MONTH) for v in points)
+                self.assertEqual(tl.get_week_period(start, end, flag=True), weeks)
+                self.assertEqual(tl.get_month_period(start, end, flag=True), months)
+                self.assertEqual(tl.get_week_month_period(start, end), (weeks, months))
+                for months_delta in (-13, -1, 1, 3, 12):
+                    self.assertEqual(tl.same_period_month(start, months_delta),
+                                     legacy_same_period_month(start, months_delta))
+                self.assertEqual(tl.get_month_list(start, end),
+                                 sorted(set(legacy_start_end(v, tl.MONTH)[0] for v in points + [end])))
+                self.assertEqual(tl.get_week_list(start, end),
+                                 [v for v in points if time.localtime(v).tm_wday == 0])
+                self.assertEqual(tl.get_yearlist(start, end),
+                                 list(range(time.localtime(start).tm_year, time.localtime(end).tm_year + 1)))
+
+    def test_time_range(self):
+        for zone in ZONES:
+            set_process_tz(zone)
+            for day in DAYS:
+                start = legacy_str2int(day, '%Y-%m-%d')
+                for step, span in ((tl.DAY_STEP, 30 * tl.DAY_STEP), (tl.HOUR_STEP, tl.DAY_STEP), (7, 100)):
+                    for end in (start + span, start + span - 1):
+                        for flag in (True, False):
+                            expected = legacy_take_time_list(start, end, step, flag)
+                            self.assertEqual(tl.take_time_list(start, end, step, flag), expected)
+                        expected = legacy_take_time_list(start, end, step)
+                        time_range = tl.TimeRange(start, end, step)
+                        self.assertEqual(list(time_range), expected)
+                        self.assertEqual(len(time_range), len(expected))
+                        self.assertEqual(list(reversed(time_range)), expected[::-1])
+                        self.assertEqual(time_range[3], expected[3])
+                        self.assertEqual(time_range.index(expected[-1]), len(expected) - 1)
+                        self.assertNotIn(start + 1, time_range)
+                for args in ((start, start + 3 * tl.DAY_STEP), (start + 100, start + 7300, tl.HOUR_STEP),
+                             (start + 100, start + 7300, 900, False), (start, start + 300 * tl.DAY_STEP)):
+                    self.assertEqual(tl.timestamp_by_step(*args, point=200), legacy_timestamp_by_step(*args))
+
+    def test_druid_intervals(self):
+        for zone in ZONES:
+            set_process_tz(zone)
+            for day, tp, step in (("2021-11-06", "day", tl.DAY_STEP), ("2021-03-14", "hour", tl.HOUR_STEP)):
+                start = legacy_str2int(day, '%Y-%m-%d')
+                end_str = time.strftime('%Y-%m-%d', time.localtime(start + 3 * tl.DAY_STEP))
+                end = legacy_str2int(end_str, '%Y-%m-%d')
+                expected = ["%s/%s" % (legacy_int2iso(v), legacy_int2iso(v + step))
+                            for v in range(start, end, step)]
+                self.assertEqual(tl.druid_time(day, end_str, tp), expected)
+                self.assertEqual(tl.druid_time(day, end_str, tp, "one"),
+                                 "%s/%s" % (legacy_int2iso(start), legacy_int2iso(end)))
+                self.assertEqual(tl.druid_time(day, day, tp), expected[:1])
+                planner = tl.DruidIntervalPlanner(start, end, tp)
+                self.assertEqual(len(planner), len(expected))
+                self.assertEqual(list(planner.intervals()), expected)
+                chunks = list(planner.chunks(4))
+                self.assertEqual(chunks[0].split("/")[0], expected[0].split("/")[0])
+                self.assertEqual(chunks[-1].split("/")[1], expected[-1].split("/")[1])
+                self.assertEqual(list(planner.merged([start, start + 1, start + 2 * step, end])),
+                                 [expected[0], expected[2]])
+
+    def test_business_calendar(self):
+        holidays = ("2021-10-01", "2021-10-04", "2021-11-08")
+        workdays = ("2021-10-09",)
+        first = datetime.date(2021, 9, 20)
+        dates = [first + datetime.timedelta(days=i) for i in range(70)]
+
+        def is_business(date):
+            if str(date) in workdays:
+                return True
+            return str(date) not in holidays and date.isoweekday() % 7 not in (6, 0)
+
+        business = [d for d in dates if is_business(d)]
+        for zone in ZONES:
+            set_process_tz(zone)
+            for tz in (None, zone) if tl.zoneinfo is not None else (None,):
+                calendar = tl.BusinessCalendar(holidays, workdays=workdays, tz=tz)
+                for date in dates:
+                    # 当天中午
+                    noon = datetime.datetime(date.year, date.month, date.day, 12)
+                    value = int(noon.timestamp() if tz is None else
+                                noon.replace(tzinfo=tl.zoneinfo.ZoneInfo(tz)).timestamp())
+                    self.assertEqual(calendar.is_business_day(value), is_business(date), (tz, date))
+                    self.assertEqual(calendar.is_business_day(str(date)), is_business(date))
+                    between = len([d for d in business if date <= d < dates[-1]])
+                    self.assertEqual(calendar.business_days_between(date, dates[-1]), between)
+                    if date < business[-10]:
+                        start = min(i for i, d in enumerate(business) if d >= date)
+                        self.assertEqual(calendar.add_business_days(date, 5), business[start + 5])
+                        moved = calendar.add_business_days(value, 5)
+                        self.assertEqual(tl.int2str(moved, '%Y-%m-%d %H', tz), "%s 12" % business[start + 5])
+
+    def test_bucket_aggregator(self):
+        for zone in ZONES:
+            set_process_tz(zone)
+            values = sample_timestamps()
+            weights = [v % 7 for v in values]
+            for time_type in (tl.HOUR, tl.DAY, tl.WEEK, tl.MONTH, tl.SEASON, tl.YEAR):
+                starts = [legacy_start_end(v, time_type)[0] for v in values]
+                counts = collections.Counter(starts)
+                sums = collections.defaultdict(int)
+                for start, weight in zip(starts, weights):
+                    sums[start] += weight
+                aggregator = tl.TimeBucketAggregator(time_type, 1)
+                half = len(values) // 2
+                aggregator.add(values[:half], weights[:half])
+                aggregator.add(values[half:], weights[half:])
+                result_starts, result_counts, (result_sums,) = aggregator.result()
+                self.assertEqual(list(result_starts), sorted(counts))
+                self.assertEqual(list(result_counts), [counts[k] for k in sorted(counts)])
+                self.assertEqual(list(result_sums), [sums[k] for k in sorted(counts)])
+
+
+@unittest.skipIf(tl.np is None, "numpy is not installed")
+class ManyConvertersTest(ProcessTimeZoneMixin, unittest.TestCase):
+    """
+    批量接口与逐个调用单值函数的结果一致
+    """
+
+    def values(self):
+        # 1970年前后和闰秒附近的时间
+        return sample_timestamps() + [1, 86399, -86400 * 365 * 30 + 7, 68169600]
+
+    def inputs(self, values):
+        """
+        同一组时间戳的list、int64数组、float64数组和datetime64数组
+        """
+        np = tl.np
+        return (values, np.array(values, dtype=np.int64), np.array(values, dtype=np.float64),
+                np.array(values, dtype='datetime64[s]'))
+
+    def test_int2_many(self):
+        for zone in ZONES:
+            set_process_tz(zone)
+            values = self.values()
+            # 四位数年份以外的时间逐个交给int2str
+            far = values + [253402300800 + 5, -62135596800 + 5]
+            for fmt in ('%Y-%m-%d %H:%M:%S', '%Y%m%d', '%Y/%m/%d %H', '%H:%M', '%a %j %%Y', '%c'):
+                expected = [tl.int2str(v, fmt) for v in far]
+                for arr in self.inputs(far):
+                    self.assertEqual(list(tl.int2str_many(arr, fmt)), expected, (zone, fmt, arr.__class__))
+            for arr in self.inputs(values):
+                self.assertEqual(list(tl.int2day_many(arr, days=1, fmt='/')),
+                                 [tl.int2day(v, days=1, fmt='/') for v in values])
+                self.assertEqual(list(tl.int2dayint_many(arr)), [tl.int2dayint(v) for v in values])
+                for z in ('Z', ''):
+                    for convert in (True, False):
+                        self.assertEqual(list(tl.int2iso_many(arr, z, convert)),
+                                         [tl.int2iso(v, z, convert) for v in values])
+            # 带小数的时间戳逐个交给单值函数
+            fractions = [v + 0.25 for v in values[:50]]
+            self.assertEqual(list(tl.int2str_many(fractions)), [tl.int2str(v) for v in fractions])
+            self.assertEqual(list(tl.int2iso_many(fractions)), [tl.int2iso(v) for v in fractions])
+
+    @unittest.skipIf(tl.zoneinfo is None, "zoneinfo is not available")
+    def test_int2_many_tz(self):
+        set_process_tz("Asia/Shanghai")
+        values = list(range(1615600000, 1616000000, 1711)) + list(range(1636200000, 1636400000, 1711))
+        for zone in ZONES:
+            for arr in self.inputs(values):
+                self.assertEqual(list(tl.int2str_many(arr, tz=zone)), [tl.int2str(v, tz=zone) for v in values])
+                self.assertEqual(list(tl.int2dayint_many(arr, tz=zone)), [tl.int2dayint(v, tz=zone) for v in values])
+            self.assertEqual(list(tl.str2int_many([tl.int2str(v, tz=zone) for v in values], tz=zone)),
+                             [tl.str2int(tl.int2str(v, tz=zone), tz=zone) for v in values])
+
+    def test_str2int_many(self):
+        np = tl.np
+        for zone in ZONES:
+            set_process_tz(zone)
+            for fmt in STR_FORMATS:
+                strings = [time.strftime(fmt, time.localtime(v)) for v in sample_timestamps()]
+                expected = [tl.str2int(s) for s in strings]
+                for arr in (strings, np.array(strings), np.array(strings, dtype='S')):
+                    self.assertEqual(list(tl.str2int_many(arr)), expected, (zone, fmt))
+            mixed = ["2021-03-14", "2021-11-07 12:30", "20211107", "2021-10", "2016-05-09 20:38:22"]
+            self.assertEqual(list(tl.str2int_many(mixed)), [tl.str2int(s) for s in mixed])
+            # datetime64按本地时间处理
+            local = np.array(["2021-03-14T12:00:00", "2021-11-07T00:00:00"], dtype="datetime64[s]")
+            self.assertEqual(list(tl.str2int_many(local)),
+                             [tl.str2int("2021-03-14 12:00:00"), tl.str2int("2021-11-07")])
+
+    def test_str2int_many_fallback(self):
+        # 含非ASCII字符时逐个交给str2int
+        strings = ["２０２１-01-01", "2021-01-02"]
+        self.assertEqual(list(tl.str2int_many(strings)), [tl.str2int(s) for s in strings])
+        for bad in ("2021-13-01", "abc", "2021-02-29"):
+            self.assertRaises(tl.TimeFormatError, tl.str2int, bad)
+            self.assertRaises(tl.TimeFormatError, tl.str2int_many, ["2021-01-01", bad])
+
+    def test_iso2timestamp_many(self):
+        for zone in ZONES:
+            set_process_tz(zone)
+            isos = []
+            for i, value in enumerate(sample_timestamps()):
+                head = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(value))
+                isos.append(head + ('Z', '.123456Z', '+08:00', '', '.5', '-0530', '+02')[i % 7])
+            isos += ['', '2016-05-09', '2016-05-09 20:38:22', '2016-05-09T20:38']
+            for h in (8, 0, -5):
+                expected = [tl.iso2timestamp(s, h) for s in isos]
+                for arr in (isos, tl.np.array(isos)):
+                    self.assertEqual(list(tl.iso2timestamp_many(arr, h)), expected, (zone, h))
+            if tl.zoneinfo is not None:
+                self.assertEqual(list(tl.iso2timestamp_many(isos, tz=zone)),
+                                 [tl.iso2timestamp(s, tz=zone) for s in isos])
+            for bad in ("2016-05-09T20:38:60Z", "x", "2016-05-09T20:38:22+25:00"):
+                self.assertRaises(tl.TimeFormatError, tl.iso2timestamp_many, [isos[0], bad])
+
+    def test_without_numpy(self):
+        values = [1462797502, 1636263000]
+        strings = ["2016-05-09 20:38:22", "2021-11-07"]
+        with mock.patch.object(tl, "np", None):
+            self.assertEqual(tl.int2str_many(values), [tl.int2str(v) for v in values])
+            self.assertEqual(tl.int2day_many(values), [tl.int2day(v) for v in values])
+            self.assertEqual(tl.int2dayint_many(values), [tl.int2dayint(v) for v in values])
+            self.assertEqual(tl.int2iso_many(values), [tl.int2iso(v) for v in values])
+            self.assertEqual(tl.str2int_many(strings), [tl.str2int(s) for s in strings])
+            self.assertEqual(tl.iso2timestamp_many(["2016-05-09T20:38:22Z"]),
+                             [tl.iso2timestamp("2016-05-09T20:38:22Z")])
+            self.assertEqual(tl.bucket_starts_many(values, tl.DAY), [tl.get_start_timestamp(v) for v in values])
+
+
+if __name__ == '__main__':
+    unittest.main()